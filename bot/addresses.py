@@ -0,0 +1,30 @@
+import re
+
+
+# Нормализация адресов для сравнения: «пр. Рудаки, 12» и «Рудаки проспект 12 кв 5»
+# дают один ключ. Номера домов и квартир, служебные слова и порядок слов не учитываются,
+# таджикские буквы приводятся к русским (ӯ -> у, ҳ -> х и т.д.).
+
+STOP_WORDS = frozenset({
+    'г', 'город', 'ш', 'шахр', 'р', 'район', 'н', 'нохия',
+    'ул', 'улица', 'куча', 'кучаи', 'хиебон', 'хиебони', 'пр', 'пр-т', 'просп', 'проспект', 'пер', 'переулок',
+    'д', 'дом', 'к', 'корп', 'корпус', 'кв', 'квартира', 'под', 'подъезд', 'эт', 'этаж',
+    'мкр', 'микрорайон', 'напротив', 'возле', 'около', 'рядом',
+})
+
+_FOLD = str.maketrans({'ё': 'е', 'ӣ': 'и', 'ӯ': 'у', 'ҳ': 'х', 'қ': 'к', 'ғ': 'г', 'ҷ': 'ч'})
+
+_TOKEN_RE = re.compile(r"[^\W\d_]+(?:-[^\W\d_]+)*")
+# Номер микрорайона значим в отличие от номера дома: «34 мкр», «мкр. 34», «34-й микрорайон»
+_DISTRICT_RE = re.compile(r"(\d+)(?:-?[а-я]{1,2})?\s*(?:мкр|микрорайон)|(?:мкр|микрорайон)\.?\s*(\d+)")
+
+
+def address_tokens(address):
+    text = (address or '').lower().translate(_FOLD)
+    districts = [f"{before or after}мкр" for before, after in _DISTRICT_RE.findall(text)]
+    return [token for token in _TOKEN_RE.findall(text) if token not in STOP_WORDS and len(token) > 1] + districts
+
+
+def normalize_address(address):
+    """Адрес -> ключ для группировки: значимые слова без повторов в алфавитном порядке"""
+    return ' '.join(sorted(set(address_tokens(address))))
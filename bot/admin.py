@@ -1,8 +1,18 @@
 from django.contrib import admin
+from django.db import transaction
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User, Group
-from .models import Order
-from django.utils.html import format_html
+from .models import ArchivedOrder, Order
+from .notifications import set_status_and_notify
+from . import images
+from .sla import timeline
+from .rollups import dashboard_data
+from .search import is_supported, search_orders
+from .admin_pagination import EstimatedCountPaginator, KeysetChangeList
+from django.utils.html import format_html, format_html_join
 from django.contrib.admin import DateFieldListFilter
 
 # Отмена регистрации стандартных моделей
@@ -37,8 +47,14 @@ class OrderAdmin(admin.ModelAdmin):
         ('created_at', DateFieldListFilter),
     )
     search_fields = ('id', 'user_id', 'from_address', 'to_address', 'phone', 'client_feedback')
-    readonly_fields = ('created_at', 'updated_at', 'photo_preview', 'client_link_display', 'feedback_preview')
+    readonly_fields = (
+        'created_at', 'updated_at', 'photo_preview', 'client_link_display', 'feedback_preview', 'status_timeline'
+    )
     list_per_page = 20
+    # На больших таблицах: оценка числа строк вместо COUNT(*) и навигация по ключу вместо OFFSET
+    ordering = ('-created_at', '-id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     actions = ['mark_as_delivered', 'mark_as_paid']
 
     fieldsets = (
@@ -55,10 +71,49 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('client_score', 'feedback_preview')  # Изменено на метод
         }),
         ('Даты', {
-            'fields': ('created_at', 'updated_at')
+            'fields': ('created_at', 'updated_at', 'status_timeline')
         }),
     )
 
+    def get_urls(self):
+        return [
+            path('dashboard/', self.admin_site.admin_view(self.dashboard_view), name='bot_order_dashboard'),
+        ] + super().get_urls()
+
+    def dashboard_view(self, request):
+        # Панель читает только дневные сводки (команда update_rollups), не таблицу заказов
+        period_options = (7, 30, 90)
+        try:
+            period = int(request.GET.get('days', 30))
+        except ValueError:
+            period = 30
+        period = period if period in period_options else 30
+        context = {
+            **self.admin_site.each_context(request),
+            **dashboard_data(days=period),
+            'opts': self.model._meta,
+            'title': 'Аналитика заказов',
+            'period': period,
+            'period_options': period_options,
+        }
+        return TemplateResponse(request, 'admin/bot/order/dashboard.html', context)
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        # Закрытый заказ мог уйти в архив — открываем его там
+        if (object_id.isdigit() and not Order.objects.filter(pk=object_id).exists()
+                and ArchivedOrder.objects.filter(pk=object_id).exists()):
+            return redirect('admin:bot_archivedorder_change', object_id)
+        return super().change_view(request, object_id, form_url, extra_context)
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        # На Postgres — поиск по триграммным и полнотекстовым индексам вместо icontains по всем полям
+        if search_term.strip() and is_supported(queryset):
+            return search_orders(queryset, search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
     # Метод для отображения client_link
     def client_link_display(self, obj):
         if obj.client_link:
@@ -131,15 +186,32 @@ class OrderAdmin(admin.ModelAdmin):
         return obj.to_address[:30] + '...' if len(obj.to_address) > 30 else obj.to_address
     to_address_short.short_description = 'Куда'
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'photo' in form.changed_data and obj.photo:
+            transaction.on_commit(lambda: images.schedule([obj.pk], force=True))
+
     def photo_preview(self, obj):
+        # Миниатюра со ссылкой на WebP-копию; оригинал — пока производные не готовы
         if obj.photo:
             return format_html(
-                '<img src="{}" style="max-height: 200px; max-width: 200px;" />',
-                obj.photo.url
+                '<a href="{}" target="_blank"><img src="{}" style="max-height: 200px; max-width: 200px;" /></a>',
+                (obj.photo_web or obj.photo).url,
+                (obj.photo_thumb or obj.photo).url
             )
         return "-"
     photo_preview.short_description = 'Фото посылки'
 
+    def status_timeline(self, obj):
+        events = timeline(obj.id) if obj.id else []
+        if not events:
+            return "-"
+        return format_html_join(
+            '', '<div>{} — {}</div>',
+            ((ts.strftime("%Y-%m-%d %H:%M:%S"), status) for status, ts in events)
+        )
+    status_timeline.short_description = 'История статусов'
+
     def client_score_display(self, obj):
         if obj.client_score:
             return format_html(
@@ -149,10 +221,42 @@ class OrderAdmin(admin.ModelAdmin):
         return "-"
     client_score_display.short_description = 'Оценка'
 
+    def _set_status(self, request, queryset, status):
+        # Уведомления отправит бот в фоне, действие не ждет Telegram
+        orders, queued = set_status_and_notify(queryset, status)
+        self.message_user(request, f"Обновлено заказов: {orders}, уведомлений в очереди: {queued}")
+
     def mark_as_delivered(self, request, queryset):
-        queryset.update(status='delivered')
+        self._set_status(request, queryset, 'delivered')
     mark_as_delivered.short_description = "Отметить как доставленные"
 
     def mark_as_paid(self, request, queryset):
-        queryset.update(status='paid')
-    mark_as_paid.short_description = "Отметить как оплаченные"
\ No newline at end of file
+        self._set_status(request, queryset, 'paid')
+    mark_as_paid.short_description = "Отметить как оплаченные"
+
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(OrderAdmin):
+    """Архив закрытых заказов — только просмотр"""
+    actions = None
+    readonly_fields = OrderAdmin.readonly_fields + ('archived_at',)
+    fieldsets = OrderAdmin.fieldsets + (
+        ('Архив', {
+            'fields': ('archived_at',)
+        }),
+    )
+
+    def get_urls(self):
+        return admin.ModelAdmin.get_urls(self)
+
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        return admin.ModelAdmin.change_view(self, request, object_id, form_url, extra_context)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,129 @@
+import base64
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.admin.views.main import ALL_VAR, ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+CURSOR_VAR = 'cursor'
+
+
+def estimate_count(queryset):
+    """
+    Оценка числа строк от планировщика Postgres (None на других СУБД или без статистики).
+    Без фильтров берется pg_class.reltuples, с фильтрами — Plan Rows из EXPLAIN.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator, который на больших выборках не делает COUNT(*), а берет оценку планировщика"""
+
+    @cached_property
+    def count(self):
+        threshold = getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000)
+        estimate = estimate_count(self.object_list)
+        self.estimated = estimate is not None and estimate >= threshold
+        if self.estimated:
+            return estimate
+        return super().count
+
+
+def encode_cursor(direction, order):
+    raw = f"{direction}|{order.created_at.isoformat()}|{order.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(value):
+    try:
+        direction, created_at, pk = base64.urlsafe_b64decode(value.encode()).decode().split('|')
+        if direction not in ('after', 'before'):
+            raise ValueError(direction)
+        return direction, datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Список заказов в админке с навигацией по ключу (created_at, id) вместо OFFSET.
+    Работает при сортировке по умолчанию; при сортировке по другой колонке — обычные страницы.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = decode_cursor(request.GET.get(CURSOR_VAR, ''))
+        self.keyset_mode = ORDER_VAR not in request.GET and ALL_VAR not in request.GET
+        super().__init__(request, *args, **kwargs)
+        # Ссылки фильтров и сортировки не должны сохранять курсор
+        self.params.pop(CURSOR_VAR, None)
+        self.filter_params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        if not self.keyset_mode:
+            return super().get_results(request)
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        queryset = self.queryset
+        reverse = False
+        if self.cursor is not None:
+            direction, created_at, pk = self.cursor
+            if direction == 'after':
+                queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+            else:
+                reverse = True
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+                ).order_by('created_at', 'pk')
+
+        rows = list(queryset[:self.list_per_page + 1])
+        has_more = len(rows) > self.list_per_page
+        rows = rows[:self.list_per_page]
+        if reverse:
+            rows.reverse()
+
+        has_older = has_more if not reverse else True
+        has_newer = self.cursor is not None and (has_more if reverse else True)
+        self.next_cursor_url = (
+            self.get_query_string({CURSOR_VAR: encode_cursor('after', rows[-1])}, [PAGE_VAR])
+            if rows and has_older else None
+        )
+        self.prev_cursor_url = (
+            self.get_query_string({CURSOR_VAR: encode_cursor('before', rows[0])}, [PAGE_VAR])
+            if rows and has_newer else None
+        )
+
+        self.result_count = paginator.count
+        self.count_estimated = getattr(paginator, 'estimated', False)
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = self.next_cursor_url is not None or self.prev_cursor_url is not None
+        self.paginator = paginator
@@ -0,0 +1,130 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+
+from .models import Order
+from .signals import orders_updated
+
+
+# Счетчик изменений таблицы заказов хранится в кэше Django. Каждое сохранение заказа
+# (save(), QuerySet.update(), действия админки) увеличивает его, и все ETag и закэшированные
+# ответы API становятся недействительными. Бот работает в отдельном процессе, поэтому
+# для согласованности нужен общий кэш (CACHES с Redis), а не LocMemCache.
+
+VERSION_KEY = 'orders:version'
+MODIFIED_KEY = 'orders:last_modified'
+RESPONSE_TTL = 300
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # После очистки кэша начинаем с текущего времени, чтобы не повторить старые ETag
+        cache.add(VERSION_KEY, int(time.time() * 1000))
+        cache.add(MODIFIED_KEY, int(time.time()))
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_last_modified():
+    return cache.get(MODIFIED_KEY) or int(time.time())
+
+
+def bump_version():
+    cache.set(MODIFIED_KEY, int(time.time()))
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_version()
+
+
+def _on_change(sender, **kwargs):
+    # После коммита, чтобы параллельный запрос не закэшировал старые данные под новой версией
+    transaction.on_commit(bump_version)
+
+
+# Кэши, которые живут в одном процессе: счетчик из них другие процессы не увидят
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def check_shared_cache(app_configs, **kwargs):
+    """Без общего кэша админка и бот не сбрасывают ETag API друг другу — в продакшене нужен Redis"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if settings.DEBUG or backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [checks.Error(
+        'Счетчик изменений заказов хранится в кэше процесса, API будет отдавать устаревшие ответы',
+        hint='Укажите REDIS_URL (общий кэш для бота и веб-процессов)',
+        id='bot.E001',
+    )]
+
+
+def connect_signals():
+    post_save.connect(_on_change, sender=Order, dispatch_uid='orders_api_cache_save')
+    post_delete.connect(_on_change, sender=Order, dispatch_uid='orders_api_cache_delete')
+    orders_updated.connect(_on_change, sender=Order, dispatch_uid='orders_api_cache_update')
+
+
+class ConditionalCacheMixin:
+    """
+    ETag/Last-Modified и кэш готовых ответов для list/retrieve.
+    Неизмененный опрос отвечает 304 (или ответом из кэша), не обращаясь к БД.
+    """
+
+    cache_actions = ('list', 'retrieve')
+
+    def _cache_key(self, request, version):
+        # Ответ зависит от пути с параметрами и от формата (JSON / browsable API)
+        raw = f"{version}|{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}"
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def _conditional(self, request, handler, *args, **kwargs):
+        version = get_version()
+        key = self._cache_key(request, version)
+        etag = f'"{key}"'
+        last_modified = get_last_modified()
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            not_modified = etag in parse_etags(if_none_match) or if_none_match.strip() == '*'
+        else:
+            since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+            not_modified = since is not None and last_modified <= since
+        if not_modified:
+            response = HttpResponseNotModified()
+        else:
+            cached = cache.get(f'orders:response:{key}')
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+            else:
+                response = handler(request, *args, **kwargs)
+                response._orders_cache_key = key
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(request, super().retrieve, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(response, '_orders_cache_key', None)
+        if key and response.status_code == 200:
+            response.render()
+            cache.set(f'orders:response:{key}', (response.content, response['Content-Type']), RESPONSE_TTL)
+        return response
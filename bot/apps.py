@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class BotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'zudrasonbot.bot'
+
+    def ready(self):
+        from django.core import checks
+
+        from . import api_cache, cache, rollups, storage
+        checks.register(api_cache.check_shared_cache)
+        cache.connect_signals()
+        api_cache.connect_signals()
+        storage.connect_signals()
+        rollups.connect_signals()
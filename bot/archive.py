@@ -0,0 +1,88 @@
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, Order
+
+
+# Перенос закрытых заказов в архивную таблицу небольшими пачками: каждая пачка — отдельная
+# короткая транзакция, поэтому блокировки строк не держатся долго и бот продолжает работать.
+# На Postgres пачка переносится одним запросом DELETE ... RETURNING внутри INSERT.
+
+CLOSED_STATUSES = ('completed', 'cancelled')
+
+COLUMNS = [field.column for field in Order._meta.concrete_fields]
+
+
+def _quoted(names):
+    return ', '.join(connection.ops.quote_name(name) for name in names)
+
+
+def _move_batch_postgres(cutoff, statuses, batch_size):
+    source = connection.ops.quote_name(Order._meta.db_table)
+    target = connection.ops.quote_name(ArchivedOrder._meta.db_table)
+    columns = _quoted(COLUMNS)
+    sql = f"""
+        WITH moved AS (
+            DELETE FROM {source}
+            WHERE id IN (
+                SELECT id FROM {source}
+                WHERE status = ANY(%s) AND updated_at < %s
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {columns}
+        )
+        INSERT INTO {target} ({columns}, archived_at)
+        SELECT {columns}, now() FROM moved
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [list(statuses), cutoff, batch_size])
+        return cursor.rowcount
+
+
+def _move_batch_generic(cutoff, statuses, batch_size):
+    source = connection.ops.quote_name(Order._meta.db_table)
+    target = connection.ops.quote_name(ArchivedOrder._meta.db_table)
+    columns = _quoted(COLUMNS)
+    with transaction.atomic():
+        ids = list(
+            Order.objects.filter(status__in=statuses, updated_at__lt=cutoff)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        placeholders = ', '.join(['%s'] * len(ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {target} ({columns}, archived_at) "
+                f"SELECT {columns}, %s FROM {source} WHERE id IN ({placeholders})",
+                [timezone.now(), *ids]
+            )
+            cursor.execute(f"DELETE FROM {source} WHERE id IN ({placeholders})", ids)
+            return cursor.rowcount
+
+
+def archive_orders(days=7, batch_size=1000, statuses=CLOSED_STATUSES, pause=0.0, limit=None):
+    """
+    Переносит заказы в статусах statuses, не менявшиеся days дней, в ArchivedOrder.
+    pause — пауза между пачками (сек), limit — максимум заказов за запуск.
+    Возвращает число перенесенных заказов.
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    move = _move_batch_postgres if connection.vendor == 'postgresql' else _move_batch_generic
+    moved = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        with transaction.atomic():
+            count = move(cutoff, statuses, size)
+        moved += count
+        if count < size:
+            break
+        if pause:
+            time.sleep(pause)
+    return moved
+
@@ -1,8 +1,12 @@
 import os
 import asyncio
+import uuid
+from dataclasses import replace
+from decimal import Decimal
 from typing import Optional
 from aiogram import Bot, Dispatcher, Router, types, F
-from aiogram.filters import Command, StateFilter
+from aiogram.enums import ChatMemberStatus, ChatType
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.types import (
     Message,
     ReplyKeyboardMarkup,
@@ -16,11 +20,41 @@ from aiogram.types import (
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.utils import timezone
 from asgiref.sync import sync_to_async
 from dotenv import load_dotenv
 
 from zudrasonbot.bot.models import Order
+from zudrasonbot.bot.cache import OrderSnapshot, order_cache
+from zudrasonbot.bot.projections import CourierCard, StatusCheck, latest_for_user
+from zudrasonbot.bot.intake import IntakeQueue, IntakeWorker, QueueFull, PRESSURE_FULL, PRESSURE_SLOW
+from zudrasonbot.bot.persistence import create_orders, apply_order_updates
+from zudrasonbot.bot.write_behind import WriteBehindBuffer
+from zudrasonbot.bot import images
+from zudrasonbot.bot.dispatch import CourierDispatch
+from zudrasonbot.bot.escalations import SlaWatcher
+from zudrasonbot.bot.estimates import PriceEstimator
+from zudrasonbot.bot.flood import FloodControlMiddleware
+from zudrasonbot.bot.geo import ActiveOrderIndex, get_gazetteer
+from zudrasonbot.bot.pricing import (
+    BATCH_RE,
+    MAX_PRICE,
+    apply_prices,
+    claim_order,
+    claim_orders,
+    parse_price,
+    parse_prices,
+    release_claims
+)
+from zudrasonbot.bot.receipts import ReceiptIndex, dhash, save_receipt
+from zudrasonbot.bot.notifications import (
+    NotificationSender,
+    PAYMENT_ACCEPTED_TEXT,
+    confirm_markup,
+    rating_markup
+)
 
 load_dotenv()
 
@@ -37,12 +71,96 @@ class BotHandler:
         self.dp.include_router(self.router)
         
         # Константы
-        self.GROUP_ID = -1002665268326  # ID группы оператора
-        self.COURIER_GROUP_ID = -1002648695686  # ID группы курьеров
+        self.GROUP_ID = settings.OPERATOR_GROUP_ID  # ID группы оператора
+        self.COURIER_GROUP_ID = settings.COURIER_GROUP_ID  # ID группы курьеров
+
+        # Ограничение частоты сообщений пользователей до обработчиков и БД
+        self.flood_control = FloodControlMiddleware(
+            rate=settings.FLOOD_RATE,
+            burst=settings.FLOOD_BURST,
+            media_cost=settings.FLOOD_MEDIA_COST,
+            dedupe_window=settings.FLOOD_DEDUPE_WINDOW,
+            notice_interval=settings.FLOOD_NOTICE_INTERVAL,
+            exempt_chats=(self.GROUP_ID, self.COURIER_GROUP_ID)
+        )
+        self.dp.message.outer_middleware(self.flood_control)
+        self.dp.callback_query.outer_middleware(self.flood_control)
         self.PAYMENT_DETAILS = {
             "card_number": "1234567890118038",
             "phone_number": "+992501070777"
         }
+
+        # Локальная очередь приема: заказы, оценки и отзывы сначала пишутся сюда
+        self.intake = IntakeQueue(
+            settings.INTAKE_QUEUE_PATH,
+            soft_limit=settings.INTAKE_SOFT_LIMIT,
+            hard_limit=settings.INTAKE_HARD_LIMIT
+        )
+        self.intake_worker = IntakeWorker(
+            self.intake,
+            handlers={
+                'new_order': self._persist_new_orders,
+                'order_update': self._persist_order_updates,
+            },
+            batch_size=settings.INTAKE_BATCH_SIZE,
+            max_attempts=settings.INTAKE_MAX_ATTEMPTS
+        )
+        # Отложенная запись второстепенных полей (оценка, отзыв, сообщения курьера)
+        self.write_buffer = WriteBehindBuffer(
+            max_orders=settings.WRITE_BEHIND_MAX_ORDERS,
+            interval=settings.WRITE_BEHIND_INTERVAL,
+            spill=self._spill_order_updates
+        )
+        # Хеши чеков для поиска повторно присланных (загружаются при старте)
+        self.receipts = ReceiptIndex(max_distance=settings.RECEIPT_HASH_DISTANCE)
+        # Геокодирование адресов по локальному справочнику и индекс активных заказов по точке забора
+        self.gazetteer = get_gazetteer()
+        self.order_locations = ActiveOrderIndex(
+            self.gazetteer,
+            cell_km=settings.GEO_CELL_KM,
+            interval=settings.GEO_INDEX_INTERVAL
+        )
+        # Подсказки цен для операторов по истории заказов (обновляются в фоне)
+        self.price_estimator = PriceEstimator(
+            days=settings.PRICE_SUGGEST_DAYS,
+            min_orders=settings.PRICE_SUGGEST_MIN_ORDERS,
+            step=Decimal(settings.PRICE_SUGGEST_STEP),
+            interval=settings.PRICE_SUGGEST_INTERVAL,
+            gazetteer=self.gazetteer,
+            locations=self.order_locations
+        )
+        # Распределение заказов по курьерам в личные сообщения (с публикацией в группе как запасным вариантом)
+        self.courier_dispatch = CourierDispatch(
+            self.bot,
+            self.COURIER_GROUP_ID,
+            gazetteer=self.gazetteer,
+            locations=self.order_locations,
+            shortlist=settings.DISPATCH_SHORTLIST,
+            max_active=settings.DISPATCH_MAX_ACTIVE,
+            timeout=settings.DISPATCH_OFFER_TIMEOUT,
+            waves=settings.DISPATCH_WAVES,
+            location_ttl=settings.DISPATCH_LOCATION_TTL,
+            sync_interval=settings.DISPATCH_SYNC_INTERVAL
+        )
+        # Напоминания по зависшим заказам (таймеры в памяти, восстанавливаются по БД при старте)
+        self.sla_watcher = SlaWatcher(
+            self.bot,
+            self.GROUP_ID,
+            dispatch=self.courier_dispatch,
+            price_after=settings.SLA_PRICE_AFTER,
+            courier_after=settings.SLA_COURIER_AFTER,
+            confirm_after=settings.SLA_CONFIRM_AFTER,
+            repeats=settings.SLA_REMINDER_REPEATS
+        )
+        # Очередь уведомлений из админки (массовые действия над заказами)
+        self.notification_sender = NotificationSender(
+            self.bot,
+            rate=settings.NOTIFY_RATE,
+            chat_interval=settings.NOTIFY_CHAT_INTERVAL,
+            group_interval=settings.NOTIFY_GROUP_INTERVAL,
+            batch_size=settings.NOTIFY_BATCH_SIZE,
+            max_attempts=settings.NOTIFY_MAX_ATTEMPTS
+        )
         
         self._init_states()
         self._init_handlers()
@@ -86,30 +204,59 @@ class BotHandler:
             is_persistent=True
         )
 
+    def get_courier_shift_menu(self):
+        return ReplyKeyboardMarkup(
+            keyboard=[
+                [KeyboardButton(text="📍 Отправить местоположение", request_location=True)],
+                [KeyboardButton(text="🔴 Закончить смену")]
+            ],
+            resize_keyboard=True
+        )
+
     def get_back_to_menu_button(self):
         return ReplyKeyboardMarkup(
             keyboard=[[KeyboardButton(text="🏠 Главное меню")]],
             resize_keyboard=True
         )
 
-    async def send_order_to_group(self, group_id, order_id, user_data, message, button_text, callback_prefix):
+    async def send_order_to_group(self, group_id, order_id, user_data, message, button_text, callback_prefix,
+                                  client_name=None, photo_file_id=None, suggestion=None, route_km=None):
+        # message может отсутствовать (заказ сохраняется воркером очереди) —
+        # тогда имя клиента и фото передаются явно
+        if message is not None:
+            client_name = message.from_user.username or message.from_user.full_name
+            if message.content_type == ContentType.PHOTO:
+                photo_file_id = message.photo[-1].file_id
+
         order_text = (
             f"📦 Новый заказ #{order_id}\n\n"
-            f"👤 Клиент: @{message.from_user.username or message.from_user.full_name}\n"
+            f"👤 Клиент: @{client_name}\n"
             f"📍 Откуда: {user_data['from_address']}\n"
             f"📍 Куда: {user_data['to_address']}\n"
             f"📞 Телефон: {user_data['phone']}\n"
             f"📦 Тип: {user_data['package_type']}"
         )
 
-        markup = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=button_text, callback_data=f"{callback_prefix}:{order_id}")]
-        ])
+        if route_km is not None:
+            order_text += f"\n📏 По прямой: {route_km:.1f} км"
 
-        if message.content_type == ContentType.PHOTO:
+        buttons = [[InlineKeyboardButton(text=button_text, callback_data=f"{callback_prefix}:{order_id}")]]
+        # Подсказка цены по похожим заказам: цена ставится одним нажатием
+        if suggestion is not None:
+            order_text += (
+                f"\n\n💡 Обычно {suggestion.low}–{suggestion.high} сомони "
+                f"({suggestion.label}, заказов: {suggestion.orders})"
+            )
+            buttons.insert(0, [InlineKeyboardButton(
+                text=f"💡 {suggestion.price} сомони",
+                callback_data=f"quick_price:{order_id}:{suggestion.price}"
+            )])
+        markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+
+        if photo_file_id:
             await self.bot.send_photo(
                 group_id,
-                photo=message.photo[-1].file_id,
+                photo=photo_file_id,
                 caption=order_text,
                 reply_markup=markup
             )
@@ -178,55 +325,181 @@ class BotHandler:
         order.save()
         return order.id
 
-    @sync_to_async
-    def get_order_by_id(self, order_id: int) -> Optional[Order]:
-        try:
-            return Order.objects.get(id=order_id)
-        except Order.DoesNotExist:
-            return None
+    async def get_order_by_id(self, order_id: int) -> Optional[OrderSnapshot]:
+        return await order_cache.aget(order_id)
+
+    async def _update_order(self, order_id: int, **changes) -> OrderSnapshot:
+        """
+        Один UPDATE, снимок в кэше обновляется на месте. Перед сменой статуса снимок
+        читается из БД: статус или курьера могли поменять в админке (другой процесс).
+        """
+        order = await order_cache.aget(order_id, fresh='status' in changes)
+        if order is None:
+            raise Order.DoesNotExist(f"Заказ #{order_id} не найден")
+        now = timezone.now()
+        await sync_to_async(Order.objects.filter(id=order_id).update)(updated_at=now, **changes)
+        order = replace(order, updated_at=now, **changes)
+        order_cache.put(order)
+        return order
 
-    @sync_to_async
-    def set_order_price(self, order_id: int, price: float) -> None:
-        order = Order.objects.get(id=order_id)
-        order.price = price
-        order.save()
+    async def set_order_price(self, order_id: int, price: float) -> None:
+        await self._update_order(order_id, price=Decimal(str(price)))
 
-    @sync_to_async
-    def confirm_order(self, order_id: int) -> None:
-        order = Order.objects.get(id=order_id)
-        order.status = 'confirmed'
-        order.save()
+    async def confirm_order(self, order_id: int) -> None:
+        await self._update_order(order_id, status='confirmed')
 
-    @sync_to_async
-    def assign_courier(self, order_id: int, courier_id: int, courier_username: str):
-        order = Order.objects.get(id=order_id)
-        order.courier_id = courier_id
-        order.courier_link = f"https://t.me/{courier_username}" if courier_username else None
-        order.status = 'assigned'
-        order.save()
-        return order
+    async def assign_courier(self, order_id: int, courier_id: int, courier_username: str):
+        return await self._update_order(
+            order_id,
+            courier_id=courier_id,
+            courier_link=f"https://t.me/{courier_username}" if courier_username else None,
+            status='assigned'
+        )
 
-    @sync_to_async
-    def update_order_status(self, order_id: int, status: str):
-        order = Order.objects.get(id=order_id)
-        order.status = status
-        order.save()
-        return order
+    async def update_order_status(self, order_id: int, status: str):
+        return await self._update_order(order_id, status=status)
 
-    @sync_to_async
-    def set_courier_message(self, order_id: int, message: str):
-        order = Order.objects.get(id=order_id)
-        order.courier_message = message
-        order.save()
-        return order
+    async def set_courier_message(self, order_id: int, message: str):
+        """Сообщение курьера пишется отложенно, статус — сразу"""
+        self.write_buffer.set(order_id, courier_message=message)
+        return await self.update_order_status(order_id, 'in_progress')
 
-    @sync_to_async
-    def set_delivery_message(self, order_id: int, message: str):
-        order = Order.objects.get(id=order_id)
-        order.delivery_message = message
-        order.status = 'delivered'
-        order.save()
-        return order
+    async def set_delivery_message(self, order_id: int, message: str):
+        self.write_buffer.set(order_id, delivery_message=message)
+        return await self.update_order_status(order_id, 'delivered')
+
+    # Оценка заказов операторами
+    async def send_price_to_client(self, user_id: int, price: Decimal) -> None:
+        client_message = (
+            f"💰 Стоимость доставки: {price} сомони.\n\n"
+            f"⚠️ Отправитель гарантирует, что посылка не содержит запрещённых предметов.\n"
+            f"Подтвердите заказ:")
+
+        confirm_markup = ReplyKeyboardMarkup(
+            keyboard=[[KeyboardButton(text=f"✅ Подтвердить заказ")]],
+            resize_keyboard=True
+        )
+
+        await self.bot.send_message(user_id, client_message, reply_markup=confirm_markup)
+
+    async def apply_operator_prices(self, message: Message, prices: dict, operator_id: Optional[int] = None) -> None:
+        """
+        Записывает цены оператора одной транзакцией и отправляет их клиентам.
+        operator_id — если message не от оператора (ответ на нажатие кнопки).
+        """
+        applied, rejected = await sync_to_async(apply_prices)(
+            operator_id or message.from_user.id, prices, settings.PRICING_CLAIM_TTL
+        )
+        for order_id, user_id, price in applied:
+            try:
+                await self.send_price_to_client(user_id, price)
+            except Exception as e:
+                print(f"Ошибка при отправке цены клиенту заказа #{order_id}: {e}")
+
+        if len(applied) == 1 and not rejected:
+            order_id, _, price = applied[0]
+            await message.answer(
+                f"✅ Цена {price} сомони установлена для заказа #{order_id}.\n"
+                f"Ожидаем подтверждения от клиента."
+            )
+            return
+
+        lines = []
+        if applied:
+            lines.append("✅ Цены установлены, ожидаем подтверждения от клиентов:")
+            lines += [f"#{order_id} — {price} сомони" for order_id, _, price in applied]
+        if rejected:
+            lines.append("❌ Не установлены:")
+            lines += [f"#{order_id} — {reason}" for order_id, reason in rejected]
+        await message.answer("\n".join(lines))
+
+    # Проверка чеков
+    async def _receipt_fingerprint(self, message: Message):
+        """(dHash или None, file_unique_id) присланного чека"""
+        if message.content_type == ContentType.PHOTO:
+            # Для хеша хватает средней копии, качать оригинал не нужно
+            file = next((size for size in message.photo if size.width >= 320), message.photo[-1])
+        else:
+            file = message.document
+            if not (file.mime_type or '').startswith('image/') or (file.file_size or 0) > 10 * 1024 * 1024:
+                return None, file.file_unique_id
+        try:
+            file_info = await self.bot.get_file(file.file_id)
+            data = await self.bot.download_file(file_info.file_path)
+            return await asyncio.to_thread(dhash, data.read()), file.file_unique_id
+        except Exception as e:
+            print(f"Не удалось вычислить хеш чека: {e}")
+            return None, file.file_unique_id
+
+    async def check_receipt(self, message: Message, order_id: int) -> str:
+        """Сохраняет чек в индекс и возвращает предупреждение для оператора о похожих чеках"""
+        value, file_unique_id = await self._receipt_fingerprint(message)
+        matches = self.receipts.find(value, file_unique_id, order_id)
+        receipt = await sync_to_async(save_receipt)(value, file_unique_id, order_id, message.from_user.id)
+        self.receipts.add(receipt)
+        if not matches:
+            return ""
+        lines = [
+            f"• заказ #{ref.order_id} от {timezone.localtime(ref.created_at):%Y-%m-%d}, клиент ID {ref.user_id} "
+            f"({'тот же файл' if distance is None else f'отличие {distance} бит из 64'})"
+            for distance, ref in matches[:3]
+        ]
+        return "\n\n⚠️ Возможный повтор чека:\n" + "\n".join(lines)
+
+    # Работа с очередью приема
+    def _spool_photo(self, name: str, data: bytes) -> str:
+        os.makedirs(settings.INTAKE_SPOOL_DIR, exist_ok=True)
+        path = os.path.join(settings.INTAKE_SPOOL_DIR, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    async def _spill_order_updates(self, batch) -> None:
+        """Переносит несохраненные изменения из буфера в долговременную очередь"""
+        for order_id, fields in batch.items():
+            await self.intake.aput('order_update', {'order_id': order_id, 'fields': fields})
+
+    async def _persist_new_orders(self, records):
+        order_ids = await sync_to_async(create_orders)(records)
+        self.sla_watcher.reconcile(order_ids)
+        # Миниатюры для админки и API строятся в фоне
+        images.schedule([order_id for record, order_id in zip(records, order_ids) if record.get('photo_path')])
+        for record in records:
+            if record.get('photo_path'):
+                try:
+                    os.remove(record['photo_path'])
+                except OSError:
+                    pass
+        # Уведомления отправляем отдельно, чтобы не задерживать подтверждение очереди
+        asyncio.create_task(self._notify_new_orders(records, order_ids))
+
+    async def _notify_new_orders(self, records, order_ids):
+        for record, order_id in zip(records, order_ids):
+            try:
+                await self.bot.send_message(record['user_id'], f"🧾 Номер вашего заказа: #{order_id}")
+                await self.send_order_to_group(
+                    group_id=self.GROUP_ID,
+                    order_id=order_id,
+                    user_data=record,
+                    message=None,
+                    button_text="💰 Указать цену",
+                    callback_prefix="set_price",
+                    client_name=record['client_name'],
+                    photo_file_id=record.get('photo_file_id'),
+                    suggestion=self.price_estimator.suggest(
+                        record['package_type'], record['from_address'], record['to_address']
+                    ),
+                    route_km=self.gazetteer.distance(record['from_address'], record['to_address'])
+                )
+            except Exception as e:
+                print(f"Ошибка при отправке заказа #{order_id} оператору: {e}")
+
+    async def _persist_order_updates(self, records):
+        # Несколько изменений одного заказа сливаются в одно
+        updates = {}
+        for record in records:
+            updates.setdefault(record['order_id'], {}).update(record['fields'])
+        await sync_to_async(apply_order_updates)(updates)
 
     def _init_handlers(self):
         # Основные команды
@@ -239,6 +512,42 @@ class BotHandler:
                 reply_markup=self.get_main_menu()
             )
 
+        # Смена курьера: на смене курьер получает заказы в личные сообщения
+        @self.router.message(F.chat.type == ChatType.PRIVATE, Command("online"))
+        async def courier_online(message: Message):
+            try:
+                member = await self.bot.get_chat_member(self.COURIER_GROUP_ID, message.from_user.id)
+            except Exception as e:
+                print(f"Ошибка при проверке курьера {message.from_user.id}: {e}")
+                member = None
+            if member is None or member.status not in (
+                ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.CREATOR
+            ):
+                await message.answer("❌ Смена доступна только курьерам Zudrason.")
+                return
+            self.courier_dispatch.set_online(message.from_user.id, message.from_user.username)
+            await message.answer(
+                "🟢 Вы на смене. Новые заказы будут приходить сюда.\n"
+                "Поделитесь местоположением (лучше трансляцией), чтобы получать заказы поблизости.",
+                reply_markup=self.get_courier_shift_menu()
+            )
+
+        @self.router.message(F.chat.type == ChatType.PRIVATE, Command("offline"))
+        @self.router.message(F.chat.type == ChatType.PRIVATE, F.text == "🔴 Закончить смену")
+        async def courier_offline(message: Message):
+            self.courier_dispatch.set_online(message.from_user.id, online=False)
+            await message.answer("🔴 Смена закончена. Новые заказы приходить не будут.",
+                reply_markup=self.get_main_menu())
+
+        @self.router.message(F.chat.type == ChatType.PRIVATE, F.location)
+        @self.router.edited_message(F.chat.type == ChatType.PRIVATE, F.location)
+        async def courier_location(message: Message):
+            # Трансляция местоположения приходит правками исходного сообщения
+            if message.from_user.id in self.courier_dispatch.couriers:
+                self.courier_dispatch.set_location(
+                    message.from_user.id, message.location.latitude, message.location.longitude
+                )
+
         @self.router.message(F.text == "🏠 Главное меню")
         async def back_to_main(message: Message):
             await start(message)
@@ -359,8 +668,15 @@ class BotHandler:
                 await state.clear()
                 return
                 
+            if self.intake.pressure() == PRESSURE_FULL:
+                await message.answer(
+                    "⚠️ Сервис временно перегружен. Отправьте фото или 'Нет' еще раз через минуту.",
+                    reply_markup=self.get_back_to_menu_button()
+                )
+                return
+
             user_data = await state.get_data()
-            photo_file = None
+            photo_path = None
             photo_file_id = None
 
             if message.content_type == ContentType.PHOTO:
@@ -368,32 +684,42 @@ class BotHandler:
                 photo_file_id = photo.file_id
                 photo_file_obj = await self.bot.get_file(photo.file_id)
                 file_bytes = await self.bot.download_file(photo_file_obj.file_path)
-                photo_file = ContentFile(file_bytes.read(), name=f"order_{message.from_user.id}_{photo.file_id}.jpg")
-
-            order_id = await self.create_order(
-                user_id=message.from_user.id,
-                username=message.from_user.username,
-                from_address=user_data['from_address'],
-                to_address=user_data['to_address'],
-                phone=user_data['phone'],
-                package_type=user_data['package_type'],
-                photo=photo_file,
-                photo_file_id=photo_file_id
-            )
+                photo_path = await asyncio.to_thread(
+                    self._spool_photo,
+                    f"order_{message.from_user.id}_{photo.file_unique_id}.jpg",
+                    file_bytes.read()
+                )
 
-            await message.answer(
-                f"✅ Ваш заказ #{order_id} принят. Ожидайте расчета стоимости.",
-                reply_markup=self.get_main_menu()
-            )
+            record = {
+                'user_id': message.from_user.id,
+                'username': message.from_user.username,
+                'client_name': message.from_user.username or message.from_user.full_name,
+                'from_address': user_data['from_address'],
+                'to_address': user_data['to_address'],
+                'phone': user_data['phone'],
+                'package_type': user_data['package_type'],
+                'photo_path': photo_path,
+                'photo_file_id': photo_file_id,
+                # Ключ идемпотентности: повтор записи из очереди не создаст второй заказ
+                'intake_key': uuid.uuid4().hex,
+            }
 
-            await self.send_order_to_group(
-                group_id=self.GROUP_ID,
-                order_id=order_id,
-                user_data=user_data,
-                message=message,
-                button_text="💰 Указать цену",
-                callback_prefix="set_price"
-            )
+            try:
+                await self.intake.aput('new_order', record)
+            except QueueFull:
+                if photo_path:
+                    os.remove(photo_path)
+                await message.answer(
+                    "⚠️ Сервис временно перегружен. Отправьте фото или 'Нет' еще раз через минуту.",
+                    reply_markup=self.get_back_to_menu_button()
+                )
+                return
+            self.intake_worker.wake()
+
+            answer_text = "✅ Ваш заказ принят. Ожидайте расчета стоимости."
+            if self.intake.pressure() == PRESSURE_SLOW:
+                answer_text += "\n⏳ Сейчас много заказов, номер заказа придет чуть позже."
+            await message.answer(answer_text, reply_markup=self.get_main_menu())
 
             await state.clear()
 
@@ -402,6 +728,10 @@ class BotHandler:
         @self.router.callback_query(F.data.startswith("set_price:"))
         async def request_price_input(callback: CallbackQuery, state: FSMContext):
             order_id = int(callback.data.split(":")[1])
+            holder = await sync_to_async(claim_order)(callback.from_user.id, order_id, settings.PRICING_CLAIM_TTL)
+            if holder != callback.from_user.id:
+                await callback.answer(f"Заказ #{order_id} уже оценивает другой оператор", show_alert=True)
+                return
             await state.update_data(order_id=order_id)
             await state.set_state("waiting_for_price")
             
@@ -410,55 +740,100 @@ class BotHandler:
             )
             await callback.answer()
 
-        @self.router.message(F.chat.id == self.GROUP_ID, F.text, StateFilter("waiting_for_price"))
-        async def process_price_input(message: Message, state: FSMContext):
-            try:
-                price = float(message.text)
-                if price <= 0:
-                    raise ValueError("Цена должна быть положительной",
-                reply_markup=self.get_main_menu())
-                
-                state_data = await state.get_data()
-                order_id = state_data.get('order_id')
-                
-                if not order_id:
-                    await message.answer("❌ Ошибка: не удалось определить заказ.",
-                reply_markup=self.get_main_menu())
-                    return
+        @self.router.callback_query(F.data.startswith("quick_price:"))
+        async def quick_price(callback: CallbackQuery):
+            """Цена из подсказки одним нажатием"""
+            _, order_id, price = callback.data.split(":")
+            order_id, price = int(order_id), parse_price(price)
+            if price is None:
+                await callback.answer("❌ Неверная цена", show_alert=True)
+                return
+            holder = await sync_to_async(claim_order)(callback.from_user.id, order_id, settings.PRICING_CLAIM_TTL)
+            if holder != callback.from_user.id:
+                await callback.answer(f"Заказ #{order_id} уже оценивает другой оператор", show_alert=True)
+                return
+            await self.apply_operator_prices(callback.message, {order_id: price}, operator_id=callback.from_user.id)
+            await callback.answer()
 
-                await self.set_order_price(order_id, price)
-                order = await self.get_order_by_id(order_id)
-                if not order:
-                    await message.answer("❌ Заказ не найден.",
-                reply_markup=self.get_main_menu())
-                    return
+        @self.router.message(F.chat.id == self.GROUP_ID, Command("queue"))
+        async def pricing_queue(message: Message, command: CommandObject):
+            """Выдает оператору следующие заказы без цены"""
+            try:
+                limit = int(command.args) if command.args else settings.PRICING_QUEUE_DEFAULT
+            except ValueError:
+                await message.answer("❌ Формат: /queue 5")
+                return
+            limit = max(1, min(limit, settings.PRICING_QUEUE_MAX))
 
-                client_message = (
-                    f"💰 Стоимость доставки: {price} сомони.\n\n"
-                    f"⚠️ Отправитель гарантирует, что посылка не содержит запрещённых предметов.\n"
-                    f"Подтвердите заказ:")
+            orders = await sync_to_async(claim_orders)(message.from_user.id, limit, settings.PRICING_CLAIM_TTL)
+            if not orders:
+                await message.answer("✅ Заказов без цены нет.")
+                return
 
-                confirm_markup = ReplyKeyboardMarkup(
-                    keyboard=[[KeyboardButton(text=f"✅ Подтвердить заказ")]],
-                    resize_keyboard=True
+            lines = []
+            for order in orders:
+                line = f"#{order['id']}: {order['from_address']} → {order['to_address']}, {order['package_type']}"
+                suggestion = self.price_estimator.suggest(
+                    order['package_type'], order['from_address'], order['to_address'], order['id']
                 )
+                if suggestion is not None:
+                    line += f" (💡 {suggestion.price})"
+                lines.append(line)
+            await message.answer(
+                f"📋 Заказы для оценки (закреплены за вами на {settings.PRICING_CLAIM_TTL // 60} мин):\n\n"
+                + "\n".join(lines)
+                + f"\n\nОтправьте цены одним сообщением, например: {orders[0]['id']}:25"
+                + (f" {orders[1]['id']}:30" if len(orders) > 1 else "")
+            )
 
-                await self.bot.send_message(
-                    order.user_id,
-                    client_message,
-                    reply_markup=confirm_markup
+        @self.router.message(F.chat.id == self.GROUP_ID, Command("release"))
+        async def pricing_release(message: Message):
+            released = await sync_to_async(release_claims)(message.from_user.id)
+            await message.answer(f"↩️ Возвращено в очередь заказов: {released}")
+
+        @self.router.message(F.chat.id == self.GROUP_ID, Command("flood"))
+        async def flood_stats(message: Message):
+            """Сколько сообщений отброшено защитой от флуда"""
+            stats = self.flood_control.stats()
+            dropped = "\n".join(f"  {reason}: {count}" for reason, count in sorted(stats['dropped'].items())) or "  нет"
+            offenders = ", ".join(f"{user_id} ({count})" for user_id, count in stats['offenders']) or "нет"
+            await message.answer(
+                f"🛡 Защита от флуда\n"
+                f"Пропущено: {sum(stats['passed'].values())}\n"
+                f"Отброшено:\n{dropped}\n"
+                f"Чаще всех: {offenders}\n"
+                f"Пользователей под учетом: {stats['tracked_users']}"
+            )
+
+        @self.router.message(F.chat.id == self.GROUP_ID, F.text.regexp(BATCH_RE))
+        async def process_price_batch(message: Message):
+            """Несколько цен одним сообщением: «12:25 13:30»"""
+            prices, errors = parse_prices(message.text)
+            if errors or not prices:
+                await message.answer(
+                    f"❌ Не удалось разобрать: {' '.join(errors)}\n"
+                    f"Формат: номер:цена через пробел, например 12:25 13:30"
                 )
+                return
+            await self.apply_operator_prices(message, prices)
 
+        @self.router.message(F.chat.id == self.GROUP_ID, F.text, StateFilter("waiting_for_price"))
+        async def process_price_input(message: Message, state: FSMContext):
+            price = parse_price(message.text)
+            if price is None:
                 await message.answer(
-                    f"✅ Цена {price} сомони установлена для заказа #{order_id}.\n"
-                    f"Ожидаем подтверждения от клиента."
+                    f"❌ Неверный формат цены: введите положительное число меньше {MAX_PRICE}, например 25"
                 )
+                return
 
-                await state.clear()
+            state_data = await state.get_data()
+            order_id = state_data.get('order_id')
+            if not order_id:
+                await message.answer("❌ Ошибка: не удалось определить заказ.")
+                return
 
-            except ValueError as e:
-                await message.answer(f"❌ Неверный формат цены: {str(e)}",
-                reply_markup=self.get_main_menu())
+            await self.apply_operator_prices(message, {order_id: price})
+            await state.clear()
 
         @self.router.message(F.text == "✅ Подтвердить заказ")
         async def confirm_order_handler(message: Message):
@@ -522,9 +897,7 @@ class BotHandler:
             """Обработка выбора наличной оплаты"""
             try:
                 # Получаем последний заказ пользователя
-                order = await sync_to_async(
-                    Order.objects.filter(user_id=message.from_user.id).last
-                )()
+                order = await sync_to_async(latest_for_user)(CourierCard, message.from_user.id)
                 
                 if not order:
                     await message.answer("❌ Не найден ваш заказ. Начните заново.",
@@ -532,25 +905,13 @@ class BotHandler:
                     return
                 
                 # Обновляем статус заказа
-                order.status = 'waiting_courier'
-                await sync_to_async(order.save)()
-                
-                # Отправляем заказ в группу курьеров
-                await send_order_to_group(
-                    bot=self.bot,
-                    group_id=COURIER_GROUP_ID,
-                    order_id=order.id,
-                    user_data={
-                        'from_address': order.from_address,
-                        'to_address': order.to_address,
-                        'phone': order.phone,
-                        'package_type': order.package_type
-                    },
-                    message=message,
-                    button_text="✅ Принять заказ",
-                    callback_prefix="courier_accept"
+                await sync_to_async(Order.objects.filter(id=order.id).update)(
+                    status='waiting_courier', updated_at=timezone.now()
                 )
                 
+                # Предлагаем заказ курьерам
+                await self.courier_dispatch.dispatch(order)
+                
                 await message.answer(
                     "✅ Вы выбрали оплату наличными при получении.\n\n"
                     "Ваш заказ отправлен курьерам. Ожидайте, когда курьер примет заказ.",
@@ -571,9 +932,7 @@ class BotHandler:
             """Обработка полученного чека"""
             try:
                 # Получаем последний заказ пользователя
-                order = await sync_to_async(
-                    Order.objects.filter(user_id=message.from_user.id).last
-                )()
+                order = await sync_to_async(latest_for_user)(StatusCheck, message.from_user.id)
                 
                 if not order:
                     await message.answer("❌ Не найден ваш заказ. Начните заново.",
@@ -607,6 +966,10 @@ class BotHandler:
                     f"ID: {message.from_user.id}\n"
                     f"Имя: {message.from_user.full_name}"
                 )
+                try:
+                    operator_text += await self.check_receipt(message, order.id)
+                except Exception as e:
+                    print(f"Ошибка при проверке чека на повтор: {e}")
                 
                 # Отправляем чек оператору
                 if message.content_type == ContentType.PHOTO:
@@ -638,41 +1001,6 @@ class BotHandler:
                 )
                 await state.clear()
 
-        # Добавляем новые константы
-        COURIER_GROUP_ID = -1002648695686  # ID группы курьеров
-
-        # Добавляем новые асинхронные методы для работы с БД
-        @sync_to_async
-        def assign_courier(order_id: int, courier_id: int, courier_username: str):
-            order = Order.objects.get(id=order_id)
-            order.courier_id = courier_id
-            order.courier_link = f"https://t.me/{courier_username}" if courier_username else None
-            order.status = 'assigned'
-            order.save()
-            return order
-
-        @sync_to_async
-        def update_order_status(order_id: int, status: str):
-            order = Order.objects.get(id=order_id)
-            order.status = status
-            order.save()
-            return order
-
-        @sync_to_async
-        def set_courier_message(order_id: int, message: str):
-            order = Order.objects.get(id=order_id)
-            order.courier_message = message
-            order.save()
-            return order
-
-        @sync_to_async
-        def set_delivery_message(order_id: int, message: str):
-            order = Order.objects.get(id=order_id)
-            order.delivery_message = message
-            order.status = 'delivered'
-            order.save()
-            return order
-
         # Добавляем новые состояния
         class CourierStates(StatesGroup):
             waiting_for_courier_message = State()
@@ -688,36 +1016,16 @@ class BotHandler:
                 user_id = int(user_id)
                 order_id = int(order_id)
                 
-                order = await sync_to_async(Order.objects.get)(id=order_id)
-                order.status = 'paid'
-                await sync_to_async(order.save)()
-                # Отправляем заказ в группу курьеров
-                order_text = (
-                    f"🚚 Новый заказ для доставки #{order.id}\n\n"
-                    f"📍 Откуда: {order.from_address}\n"
-                    f"📍 Куда: {order.to_address}\n"
-                    f"📦 Тип: {order.package_type}\n"
-                    f"💰 Сумма: {order.price} сомони\n"
-                    f"📞 Телефон: {order.phone}"
-                )
-                
-                accept_markup = InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="✅ Принять заказ", callback_data=f"courier_accept:{order.id}")]
-                ])
-                
-                await self.bot.send_message(
-                    COURIER_GROUP_ID,
-                    order_text,
-                    reply_markup=accept_markup
-                )
+                order = await self.update_order_status(order_id, 'paid')
+                # Предлагаем заказ курьерам
+                await self.courier_dispatch.dispatch(order)
                 
                 await callback.message.edit_reply_markup()
-                await callback.answer("Оплата подтверждена, заказ отправлен курьерам")
+                await callback.answer("Оплата подтверждена, заказ предложен курьерам")
                 
                 await self.bot.send_message(
                     user_id,
-                    "✅ Оплата принята! Ваш заказ отправлен курьерам.\n"
-                    "Ожидайте, когда курьер примет заказ.",
+                    PAYMENT_ACCEPTED_TEXT,
                     reply_markup=ReplyKeyboardRemove()
                 )
                 
@@ -726,7 +1034,7 @@ class BotHandler:
                 await callback.answer("❌ Произошла ошибка")
 
                 # Отправляем заказ в группу курьеров
-        async def send_order_to_courier(order: Order):
+        async def send_order_to_courier(order: OrderSnapshot):
             """Отправляет полную информацию о заказе курьеру"""
             order_text = (
                 f"🚚 Заказ #{order.id}\n"
@@ -779,25 +1087,13 @@ class BotHandler:
                 order_id = int(callback.data.split(":")[1])
                 courier = callback.from_user
                 
-                # Получаем заказ
-                order = await self.get_order_by_id(order_id)
+                # Заказ достается курьеру, только если еще никем не принят (условный UPDATE)
+                order = await self.courier_dispatch.accept(order_id, courier.id, courier.username)
                 if not order:
-                    await callback.answer("❌ Заказ не найден")
-                    return
-                    
-                # Проверяем, не принят ли уже заказ другим курьером
-                if order.status != 'paid':
                     await callback.answer("❌ Заказ уже принят другим курьером")
                     return
                 
-                # Сохраняем курьера в заказе
-                order = await assign_courier(
-                    order_id=order_id,
-                    courier_id=courier.id,
-                    courier_username=courier.username
-                )
-                
-                # Удаляем кнопку "Принять" из сообщения в группе
+                # Удаляем кнопки из сообщения с предложением
                 try:
                     await callback.message.edit_reply_markup(reply_markup=None)
                 except Exception as e:
@@ -823,6 +1119,16 @@ class BotHandler:
                 print(f"Ошибка при принятии заказа курьером: {e}")
                 await callback.answer("❌ Произошла ошибка при принятии заказа")
 
+        @self.router.callback_query(F.data.startswith("courier_decline:"))
+        async def courier_decline_order(callback: CallbackQuery):
+            order_id = int(callback.data.split(":")[1])
+            await self.courier_dispatch.decline(order_id, callback.from_user.id)
+            try:
+                await callback.message.edit_text(f"Вы отказались от заказа #{order_id}.")
+            except Exception as e:
+                print(f"Ошибка при редактировании сообщения: {e}")
+            await callback.answer()
+
         @self.router.callback_query(F.data.startswith("courier_arrival:"))
         async def courier_arrival(callback: CallbackQuery, state: FSMContext):
             order_id = int(callback.data.split(":")[1])
@@ -841,8 +1147,7 @@ class BotHandler:
                 order_id = state_data['order_id']
                 
                 # Обновляем заказ
-                order = await set_courier_message(order_id, message.text)
-                await update_order_status(order_id, 'in_progress')
+                order = await self.set_courier_message(order_id, message.text)
                 
                 # Отправляем сообщение клиенту
                 await self.bot.send_message(
@@ -885,15 +1190,8 @@ class BotHandler:
                 order_id = state_data['order_id']
                 
                 # Обновляем заказ (асинхронно)
-                order = await set_delivery_message(order_id, message.text)
-                
-                # Создаем клавиатуру для подтверждения
-                confirm_keyboard = InlineKeyboardMarkup(inline_keyboard=[[
-                    InlineKeyboardButton(
-                        text="✅ Подтвердить получение",
-                        callback_data=f"client_confirm:{order.id}"
-                    )
-                ]])
+                order = await self.set_delivery_message(order_id, message.text)
+                self.courier_dispatch.finish(order_id, order.courier_id)
                 
                 # Отправляем сообщение клиенту
                 try:
@@ -902,7 +1200,7 @@ class BotHandler:
                         text=f"🚚 Курьер прибыл на место:\n\n"
                             f"Сообщение курьера: {message.text}\n\n"
                             "Пожалуйста, подтвердите получение:",
-                        reply_markup=confirm_keyboard
+                        reply_markup=confirm_markup(order.id)
                     )
                 except Exception as e:
                     print(f"Не удалось уведомить клиента: {e}")
@@ -933,10 +1231,8 @@ class BotHandler:
             try:
                 order_id = int(callback.data.split(":")[1])
                 
-                # Получаем и обновляем заказ
-                order = await sync_to_async(Order.objects.get)(id=order_id)
-                order.status = 'delivered'
-                await sync_to_async(order.save)()
+                # Получение подтверждено клиентом — заказ завершен
+                order = await self.update_order_status(order_id, 'completed')
                 
                 # Уведомляем курьера
                 try:
@@ -953,13 +1249,7 @@ class BotHandler:
                 await callback.message.answer(
                     "✅ Получение подтверждено! Спасибо, что выбрали наш сервис!\n\n"
                     "Пожалуйста, оцените качество обслуживания:",
-                    reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                        [InlineKeyboardButton(text="⭐️ 1", callback_data=f"rate:1:{order_id}")],
-                        [InlineKeyboardButton(text="⭐️ 2", callback_data=f"rate:2:{order_id}")],
-                        [InlineKeyboardButton(text="⭐️ 3", callback_data=f"rate:3:{order_id}")],
-                        [InlineKeyboardButton(text="⭐️ 4", callback_data=f"rate:4:{order_id}")],
-                        [InlineKeyboardButton(text="⭐️ 5", callback_data=f"rate:5:{order_id}")]
-                    ])
+                    reply_markup=rating_markup(order_id)
                 )
                 
                 await callback.answer()
@@ -977,9 +1267,7 @@ class BotHandler:
                 order_id = int(order_id)
                 
                 # Сохраняем оценку
-                await sync_to_async(Order.objects.filter(id=order_id).update)(
-                    client_score=rating
-                )
+                self.write_buffer.set(order_id, client_score=rating)
                 
                 # Предлагаем оставить отзыв
                 feedback_markup = InlineKeyboardMarkup(inline_keyboard=[
@@ -1034,9 +1322,7 @@ class BotHandler:
                 order_id = state_data['order_id']
                 
                 # Сохраняем отзыв
-                await sync_to_async(Order.objects.filter(id=order_id).update)(
-                    client_feedback=message.text
-                )
+                self.write_buffer.set(order_id, client_feedback=message.text)
                 
                 await message.answer("Спасибо за ваш отзыв! Мы ценим ваше мнение.", reply_markup=self.get_main_menu())
                 await state.clear()
@@ -1061,4 +1347,28 @@ class BotHandler:
             await online_payment(message)
 
     async def start_polling(self):
-        await self.dp.start_polling(self.bot)
+        loaded = await sync_to_async(self.receipts.load)()
+        print(f"Загружено хешей чеков: {loaded}")
+        self.intake_worker.start()
+        self.write_buffer.start()
+        self.notification_sender.start()
+        self.price_estimator.start()
+        self.order_locations.start()
+        self.courier_dispatch.start()
+        armed = await self.sla_watcher.start()
+        print(f"Таймеров напоминаний по заказам: {armed}")
+        try:
+            await self.dp.start_polling(self.bot)
+        finally:
+            await self.sla_watcher.stop()
+            await self.courier_dispatch.stop()
+            await self.order_locations.stop()
+            await self.price_estimator.stop()
+            await self.notification_sender.stop()
+            # Сначала буфер: при недоступной БД он сбросит изменения в очередь приема
+            try:
+                await self.write_buffer.stop()
+            except Exception as e:
+                print(f"Отложенные изменения не сохранены: {e}")
+            await self.intake_worker.stop()
+            self.intake.close()
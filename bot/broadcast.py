@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from itertools import islice
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from asgiref.sync import sync_to_async
+
+from .models import ArchivedOrder, Order
+from .ratelimit import TokenBucket
+
+
+# Рассылка всем клиентам (все, кто когда-либо делал заказ, включая архив). Получатели
+# читаются по возрастанию user_id серверным курсором, поэтому прогресс — это один
+# user_id: все получатели до него включительно обработаны. Он пишется в файл-чекпоинт
+# после каждой пачки, и прерванная рассылка продолжается с места остановки.
+
+MAX_TEXT_LENGTH = 4096
+
+# BadRequest, относящиеся к получателю, а не к тексту: такому получателю не отправить никогда
+RECIPIENT_ERRORS = ('chat not found', 'user not found', 'peer_id_invalid', 'user is deactivated')
+
+
+class MessageRejected(Exception):
+    """Telegram отклонил сам текст (разметка, длина) — рассылку нужно остановить"""
+
+def recipients(after=0, chunk_size=2000):
+    """Различные user_id клиентов больше after по возрастанию (серверный курсор)"""
+    queryset = (
+        Order.objects.filter(user_id__gt=after).values_list('user_id', flat=True)
+        .union(ArchivedOrder.objects.filter(user_id__gt=after).values_list('user_id', flat=True))
+        .order_by('user_id')
+    )
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def count_recipients(after=0):
+    return (
+        Order.objects.filter(user_id__gt=after).values_list('user_id', flat=True)
+        .union(ArchivedOrder.objects.filter(user_id__gt=after).values_list('user_id', flat=True))
+        .count()
+    )
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+@dataclass
+class Checkpoint:
+    digest: str
+    after: int = 0
+    sent: int = 0
+    blocked: int = 0
+    failed: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+    done: bool = False
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(**json.load(f))
+
+    def save(self, path):
+        # Через временный файл: при падении посреди записи остается прежний чекпоинт
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(asdict(self), f)
+        os.replace(tmp, path)
+
+
+class Broadcast:
+    """
+    Отправка text всем получателям: общий поток — не больше rate сообщений в секунду,
+    до concurrency запросов одновременно. На RetryAfter вся отправка приостанавливается
+    на указанное Telegram время, сообщение повторяется. Заблокировавшие бота пропускаются,
+    прочие ошибки повторяются до max_attempts раз.
+    """
+
+    def __init__(self, bot, text, checkpoint, path, rate=20, concurrency=20, max_attempts=3,
+                 parse_mode=None, progress=None):
+        self.bot = bot
+        self.text = text
+        self.checkpoint = checkpoint
+        self.path = path
+        self.bucket = TokenBucket(rate)
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.parse_mode = parse_mode
+        self.progress = progress
+
+    async def _send(self, user_id):
+        """'sent', 'blocked' или 'failed'"""
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(user_id, self.text, parse_mode=self.parse_mode)
+                return 'sent'
+            except TelegramRetryAfter as e:
+                # Лимит превышен — ждут все, не только этот запрос
+                self.bucket.pause(e.retry_after)
+                self.checkpoint.retries += 1
+            except TelegramForbiddenError:
+                return 'blocked'
+            except TelegramBadRequest as e:
+                if any(error in e.message.lower() for error in RECIPIENT_ERRORS):
+                    return 'blocked'
+                # Ошибка в самом сообщении повторится у всех — не «пролистываем» получателей
+                raise MessageRejected(e.message) from e
+            except Exception as e:
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    print(f"Ошибка при рассылке пользователю {user_id}: {e}")
+                    return 'failed'
+                self.checkpoint.retries += 1
+                await asyncio.sleep(2 ** attempt)
+
+    async def preview(self, chat_id):
+        """Пробная отправка (в группу операторов): Telegram проверит разметку и длину до рассылки"""
+        try:
+            await self.bot.send_message(chat_id, self.text, parse_mode=self.parse_mode)
+        except TelegramBadRequest as e:
+            raise MessageRejected(e.message) from e
+
+    async def run(self):
+        checkpoint = self.checkpoint
+        started = time.monotonic() - checkpoint.elapsed
+        cursor = recipients(checkpoint.after)
+        # Курсор привязан к соединению потока — все чтения в одном потоке Django
+        fetch = sync_to_async(lambda: list(islice(cursor, self.concurrency)), thread_sensitive=True)
+        while True:
+            batch = await fetch()
+            if not batch:
+                break
+            results = await asyncio.gather(*(self._send(user_id) for user_id in batch))
+            if all(result == 'failed' for result in results):
+                # Не доставлено никому из пачки — скорее всего, нет связи с Telegram.
+                # Останавливаемся, не сдвигая чекпоинт, чтобы не «пролистать» получателей
+                raise RuntimeError(f"Рассылка остановлена: ошибки у всех получателей после user_id {checkpoint.after}")
+            for result in results:
+                setattr(checkpoint, result, getattr(checkpoint, result) + 1)
+            checkpoint.after = batch[-1]
+            checkpoint.elapsed = time.monotonic() - started
+            checkpoint.save(self.path)
+            if self.progress is not None:
+                self.progress(checkpoint)
+        checkpoint.done = True
+        checkpoint.elapsed = time.monotonic() - started
+        checkpoint.save(self.path)
+        return checkpoint
@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+
+from .models import Order
+from .signals import orders_updated
+
+
+@dataclass(frozen=True, slots=True)
+class OrderSnapshot:
+    """Легкий неизменяемый снимок заказа без тяжелых полей (отзыв, сообщения курьера)"""
+    id: int
+    user_id: int
+    status: str
+    price: Optional[Decimal]
+    from_address: str
+    to_address: str
+    phone: str
+    package_type: str
+    photo: Optional[str]
+    courier_id: Optional[int]
+    courier_link: Optional[str]
+    client_link: Optional[str]
+    updated_at: datetime
+
+
+SNAPSHOT_FIELDS = tuple(f.name for f in fields(OrderSnapshot))
+
+
+class OrderCache:
+    """
+    Ограниченный LRU-кэш снимков заказов по id.
+    Сбрасывается сигналами post_save/post_delete/orders_updated. Сигналы срабатывают только
+    в своем процессе, поэтому изменения из админки бот увидит не позже чем через ttl секунд;
+    перед сменой статуса снимок читается из БД (aget(..., fresh=True)).
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # id -> (снимок, время записи)
+        self._lock = threading.Lock()
+        self._epoch = 0  # растет при каждом сбросе; устаревшие загрузки не попадают в кэш
+        self._inflight = {}
+
+    def _lookup(self, order_id):
+        with self._lock:
+            item = self._data.get(order_id)
+            if item is not None:
+                snapshot, stored_at = item
+                if time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(order_id)
+                    self.hits += 1
+                    return snapshot
+                del self._data[order_id]
+            self.misses += 1
+            return None
+
+    def put(self, snapshot, epoch=None):
+        with self._lock:
+            if epoch is not None and epoch != self._epoch:
+                return
+            self._data[snapshot.id] = (snapshot, time.monotonic())
+            self._data.move_to_end(snapshot.id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, *order_ids):
+        with self._lock:
+            self._epoch += 1
+            for order_id in order_ids:
+                self._data.pop(order_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+    @staticmethod
+    def _fetch(order_id):
+        row = Order.objects.filter(id=order_id).values(*SNAPSHOT_FIELDS).first()
+        return OrderSnapshot(**row) if row else None
+
+    def get(self, order_id: int) -> Optional[OrderSnapshot]:
+        snapshot = self._lookup(order_id)
+        if snapshot is None:
+            epoch = self._epoch
+            snapshot = self._fetch(order_id)
+            if snapshot is not None:
+                self.put(snapshot, epoch)
+        return snapshot
+
+    async def aget(self, order_id: int, fresh: bool = False) -> Optional[OrderSnapshot]:
+        """fresh=True — прочитать из БД в обход кэша и обновить кэш"""
+        if fresh:
+            epoch = self._epoch
+            snapshot = await sync_to_async(self._fetch)(order_id)
+            if snapshot is not None:
+                self.put(snapshot, epoch)
+            return snapshot
+
+        snapshot = self._lookup(order_id)
+        if snapshot is not None:
+            return snapshot
+
+        # Одновременные промахи по одному заказу ждут один запрос к БД
+        future = self._inflight.get(order_id)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[order_id] = future
+        try:
+            epoch = self._epoch
+            snapshot = await sync_to_async(self._fetch)(order_id)
+            if snapshot is not None:
+                self.put(snapshot, epoch)
+            future.set_result(snapshot)
+            return snapshot
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # ожидающих может не быть — помечаем исключение как полученное
+            raise
+        finally:
+            del self._inflight[order_id]
+
+
+order_cache = OrderCache(
+    maxsize=getattr(settings, 'ORDER_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'ORDER_CACHE_TTL', 60.0)
+)
+
+
+def _on_order_saved(sender, instance, **kwargs):
+    order_cache.invalidate(instance.pk)
+
+
+def _on_orders_updated(sender, pks, **kwargs):
+    order_cache.invalidate(*pks)
+
+
+def connect_signals():
+    post_save.connect(_on_order_saved, sender=Order, dispatch_uid='order_cache_save')
+    post_delete.connect(_on_order_saved, sender=Order, dispatch_uid='order_cache_delete')
+    orders_updated.connect(_on_orders_updated, sender=Order, dispatch_uid='order_cache_update')
@@ -0,0 +1,30 @@
+import io
+
+from PIL import Image, ImageOps
+
+
+# Обработка пикселей для производных изображений заказа. Модуль не импортирует Django:
+# функции выполняются в дочерних процессах пула и получают/возвращают только байты.
+
+# имя производной -> (максимальный размер по большей стороне, качество WebP)
+SPECS = {
+    'thumb': (320, 70),
+    'web': (1600, 80),
+}
+
+
+def render(data, specs=SPECS):
+    """Байты исходного фото -> {имя: байты WebP}"""
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+        result = {}
+        for name, (size, quality) in specs.items():
+            copy = image.copy()
+            copy.thumbnail((size, size), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            copy.save(buffer, 'WEBP', quality=quality, method=4)
+            result[name] = buffer.getvalue()
+        return result
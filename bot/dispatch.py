@@ -0,0 +1,349 @@
+import asyncio
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from asgiref.sync import sync_to_async
+
+from .cache import order_cache
+from .geo import haversine
+from .models import Order
+from .notifications import courier_offer_markup, courier_offer_text
+from .projections import CourierCard, project
+
+
+# Распределение заказов по курьерам. Вместо рассылки в группу курьеров заказ предлагается
+# в личные сообщения нескольким подходящим курьерам (меньше активных заказов, ближе к точке
+# забора, дольше без нового заказа). Если за timeout никто не принял — следующая волна,
+# после waves волн или без свободных курьеров — публикация в группе, как раньше.
+# Состояние курьеров хранится в памяти бота; активные заказы сверяются с Order.courier_id.
+
+# 'waiting_courier' ставит оплата наличными, 'paid' — подтверждение оплаты переводом
+DISPATCHABLE_STATUSES = ('paid', 'waiting_courier')
+ACTIVE_STATUSES = ('assigned', 'in_progress')
+
+
+@dataclass
+class CourierState:
+    courier_id: int
+    username: Optional[str] = None
+    online: bool = False
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    located_at: float = 0.0
+    active: set = field(default_factory=set)
+    last_assigned_at: float = 0.0
+
+
+@dataclass
+class Offer:
+    order_id: int
+    messages: dict = field(default_factory=dict)  # courier_id -> message_id
+    pending: set = field(default_factory=set)
+    tried: set = field(default_factory=set)
+    event: asyncio.Event = field(default_factory=asyncio.Event)
+    accepted: bool = False
+    task: Optional[asyncio.Task] = None
+
+
+def claim_for_courier(order_id, courier_id, courier_link):
+    """Назначает курьера, только если заказ еще ждет курьера: True — заказ достался ему"""
+    return Order.objects.filter(
+        id=order_id, status__in=DISPATCHABLE_STATUSES, courier_id__isnull=True
+    ).update(courier_id=courier_id, courier_link=courier_link, status='assigned') == 1
+
+
+def load_assignments():
+    """Активные заказы курьеров: [(courier_id, order_id)]"""
+    return list(
+        Order.objects.filter(status__in=ACTIVE_STATUSES, courier_id__isnull=False)
+        .values_list('courier_id', 'id')
+    )
+
+
+def load_waiting(limit=500):
+    """Заказы, ждущие курьера"""
+    queryset = Order.objects.filter(status__in=DISPATCHABLE_STATUSES, courier_id__isnull=True).order_by('id')
+    return list(project(CourierCard, queryset[:limit]))
+
+
+def offer_markup(order_id):
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Принять заказ", callback_data=f"courier_accept:{order_id}"),
+        InlineKeyboardButton(text="❌ Отказаться", callback_data=f"courier_decline:{order_id}"),
+    ]])
+
+
+class CourierDispatch:
+    """
+    Состояние курьеров и предложения заказов. Фоновая задача (start/stop) раз в sync_interval
+    секунд сверяет активные заказы с БД и запускает распределение для заказов, ждущих курьера
+    без предложения (оплата подтверждена в админке; после перезапуска бота — все такие заказы).
+    """
+
+    def __init__(self, bot, group_id, gazetteer=None, locations=None, shortlist=3, max_active=2, timeout=60.0,
+                 waves=2, location_ttl=1800.0, sync_interval=60.0):
+        self.bot = bot
+        self.group_id = group_id
+        self.gazetteer = gazetteer
+        self.locations = locations  # geo.ActiveOrderIndex: координаты активных заказов
+        self.shortlist = shortlist
+        self.max_active = max_active
+        self.timeout = timeout
+        self.waves = waves
+        self.location_ttl = location_ttl
+        self.sync_interval = sync_interval
+        self.couriers = {}
+        self.offers = {}
+        self.broadcasts = {}  # order_id -> message_id в группе курьеров
+        self._task = None
+
+    # Курьеры
+
+    def courier(self, courier_id, username=None):
+        state = self.couriers.get(courier_id)
+        if state is None:
+            state = self.couriers[courier_id] = CourierState(courier_id)
+        if username:
+            state.username = username
+        return state
+
+    def set_online(self, courier_id, username=None, online=True):
+        self.courier(courier_id, username).online = online
+
+    def set_location(self, courier_id, lat, lon):
+        state = self.courier(courier_id)
+        state.lat, state.lon, state.located_at = lat, lon, time.monotonic()
+
+    def rank(self, order, exclude=()):
+        """
+        Свободные курьеры на связи по порядку предложения: [(courier_id, км или None)].
+        Сначала меньше активных заказов, затем ближе к точке забора (с шагом 1 км),
+        затем дольше без нового заказа.
+        """
+        candidates = [
+            state for state in self.couriers.values()
+            if state.online and state.courier_id not in exclude and len(state.active) < self.max_active
+        ]
+        if not candidates:
+            return []
+        pickup = self._pickup(order)
+        distances = np.full(len(candidates), np.nan)
+        if pickup is not None:
+            now = time.monotonic()
+            located = [
+                i for i, state in enumerate(candidates)
+                if state.lat is not None and now - state.located_at <= self.location_ttl
+            ]
+            if located:
+                distances[located] = haversine(
+                    pickup[0], pickup[1],
+                    [candidates[i].lat for i in located], [candidates[i].lon for i in located]
+                )
+        ranked = sorted(
+            zip(candidates, distances.tolist()),
+            key=lambda item: (
+                len(item[0].active),
+                math.inf if math.isnan(item[1]) else math.floor(item[1]),
+                item[0].last_assigned_at,
+            )
+        )
+        return [(state.courier_id, None if math.isnan(km) else km) for state, km in ranked]
+
+    def _pickup(self, order):
+        """Точка забора: из индекса активных заказов, для еще не попавших в него — геокодированием"""
+        pickup = self.locations.pickup(order.id) if self.locations else None
+        if pickup is None and self.gazetteer:
+            pickup = self.gazetteer.geocode(order.from_address)
+        return pickup
+
+    def nearby_waiting(self, order, radius_km=1.0):
+        """Другие заказы, ждущие курьера, с точкой забора рядом: [(order_id, км)]"""
+        if not self.locations:
+            return []
+        waiting = self.offers.keys() | self.broadcasts.keys()
+        return [item for item in self.locations.nearby_orders(order.id, radius_km) if item[0] in waiting]
+
+    # Предложения
+
+    async def dispatch(self, order):
+        """Запускает распределение заказа (order — снимок с полями карточки курьера)"""
+        if order.id in self.offers:
+            return
+        offer = self.offers[order.id] = Offer(order.id)
+        offer.task = asyncio.create_task(self._run_offer(order, offer))
+
+    async def redispatch(self, order):
+        """Повторное предложение заказа, уже опубликованного в группе (без ответа курьеров)"""
+        if order.id in self.offers:
+            return
+        self.broadcasts.pop(order.id, None)
+        await self.dispatch(order)
+
+    async def _run_offer(self, order, offer):
+        try:
+            for _ in range(self.waves):
+                if offer.accepted:
+                    return
+                shortlist = self.rank(order, exclude=offer.tried)[:self.shortlist]
+                if not shortlist:
+                    break
+                offer.tried.update(courier_id for courier_id, _ in shortlist)
+                offer.event.clear()
+                await self._send_offers(order, offer, shortlist)
+                if not offer.pending:
+                    continue
+                try:
+                    await asyncio.wait_for(offer.event.wait(), timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    pass
+                if offer.accepted:
+                    return
+                await self._withdraw(offer, f"⌛ Время на ответ по заказу #{order.id} истекло.")
+            if not offer.accepted:
+                await self._broadcast(order)
+        except Exception as e:
+            print(f"Ошибка при распределении заказа #{order.id}: {e}")
+        finally:
+            if self.offers.get(order.id) is offer:
+                del self.offers[order.id]
+
+    async def _send_offers(self, order, offer, shortlist):
+        route_km = self.locations.route_km(order.id) if self.locations else None
+        nearby = self.nearby_waiting(order)
+        for courier_id, km in shortlist:
+            text = courier_offer_text(order)
+            if km is not None:
+                text += f"\n📏 До точки забора: {km:.1f} км"
+            if route_km is not None:
+                text += f"\n🛣 Маршрут: {route_km:.1f} км"
+            if nearby:
+                text += "\n📦 Рядом ждут курьера: " + ", ".join(
+                    f"#{order_id} ({distance:.1f} км)" for order_id, distance in nearby
+                )
+            text += f"\n\n⏳ Ответьте в течение {int(self.timeout)} сек."
+            try:
+                message = await self.bot.send_message(courier_id, text, reply_markup=offer_markup(order.id))
+            except TelegramForbiddenError:
+                # Курьер заблокировал бота — больше ему не предлагаем
+                self.courier(courier_id).online = False
+                continue
+            except Exception as e:
+                print(f"Ошибка при отправке предложения курьеру {courier_id}: {e}")
+                continue
+            offer.messages[courier_id] = message.message_id
+            offer.pending.add(courier_id)
+
+    async def _withdraw(self, offer, text, keep=None):
+        """Убирает кнопки у разосланных предложений (кроме курьера keep)"""
+        messages, offer.messages = offer.messages, {}
+        offer.pending.clear()
+        for courier_id, message_id in messages.items():
+            if courier_id == keep:
+                continue
+            try:
+                await self.bot.edit_message_text(text, chat_id=courier_id, message_id=message_id)
+            except (TelegramBadRequest, TelegramForbiddenError):
+                pass
+
+    async def _broadcast(self, order):
+        message = await self.bot.send_message(
+            self.group_id,
+            courier_offer_text(order),
+            reply_markup=courier_offer_markup(order.id)
+        )
+        self.broadcasts[order.id] = message.message_id
+
+    async def decline(self, order_id, courier_id):
+        offer = self.offers.get(order_id)
+        if offer is None or courier_id not in offer.pending:
+            return False
+        offer.pending.discard(courier_id)
+        offer.messages.pop(courier_id, None)
+        # Все из волны отказались — не ждем таймаута
+        if not offer.pending:
+            offer.event.set()
+        return True
+
+    async def accept(self, order_id, courier_id, username=None):
+        """
+        Закрепляет заказ за курьером одним условным UPDATE: из одновременных нажатий
+        выигрывает ровно одно. Возвращает снимок заказа или None, если заказ уже занят.
+        """
+        link = f"https://t.me/{username}" if username else None
+        if not await sync_to_async(claim_for_courier)(order_id, courier_id, link):
+            return None
+        state = self.courier(courier_id, username)
+        state.active.add(order_id)
+        state.last_assigned_at = time.monotonic()
+
+        offer = self.offers.get(order_id)
+        if offer is not None:
+            offer.accepted = True
+            offer.event.set()
+            await self._withdraw(offer, f"❌ Заказ #{order_id} принят другим курьером.", keep=courier_id)
+        message_id = self.broadcasts.pop(order_id, None)
+        if message_id is not None:
+            try:
+                await self.bot.edit_message_reply_markup(chat_id=self.group_id, message_id=message_id)
+            except TelegramBadRequest:
+                pass
+        return await order_cache.aget(order_id)
+
+    def finish(self, order_id, courier_id):
+        """Заказ доставлен или отменен — курьер освобождается"""
+        state = self.couriers.get(courier_id)
+        if state is not None:
+            state.active.discard(order_id)
+
+    # Сверка с БД
+
+    async def sync(self):
+        assignments = await sync_to_async(load_assignments)()
+        active = {}
+        for courier_id, order_id in assignments:
+            active.setdefault(courier_id, set()).add(order_id)
+        for courier_id in set(active) | set(self.couriers):
+            self.courier(courier_id).active = active.get(courier_id, set())
+
+        waiting = await sync_to_async(load_waiting)()
+        waiting_ids = {order.id for order in waiting}
+        # Заказ из группы принят или отменен — сообщение больше не отслеживаем
+        for order_id in set(self.broadcasts) - waiting_ids:
+            del self.broadcasts[order_id]
+        started = 0
+        for order in waiting:
+            if order.id not in self.offers and order.id not in self.broadcasts:
+                await self.dispatch(order)
+                started += 1
+        return started
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        tasks = [offer.task for offer in self.offers.values() if offer.task is not None]
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                print(f"Ошибка при сверке курьеров с БД: {e}")
+            await asyncio.sleep(self.sync_interval)
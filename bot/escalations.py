@@ -0,0 +1,188 @@
+import asyncio
+import math
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .models import Order
+from .projections import get_courier_card
+from .signals import orders_updated
+from .timers import TimerQueue
+
+
+# Напоминания по зависшим заказам. На каждое «ожидание» заказа ставится таймер
+# (TimerQueue), а не периодический опрос БД: заказ без цены — оператору, оплаченный
+# без курьера — повторное предложение курьерам и сообщение операторам, доставленный
+# без подтверждения — напоминание клиенту. Таймеры ставятся при старте по БД и
+# переставляются, когда бот меняет статус или цену заказа (сигнал orders_updated).
+
+@dataclass(frozen=True, slots=True)
+class OrderState:
+    id: int
+    user_id: int
+    status: str
+    price: Optional[object]
+    courier_id: Optional[int]
+    updated_at: object
+
+
+STATE_FIELDS = ('id', 'user_id', 'status', 'price', 'courier_id', 'updated_at')
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    statuses: tuple
+    delay: float
+    repeats: int
+
+    def applies(self, order):
+        if order.status not in self.statuses:
+            return False
+        if self.name == 'price':
+            return order.price is None
+        if self.name == 'courier':
+            return order.courier_id is None
+        return True
+
+
+def load_states(order_ids=None, statuses=None):
+    queryset = Order.objects.all()
+    if order_ids is not None:
+        queryset = queryset.filter(id__in=list(order_ids))
+    if statuses is not None:
+        queryset = queryset.filter(status__in=statuses)
+    return [OrderState(*row) for row in queryset.values_list(*STATE_FIELDS)]
+
+
+def confirm_markup(order_id):
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Подтвердить получение", callback_data=f"client_confirm:{order_id}")
+    ]])
+
+
+class SlaWatcher:
+    """
+    Правила: price — заказ в pending без цены, courier — оплачен, но без курьера,
+    confirm — доставлен, но клиент не подтвердил получение. Первое напоминание через
+    delay секунд после последнего изменения заказа, затем еще repeats - 1 раз с тем же шагом.
+    Напоминания, пропущенные пока бот не работал, не досылаются — только следующие по графику.
+    """
+
+    def __init__(self, bot, operator_group_id, dispatch=None, price_after=300.0, courier_after=600.0,
+                 confirm_after=3600.0, repeats=3):
+        self.bot = bot
+        self.operator_group_id = operator_group_id
+        self.dispatch = dispatch
+        self.rules = (
+            Rule('price', ('pending',), price_after, repeats),
+            Rule('courier', ('paid', 'waiting_courier'), courier_after, repeats),
+            Rule('confirm', ('delivered',), confirm_after, min(repeats, 2)),
+        )
+        self.timers = TimerQueue()
+        self._loop = None
+        self._dirty = set()
+        self._reconcile_task = None
+
+    @property
+    def statuses(self):
+        return tuple({status for rule in self.rules for status in rule.statuses})
+
+    def arm(self, order):
+        """Переставляет таймеры заказа по его текущему состоянию"""
+        self.timers.cancel_order(order.id)
+        base = order.updated_at.timestamp()
+        for rule in self.rules:
+            if rule.applies(order):
+                self._schedule(rule, order.id, base, max(1, math.ceil((time.time() - base) / rule.delay)))
+
+    def _schedule(self, rule, order_id, base, attempt):
+        if attempt <= rule.repeats:
+            self.timers.schedule((order_id, rule.name), base + rule.delay * attempt, self._fire, rule, order_id, attempt)
+
+    # Изменения заказов
+
+    def _on_orders_updated(self, sender, pks, fields, **kwargs):
+        # Вызывается в потоке, выполнившем UPDATE, — передаем в цикл бота
+        if self._loop is not None and ('status' in fields or 'price' in fields or 'courier_id' in fields):
+            self._loop.call_soon_threadsafe(self.reconcile, pks)
+
+    def reconcile(self, order_ids):
+        """Перечитывает заказы одной выборкой и переставляет их таймеры"""
+        self._dirty.update(order_ids)
+        if self._reconcile_task is None or self._reconcile_task.done():
+            self._reconcile_task = asyncio.create_task(self._reconcile())
+
+    async def _reconcile(self):
+        while self._dirty:
+            order_ids, self._dirty = self._dirty, set()
+            try:
+                states = await sync_to_async(load_states)(order_ids)
+            except Exception as e:
+                print(f"Ошибка при обновлении таймеров заказов: {e}")
+                continue
+            for order_id in order_ids:
+                self.timers.cancel_order(order_id)
+            for order in states:
+                self.arm(order)
+
+    # Срабатывание
+
+    async def _fire(self, rule, order_id, attempt):
+        # Заказ мог измениться в другом процессе (админка) — проверяем по БД
+        states = await sync_to_async(load_states)([order_id])
+        if not states or not rule.applies(states[0]):
+            return
+        order = states[0]
+        await getattr(self, f"_escalate_{rule.name}")(order)
+        self._schedule(rule, order_id, order.updated_at.timestamp(), attempt + 1)
+
+    def _minutes(self, order):
+        return int((timezone.now() - order.updated_at).total_seconds() // 60)
+
+    async def _escalate_price(self, order):
+        await self.bot.send_message(
+            self.operator_group_id,
+            f"⏰ Заказ #{order.id} ждет цену уже {self._minutes(order)} мин.\n"
+            f"Возьмите его в работу: /queue"
+        )
+
+    async def _escalate_courier(self, order):
+        await self.bot.send_message(
+            self.operator_group_id,
+            f"🚨 Заказ #{order.id} ждет курьера уже {self._minutes(order)} мин. "
+            f"Предлагаем курьерам повторно."
+        )
+        if self.dispatch is not None:
+            card = await sync_to_async(get_courier_card)(order.id)
+            if card is not None:
+                await self.dispatch.redispatch(card)
+
+    async def _escalate_confirm(self, order):
+        await self.bot.send_message(
+            order.user_id,
+            f"📦 Курьер отметил заказ #{order.id} как доставленный.\n"
+            f"Если вы получили посылку, подтвердите получение:",
+            reply_markup=confirm_markup(order.id)
+        )
+
+    # Запуск
+
+    async def start(self):
+        """Ставит таймеры по всем заказам в отслеживаемых статусах и запускает очередь"""
+        self._loop = asyncio.get_running_loop()
+        states = await sync_to_async(load_states)(statuses=self.statuses)
+        for order in states:
+            self.arm(order)
+        orders_updated.connect(self._on_orders_updated, sender=Order, dispatch_uid='sla_watcher')
+        self.timers.start()
+        return len(self.timers)
+
+    async def stop(self):
+        orders_updated.disconnect(sender=Order, dispatch_uid='sla_watcher')
+        await self.timers.stop()
+        self._loop = None
@@ -0,0 +1,244 @@
+import asyncio
+import math
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.utils import timezone
+
+from .addresses import normalize_address
+from .geo import haversine
+from .models import ArchivedOrder, Order
+
+
+# Подсказка цены для оператора по истории заказов. В памяти бота хранятся цены заказов
+# за последние days дней и таблица квантилей по группам — от точной (тип посылки + маршрут)
+# через похожее расстояние (если адреса нашлись в справочнике) до общей по всем заказам. Таблица считается векторно в NumPy; при обновлении читаются
+# только заказы с updated_at после отметки и пересчитываются только затронутые группы.
+
+QUANTILES = (0.25, 0.5, 0.75)
+
+# Уровни от точного к общему: по первому уровню, где хватает заказов, строится подсказка
+LEVELS = ('route_type', 'route', 'distance', 'type', 'all')
+LEVEL_LABELS = {
+    'route_type': 'этот маршрут и тип посылки',
+    'route': 'этот маршрут',
+    'distance': 'похожее расстояние',
+    'type': 'этот тип посылки',
+    'all': 'все заказы',
+}
+
+# Ширина интервала расстояний для группы 'distance', км
+DISTANCE_STEP_KM = 2.0
+
+FIELDS = ('id', 'created_at', 'updated_at', 'price', 'package_type', 'from_address', 'to_address')
+
+
+def group_keys(package_type, from_address, to_address, km=None):
+    """
+    Ключи групп заказа для всех уровней, в порядке LEVELS.
+    Без расстояния группа 'distance' общая для всех таких заказов и в подсказках не используется.
+    """
+    kind = ' '.join((package_type or '').lower().split())
+    route = tuple(sorted((normalize_address(from_address), normalize_address(to_address))))
+    band = None if km is None or math.isnan(km) else int(km // DISTANCE_STEP_KM)
+    return [('route_type', kind, *route), ('route', *route), ('distance', kind, band), ('type', kind), ('all',)]
+
+
+def group_quantiles(codes, prices, quantiles=QUANTILES):
+    """
+    Квантили цен по группам без цикла по группам: сортировка по (группа, цена),
+    границы групп и линейная интерполяция между соседними элементами.
+    Возвращает (коды групп, число заказов, квантили [групп x len(quantiles)]).
+    """
+    order = np.lexsort((prices, codes))
+    codes, prices = codes[order], prices[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    counts = np.diff(np.r_[starts, len(codes)])
+    positions = starts[:, None] + (counts[:, None] - 1) * np.asarray(quantiles)[None, :]
+    low = np.floor(positions).astype(np.int64)
+    high = np.ceil(positions).astype(np.int64)
+    values = prices[low] + (prices[high] - prices[low]) * (positions - low)
+    return codes[starts], counts, values
+
+
+@dataclass(frozen=True)
+class Suggestion:
+    price: Decimal
+    low: Decimal
+    high: Decimal
+    orders: int
+    level: str
+
+    @property
+    def label(self):
+        return LEVEL_LABELS[self.level]
+
+
+class PriceEstimator:
+    """
+    Таблица квантилей цен. Обновляется фоновой задачей (start/stop) каждые interval секунд;
+    suggest() читает таблицу без блокировок.
+    """
+
+    def __init__(self, days=180, min_orders=3, step=Decimal('1'), interval=60.0, gazetteer=None, locations=None):
+        self.days = days
+        self.gazetteer = gazetteer
+        self.locations = locations  # geo.ActiveOrderIndex: готовые расстояния активных заказов
+        self.min_orders = min_orders
+        self.step = Decimal(step)
+        self.interval = interval
+        self.watermark = None
+        self._groups = {}
+        # Выборка: по строке на заказ с ценой
+        self._ids = np.empty(0, dtype=np.int64)
+        self._created = np.empty(0, dtype=np.float64)
+        self._prices = np.empty(0, dtype=np.float64)
+        self._codes = np.empty((0, len(LEVELS)), dtype=np.int64)
+        # Таблица: по строке на группу
+        self._table = (np.zeros(0, dtype=np.int64), np.zeros((0, len(QUANTILES))))
+        self._task = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _code(self, key):
+        # Группы только добавляются, поэтому код группы не меняется между обновлениями
+        return self._groups.setdefault(key, len(self._groups))
+
+    def _distances(self, from_addresses, to_addresses):
+        """Расстояния маршрутов по справочнику адресов (NaN, если адрес не найден)"""
+        if not self.gazetteer:
+            return np.full(len(from_addresses), np.nan)
+        from_lat, from_lon = self.gazetteer.geocode_many(from_addresses)
+        to_lat, to_lon = self.gazetteer.geocode_many(to_addresses)
+        return haversine(from_lat, from_lon, to_lat, to_lon)
+
+    def _rows(self, model, condition):
+        rows = model.objects.filter(condition).values_list(*FIELDS)
+        return rows.iterator(chunk_size=5000)
+
+    def _apply(self, rows, cutoff):
+        """Заменяет в выборке заказы из rows и пересчитывает затронутые группы"""
+        ids, created, prices, samples = [], [], [], []
+        seen = set()
+        for order_id, created_at, updated_at, price, package_type, from_address, to_address in rows:
+            seen.add(order_id)
+            if self.watermark is None or updated_at > self.watermark:
+                self.watermark = updated_at
+            if price is None or price <= 0 or created_at < cutoff:
+                continue
+            ids.append(order_id)
+            created.append(created_at.timestamp())
+            prices.append(float(price))
+            samples.append((package_type, from_address, to_address))
+        distances = self._distances([sample[1] for sample in samples], [sample[2] for sample in samples])
+        codes = [
+            [self._code(key) for key in group_keys(*sample, km)]
+            for sample, km in zip(samples, distances.tolist())
+        ]
+
+        # Старые версии измененных заказов и заказы старше окна выпадают из выборки
+        stale = np.isin(self._ids, np.fromiter(seen, dtype=np.int64, count=len(seen))) | (
+            self._created < cutoff.timestamp()
+        )
+        dirty = np.unique(self._codes[stale]) if stale.any() else np.empty(0, dtype=np.int64)
+        keep = ~stale
+        new_codes = np.asarray(codes, dtype=np.int64).reshape(-1, len(LEVELS))
+        self._ids = np.concatenate([self._ids[keep], np.asarray(ids, dtype=np.int64)])
+        self._created = np.concatenate([self._created[keep], np.asarray(created, dtype=np.float64)])
+        self._prices = np.concatenate([self._prices[keep], np.asarray(prices, dtype=np.float64)])
+        self._codes = np.concatenate([self._codes[keep], new_codes])
+        dirty = np.union1d(dirty, new_codes.ravel())
+        if len(dirty):
+            self._recompute(dirty)
+        return len(seen)
+
+    def _recompute(self, dirty):
+        counts, values = self._table
+        size = len(self._groups)
+        counts = np.concatenate([counts, np.zeros(size - len(counts), dtype=np.int64)])
+        values = np.concatenate([values, np.zeros((size - len(values), len(QUANTILES)))])
+        counts[dirty] = 0
+        # Пары (группа, цена) по всем уровням, только для затронутых групп
+        flat_codes = self._codes.ravel()
+        mask = np.isin(flat_codes, dirty)
+        if mask.any():
+            flat_prices = np.repeat(self._prices, len(LEVELS))
+            group_codes, group_counts, group_values = group_quantiles(flat_codes[mask], flat_prices[mask])
+            counts[group_codes] = group_counts
+            values[group_codes] = group_values
+        # Подмена одной ссылкой: suggest() всегда видит согласованную таблицу
+        self._table = (counts, values)
+
+    def rebuild(self):
+        """Полная загрузка истории (рабочая таблица и архив)"""
+        started = timezone.now()
+        cutoff = started - timedelta(days=self.days)
+        self.watermark = None
+        self._ids = self._ids[:0]
+        self._created = self._created[:0]
+        self._prices = self._prices[:0]
+        self._codes = self._codes[:0]
+        recent = Q(created_at__gte=cutoff, price__isnull=False)
+        loaded = self._apply(self._rows(ArchivedOrder, recent), cutoff)
+        loaded += self._apply(self._rows(Order, recent), cutoff)
+        if self.watermark is None:
+            self.watermark = started
+        return loaded
+
+    def refresh(self, lag=60):
+        """
+        Догружает заказы, измененные после отметки. Окно lag секунд перекрывается с прошлым
+        обновлением, чтобы не потерять транзакции, зафиксированные позже своего updated_at.
+        """
+        if self.watermark is None:
+            return self.rebuild()
+        cutoff = timezone.now() - timedelta(days=self.days)
+        changed = Q(updated_at__gt=self.watermark - timedelta(seconds=lag))
+        return self._apply(self._rows(Order, changed), cutoff)
+
+    def suggest(self, package_type, from_address, to_address, order_id=None):
+        """Подсказка цены или None, если похожих заказов мало"""
+        counts, values = self._table
+        km = self.locations.route_km(order_id) if self.locations and order_id is not None else None
+        if km is None:
+            km = float(self._distances([from_address], [to_address])[0])
+        for key in group_keys(package_type, from_address, to_address, km):
+            if None in key:
+                continue
+            code = self._groups.get(key)
+            if code is None or code >= len(counts) or counts[code] < self.min_orders:
+                continue
+            low, median, high = (self._round(value) for value in values[code])
+            return Suggestion(median, low, high, int(counts[code]), key[0])
+        return None
+
+    def _round(self, value):
+        steps = (Decimal(str(value)) / self.step).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+        return max(steps, Decimal('1')) * self.step
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        while True:
+            try:
+                await sync_to_async(self.refresh)()
+            except Exception as e:
+                print(f"Ошибка при обновлении подсказок цен: {e}")
+            await asyncio.sleep(self.interval)
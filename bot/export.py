@@ -0,0 +1,88 @@
+import csv
+import heapq
+import json
+import zlib
+
+from .models import Order
+
+
+# Потоковая выгрузка заказов. Строки читаются курсором на стороне сервера
+# (iterator(chunk_size=...)) и сразу кодируются, поэтому память не зависит от диапазона.
+# Заказы и архив выгружаются вместе слиянием двух упорядоченных потоков.
+
+EXPORT_FIELDS = tuple(field.attname for field in Order._meta.concrete_fields)
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+
+
+ORDER_KEY = (EXPORT_FIELDS.index('created_at'), EXPORT_FIELDS.index('id'))
+
+
+def export_rows(queryset, chunk_size=CHUNK_SIZE):
+    """Строки выгрузки по (created_at, id); queryset — один или список (Order и ArchivedOrder)"""
+    querysets = queryset if isinstance(queryset, (list, tuple)) else [queryset]
+    streams = [
+        qs.order_by('created_at', 'id').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+        for qs in querysets
+    ]
+    if len(streams) == 1:
+        return streams[0]
+    created, pk = ORDER_KEY
+    return heapq.merge(*streams, key=lambda row: (row[created], row[pk]))
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False, default=str) + '\n'
+
+
+def _batched(lines):
+    # Склеиваем строки в блоки ~64 КБ, чтобы не отдавать ответ по одной строке
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            yield ''.join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 — формат gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(queryset, fmt='csv', gzip=False):
+    """Итератор байтов выгрузки в формате csv или ndjson"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    rows = export_rows(queryset)
+    lines = _csv_lines(rows) if fmt == 'csv' else _ndjson_lines(rows)
+    chunks = _batched(lines)
+    return _gzipped(chunks) if gzip else chunks
+
+
+def export_filename(fmt, gzip=False):
+    return f"orders.{fmt}{'.gz' if gzip else ''}"
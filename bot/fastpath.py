@@ -0,0 +1,83 @@
+from decimal import Decimal
+from functools import lru_cache
+
+from django.db import models
+from django.utils import timezone
+
+from .models import Order
+
+
+# Быстрое чтение заказов для API: данные берутся из values() и переводятся в JSON-совместимые
+# значения по заранее вычисленному плану, без экземпляров модели и сериализаторов DRF.
+# Формат ответа совпадает с OrderSerializer.
+
+def _datetime(value):
+    value = timezone.localtime(value) if timezone.is_aware(value) else value
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _decimal(places):
+    quantum = Decimal(1).scaleb(-places)
+
+    def convert(value):
+        return str(value.quantize(quantum))
+    return convert
+
+
+def _photo_url(storage):
+    def convert(value):
+        return storage.url(value) if value else None
+    return convert
+
+
+STATUS_LABELS = {value: str(label) for value, label in Order.STATUS_CHOICES}
+FILE_FIELDS = tuple(field.name for field in Order._meta.concrete_fields if isinstance(field, models.FileField))
+
+
+def _converter(field):
+    if field.get_internal_type() == 'DateTimeField':
+        return _datetime
+    if field.get_internal_type() == 'DecimalField':
+        return _decimal(field.decimal_places)
+    if isinstance(field, models.FileField):
+        return _photo_url(field.storage)
+    return None
+
+
+# (имя в ответе, столбец values(), преобразование или None)
+FULL_PLAN = tuple(
+    (field.name, field.attname, _converter(field)) for field in Order._meta.concrete_fields
+) + (('status_display', 'status', STATUS_LABELS.get),)
+
+
+@lru_cache(maxsize=64)
+def get_plan(requested=None):
+    """План сериализации для набора полей (None — все поля)"""
+    if requested is None:
+        return FULL_PLAN
+    return tuple(step for step in FULL_PLAN if step[0] in requested)
+
+
+def plan_columns(plan):
+    return tuple(dict.fromkeys(column for _, column, _ in plan))
+
+
+def serialize_row(plan, row, build_url=None):
+    data = {}
+    for name, column, convert in plan:
+        value = row[column]
+        if value is not None and convert is not None:
+            value = convert(value)
+        data[name] = value
+    if build_url is not None:
+        for name in FILE_FIELDS:
+            if data.get(name):
+                data[name] = build_url(data[name])
+    return data
+
+
+def serialize_rows(plan, rows, build_url=None):
+    return [serialize_row(plan, row, build_url) for row in rows]
@@ -0,0 +1,77 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Order
+
+
+def parse_moment(value, end_of_day=False):
+    """
+    Граница диапазона по created_at из YYYY-MM-DD или ISO 8601.
+    Дата без времени превращается в начало дня (или начало следующего дня для end_of_day),
+    чтобы сравнение шло по индексу, а не по created_at::date.
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Неверная дата: {value}")
+        if end_of_day:
+            day += timedelta(days=1)
+        moment = datetime.combine(day, time.min)
+    elif end_of_day:
+        moment += timedelta(microseconds=1)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class OrderFilterBackend(BaseFilterBackend):
+    """
+    Фильтры списка заказов:
+    ?status=paid,assigned  ?user_id=..  ?courier_id=..  ?created_after=..  ?created_before=..
+    Даты принимаются в формате YYYY-MM-DD или ISO 8601.
+    """
+
+    STATUSES = {value for value, _ in Order.STATUS_CHOICES}
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        status = params.get('status')
+        if status:
+            statuses = [s.strip() for s in status.split(',') if s.strip()]
+            unknown = set(statuses) - self.STATUSES
+            if unknown:
+                raise ValidationError({'status': f"Неизвестный статус: {', '.join(sorted(unknown))}"})
+            queryset = queryset.filter(status__in=statuses)
+
+        for name in ('user_id', 'courier_id'):
+            value = params.get(name)
+            if value:
+                try:
+                    queryset = queryset.filter(**{name: int(value)})
+                except ValueError:
+                    raise ValidationError({name: 'Ожидается целое число'})
+
+        created_after = self._parse_moment(params, 'created_after')
+        if created_after is not None:
+            queryset = queryset.filter(created_at__gte=created_after)
+        created_before = self._parse_moment(params, 'created_before', end_of_day=True)
+        if created_before is not None:
+            queryset = queryset.filter(created_at__lt=created_before)
+
+        return queryset
+
+    @staticmethod
+    def _parse_moment(params, name, end_of_day=False):
+        value = params.get(name)
+        if not value:
+            return None
+        try:
+            return parse_moment(value, end_of_day)
+        except ValueError:
+            raise ValidationError({name: 'Ожидается дата YYYY-MM-DD или ISO 8601'})
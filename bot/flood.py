@@ -0,0 +1,125 @@
+import time
+from collections import Counter
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message
+
+from .ratelimit import TokenBucket
+
+
+# Защита от потока сообщений одного пользователя. Проверка идет до фильтров и обработчиков,
+# поэтому отброшенное сообщение не доходит ни до FSM, ни до скачивания фото, ни до БД.
+# У каждого пользователя свое ведро токенов; фото и документы дороже текста. Одинаковые
+# сообщения (текст, фото, нажатие кнопки) в течение dedupe_window секунд считаются одним.
+
+def _fingerprint(event):
+    """Что считать «тем же самым» сообщением или нажатием"""
+    if isinstance(event, CallbackQuery):
+        return 'callback', event.data
+    if event.photo:
+        return 'photo', event.photo[-1].file_unique_id
+    if event.document:
+        return 'document', event.document.file_unique_id
+    if event.text is not None:
+        return 'text', event.text
+    return None
+
+
+class FloodControlMiddleware(BaseMiddleware):
+    """
+    Внешний middleware для сообщений и нажатий кнопок. Пользователю, упершемуся в лимит,
+    бот отвечает не чаще раза в notice_interval секунд; повторы отбрасываются молча.
+    Сообщения из exempt_chats (группы операторов и курьеров) не ограничиваются.
+    """
+
+    def __init__(self, rate=1.0, burst=5, media_cost=2.0, dedupe_window=3.0,
+                 notice_interval=30.0, exempt_chats=(), max_users=10000):
+        self.rate = rate
+        self.burst = burst
+        self.media_cost = media_cost
+        self.dedupe_window = dedupe_window
+        self.notice_interval = notice_interval
+        self.exempt_chats = frozenset(exempt_chats)
+        self.max_users = max_users
+        self.buckets = {}
+        self.recent = {}   # (user_id, отпечаток) -> время последнего такого сообщения
+        self.noticed = {}  # user_id -> время последнего предупреждения
+        self.passed = Counter()
+        self.dropped = Counter()
+        self.offenders = Counter()
+
+    def _bucket(self, user_id):
+        bucket = self.buckets.get(user_id)
+        if bucket is None:
+            if len(self.buckets) >= self.max_users:
+                self._sweep(time.monotonic())
+            bucket = self.buckets[user_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _sweep(self, now):
+        # Полное ведро ничем не отличается от нового — такие можно забыть
+        full = self.burst / self.rate
+        self.buckets = {
+            user_id: bucket for user_id, bucket in self.buckets.items() if now - bucket.updated < full
+        }
+        self.recent = {key: seen for key, seen in self.recent.items() if now - seen < self.dedupe_window}
+        self.noticed = {user_id: seen for user_id, seen in self.noticed.items() if now - seen < self.notice_interval}
+
+    def check(self, user_id, fingerprint, cost=1.0):
+        """None — пропустить, иначе причина отказа: 'duplicate' или 'rate'"""
+        now = time.monotonic()
+        if fingerprint is not None:
+            key = (user_id, fingerprint)
+            seen = self.recent.get(key)
+            self.recent[key] = now
+            if seen is not None and now - seen < self.dedupe_window:
+                return 'duplicate'
+            if len(self.recent) > 4 * self.max_users:
+                self._sweep(now)
+        if not self._bucket(user_id).take(cost):
+            return 'rate'
+        return None
+
+    async def __call__(self, handler, event, data):
+        user = event.from_user
+        chat = event.message.chat if isinstance(event, CallbackQuery) and event.message else getattr(event, 'chat', None)
+        if user is None or (chat is not None and chat.id in self.exempt_chats):
+            return await handler(event, data)
+
+        kind = 'callback' if isinstance(event, CallbackQuery) else 'message'
+        media = isinstance(event, Message) and bool(event.photo or event.document or event.video)
+        reason = self.check(user.id, _fingerprint(event), self.media_cost if media else 1.0)
+        if reason is None:
+            self.passed[kind] += 1
+            return await handler(event, data)
+
+        self.dropped[(kind, reason)] += 1
+        self.offenders[user.id] += 1
+        await self._notify(event, user.id, reason)
+        return None
+
+    async def _notify(self, event, user_id, reason):
+        try:
+            if isinstance(event, CallbackQuery):
+                # Иначе у пользователя будут «крутиться часики» на кнопке
+                await event.answer("⏳ Подождите немного" if reason == 'rate' else None)
+                return
+            if reason != 'rate':
+                return
+            now = time.monotonic()
+            if now - self.noticed.get(user_id, -self.notice_interval) < self.notice_interval:
+                return
+            self.noticed[user_id] = now
+            print(f"Пользователь {user_id} превысил лимит сообщений")
+            await event.answer("⏳ Слишком много сообщений подряд. Подождите немного и повторите.")
+        except Exception as e:
+            print(f"Ошибка при ответе на лишнее сообщение: {e}")
+
+    def stats(self, top=5):
+        """Счетчики для /flood: пропущено, отброшено по причинам, самые активные нарушители"""
+        return {
+            'passed': dict(self.passed),
+            'dropped': {f"{kind}:{reason}": count for (kind, reason), count in self.dropped.items()},
+            'offenders': self.offenders.most_common(top),
+            'tracked_users': len(self.buckets),
+        }
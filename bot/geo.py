@@ -0,0 +1,297 @@
+import asyncio
+import csv
+import math
+import os
+import threading
+from difflib import get_close_matches
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .addresses import address_tokens
+
+
+# Геокодирование без внешних сервисов: адрес из свободного текста сопоставляется с локальным
+# справочником улиц и ориентиров города (CSV: name,lat,lon,aliases; синонимы через «|»).
+# Точность — центр улицы или ориентира, этого достаточно для оценки расстояний и выбора
+# ближайшего курьера. Для поиска соседей — сетка с ячейками cell_km и векторный haversine.
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+_lock = threading.Lock()
+_gazetteer = None
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Расстояние по большому кругу в км; принимает числа или массивы NumPy одинаковой формы"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class Gazetteer:
+    """Справочник улиц и ориентиров: нечеткое сопоставление адреса с точкой"""
+
+    def __init__(self, entries=(), min_score=0.6, similarity=0.8):
+        # entries: (название, lat, lon, [синонимы])
+        self.min_score = min_score
+        self.similarity = similarity
+        self.names = []
+        self.points = []
+        self._by_token = {}
+        self._name_tokens = []
+        self._cache = {}
+        for name, lat, lon, aliases in entries:
+            self.add(name, lat, lon, aliases)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with open(path, encoding='utf-8', newline='') as f:
+            entries = [
+                (row['name'], float(row['lat']), float(row['lon']),
+                 [alias for alias in (row.get('aliases') or '').split('|') if alias.strip()])
+                for row in csv.DictReader(f)
+                if row.get('name') and row.get('lat') and row.get('lon')
+            ]
+        return cls(entries, **kwargs)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, lat, lon, aliases=()):
+        index = len(self.names)
+        self.names.append(name)
+        self.points.append((lat, lon))
+        # Каждое название и синоним — отдельный набор слов, указывающий на ту же точку
+        for variant in (name, *aliases):
+            tokens = frozenset(address_tokens(variant))
+            if not tokens:
+                continue
+            self._name_tokens.append((index, tokens))
+            for token in tokens:
+                self._by_token.setdefault(token, set()).add(len(self._name_tokens) - 1)
+        self._cache.clear()
+
+    def _matches(self, token):
+        """Слова справочника, совпадающие с token точно или с опечаткой: [(слово, сходство)]"""
+        if token in self._by_token:
+            return [(token, 1.0)]
+        if token[0].isdigit():
+            # Номер микрорайона с «опечаткой» — это другой микрорайон
+            return []
+        close = get_close_matches(token, self._by_token.keys(), n=3, cutoff=self.similarity)
+        return [(word, self.similarity) for word in close]
+
+    def geocode(self, address):
+        """Адрес -> (lat, lon, название) или None, если уверенного совпадения нет"""
+        # Кэш общий для цикла событий и rebuild() в потоке: clear() может случиться между
+        # записью и чтением, поэтому результат возвращается из локальной переменной
+        try:
+            return self._cache[address]
+        except KeyError:
+            pass
+        point = self._geocode(address)
+        if len(self._cache) >= 10000:
+            self._cache.clear()
+        self._cache[address] = point
+        return point
+
+    def _geocode(self, address):
+        tokens = address_tokens(address)
+        if not tokens:
+            return None
+        scores = {}
+        for token in set(tokens):
+            for word, weight in self._matches(token):
+                for variant in self._by_token[word]:
+                    scores[variant] = scores.get(variant, 0.0) + weight
+        best, best_score = None, 0.0
+        for variant, matched in scores.items():
+            index, name_tokens = self._name_tokens[variant]
+            # Доля совпавших слов названия; при равенстве выигрывает более длинное название
+            score = matched / len(name_tokens) + 0.01 * len(name_tokens)
+            if score > best_score:
+                best, best_score = index, score
+        if best is None or best_score < self.min_score:
+            return None
+        lat, lon = self.points[best]
+        return lat, lon, self.names[best]
+
+    def distance(self, from_address, to_address):
+        """Расстояние между адресами по прямой (км) или None"""
+        start, end = self.geocode(from_address), self.geocode(to_address)
+        if start is None or end is None:
+            return None
+        return float(haversine(start[0], start[1], end[0], end[1]))
+
+    def geocode_many(self, addresses):
+        """Массивы (lat, lon) для списка адресов; ненайденные — NaN"""
+        coords = np.full((len(addresses), 2), np.nan)
+        for i, address in enumerate(addresses):
+            point = self.geocode(address)
+            if point is not None:
+                coords[i] = point[:2]
+        return coords[:, 0], coords[:, 1]
+
+
+def get_gazetteer():
+    """Справочник из settings.GAZETTEER_PATH; без файла — пустой (геокодирование выключено)"""
+    global _gazetteer
+    with _lock:
+        if _gazetteer is None:
+            path = settings.GAZETTEER_PATH
+            if path and os.path.exists(path):
+                try:
+                    _gazetteer = Gazetteer.load(path)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Ошибка при загрузке справочника адресов {path}: {e}")
+                    _gazetteer = Gazetteer()
+            else:
+                _gazetteer = Gazetteer()
+        return _gazetteer
+
+
+class GridIndex:
+    """
+    Пространственный индекс: точки раскладываются по ячейкам примерно cell_km x cell_km.
+    Поиск в радиусе смотрит только соседние ячейки, расстояния до кандидатов считаются векторно.
+    """
+
+    def __init__(self, ids, lats, lons, cell_km=0.5):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.cell_km = cell_km
+        origin = float(np.mean(self.lats)) if len(self.lats) else 0.0
+        self.dlat = cell_km / KM_PER_DEGREE
+        self.dlon = cell_km / (KM_PER_DEGREE * max(math.cos(math.radians(origin)), 0.01))
+        self._cells = {}
+        rows = np.floor(self.lats / self.dlat).astype(np.int64)
+        cols = np.floor(self.lons / self.dlon).astype(np.int64)
+        for i, cell in enumerate(zip(rows.tolist(), cols.tolist())):
+            self._cells.setdefault(cell, []).append(i)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.dlat), math.floor(lon / self.dlon)
+
+    def _ring(self, lat, lon, rings):
+        row, col = self._cell(lat, lon)
+        found = []
+        for r in range(row - rings, row + rings + 1):
+            for c in range(col - rings, col + rings + 1):
+                found.extend(self._cells.get((r, c), ()))
+        return np.asarray(found, dtype=np.int64)
+
+    def within(self, lat, lon, radius_km):
+        """[(id, км)] точек не дальше radius_km, по возрастанию расстояния"""
+        candidates = self._ring(lat, lon, math.ceil(radius_km / self.cell_km))
+        if not len(candidates):
+            return []
+        distances = haversine(lat, lon, self.lats[candidates], self.lons[candidates])
+        mask = distances <= radius_km
+        order = np.argsort(distances[mask])
+        return list(zip(self.ids[candidates][mask][order].tolist(), distances[mask][order].tolist()))
+
+    def nearest(self, lat, lon, k=1, max_km=50.0):
+        """k ближайших точек [(id, км)]: ячейки просматриваются расширяющимися кольцами"""
+        if not len(self.ids):
+            return []
+        rings = 1
+        while True:
+            candidates = self._ring(lat, lon, rings)
+            reach = rings * self.cell_km
+            if len(candidates) >= k or reach >= max_km:
+                distances = haversine(lat, lon, self.lats[candidates], self.lons[candidates])
+                order = np.argsort(distances)[:k]
+                # Кольца гарантируют полноту только в пределах reach — иначе расширяемся дальше
+                if reach >= max_km or distances[order[-1]] <= reach:
+                    order = order[distances[order] <= max_km]
+                    return list(zip(self.ids[candidates][order].tolist(), distances[order].tolist()))
+            rings *= 2
+
+
+class ActiveOrderIndex:
+    """
+    Координаты точек забора и доставки активных заказов с индексом по точкам забора.
+    Перестраивается фоновой задачей каждые interval секунд (активных заказов немного).
+    Готовые координаты и расстояния берут распределение курьеров и подсказки цен.
+    """
+
+    STATUSES = ('pending', 'confirmed', 'paid', 'waiting_courier', 'assigned', 'in_progress')
+
+    def __init__(self, gazetteer=None, cell_km=0.5, interval=30.0):
+        self.gazetteer = gazetteer
+        self.cell_km = cell_km
+        self.interval = interval
+        self.pickups = GridIndex([], [], [], cell_km)
+        self.points = {}
+        self._task = None
+
+    def rebuild(self):
+        from .models import Order
+
+        gazetteer = self.gazetteer or get_gazetteer()
+        rows = list(Order.objects.filter(status__in=self.STATUSES).values_list('id', 'from_address', 'to_address'))
+        from_lat, from_lon = gazetteer.geocode_many([row[1] for row in rows])
+        to_lat, to_lon = gazetteer.geocode_many([row[2] for row in rows])
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        distances = haversine(from_lat, from_lon, to_lat, to_lon)
+        points = {
+            int(order_id): (a_lat, a_lon, b_lat, b_lon, km)
+            for order_id, a_lat, a_lon, b_lat, b_lon, km in zip(
+                ids.tolist(), from_lat.tolist(), from_lon.tolist(), to_lat.tolist(), to_lon.tolist(), distances.tolist()
+            )
+        }
+        known = ~np.isnan(from_lat)
+        # Подмена ссылками: читатели видят либо старый, либо новый индекс целиком
+        self.pickups = GridIndex(ids[known], from_lat[known], from_lon[known], self.cell_km)
+        self.points = points
+        return len(rows)
+
+    def pickup(self, order_id):
+        """Точка забора (lat, lon) или None"""
+        point = self.points.get(order_id)
+        return None if point is None or math.isnan(point[0]) else point[:2]
+
+    def route_km(self, order_id):
+        """Расстояние от забора до доставки по прямой или None"""
+        point = self.points.get(order_id)
+        return None if point is None or math.isnan(point[4]) else point[4]
+
+    def pickups_near(self, lat, lon, radius_km):
+        """Активные заказы с точкой забора в радиусе: [(order_id, км)]"""
+        return self.pickups.within(lat, lon, radius_km)
+
+    def nearby_orders(self, order_id, radius_km=1.0):
+        """Заказы, которые можно забрать вместе с order_id: [(order_id, км)]"""
+        point = self.points.get(order_id)
+        if point is None or math.isnan(point[0]):
+            return []
+        return [item for item in self.pickups_near(point[0], point[1], radius_km) if item[0] != order_id]
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        while True:
+            try:
+                await sync_to_async(self.rebuild)()
+            except Exception as e:
+                print(f"Ошибка при обновлении индекса адресов: {e}")
+            await asyncio.sleep(self.interval)
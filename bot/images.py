@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.db.models import F, Q
+
+from . import derivatives
+from .models import Order
+from .storage import ContentAddressedStorage
+
+
+# Производные фото заказа (миниатюра и сжатая WebP-копия) для админки и API.
+# Пиксели обрабатываются в пуле процессов (derivatives.render), чтение и запись файлов
+# и обновление заказа — в вызывающем потоке.
+
+DERIVED_DIR = 'orders/derived'
+FIELDS = {'thumb': 'photo_thumb', 'web': 'photo_web'}
+
+_lock = threading.Lock()
+_process_pool = None
+_scheduler = None
+
+
+def get_process_pool():
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            # spawn, а не fork: процесс многопоточный (бот, пулы записи), а fork копирует
+            # чужие блокировки. derivatives не зависит от Django, так что запуск дешевый
+            _process_pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _process_pool
+
+
+def derived_name(photo_name, kind):
+    stem = os.path.splitext(os.path.basename(photo_name))[0]
+    return f"{DERIVED_DIR}/{stem}_{kind}.webp"
+
+
+def _read(storage, name):
+    with storage.open(name, 'rb') as f:
+        return f.read()
+
+
+def generate_for_orders(order_ids, model=Order, force=False):
+    """
+    Строит производные для заказов с фото. Без force пропускает заказы, у которых они уже есть.
+    Возвращает (обработано, ошибок).
+    """
+    queryset = model.objects.filter(pk__in=order_ids).exclude(photo='').exclude(photo__isnull=True)
+    if not force:
+        queryset = queryset.filter(Q(photo_thumb='') | Q(photo_thumb__isnull=True))
+    rows = list(queryset.values_list('pk', 'photo', *FIELDS.values()))
+    if not rows:
+        return 0, 0
+
+    storage = model._meta.get_field('photo').storage
+    pool = get_process_pool()
+    futures = []
+    for pk, photo, *old in rows:
+        try:
+            futures.append((pk, photo, old, pool.submit(derivatives.render, _read(storage, photo))))
+        except OSError as e:
+            print(f"Не удалось прочитать фото заказа #{pk}: {e}")
+
+    done, failed = 0, len(rows) - len(futures)
+    for pk, photo, old, future in futures:
+        try:
+            rendered = future.result()
+        except Exception as e:
+            print(f"Ошибка при обработке фото заказа #{pk}: {e}")
+            failed += 1
+            continue
+        changes = {}
+        for kind, data in rendered.items():
+            name = derived_name(photo, kind)
+            if storage.exists(name):
+                storage.delete(name)
+            changes[FIELDS[kind]] = storage.save(name, ContentFile(data))
+        # updated_at не трогаем: это не изменение заказа, а бэкфилл не должен сдвигать
+        # срок архивации и отсчет напоминаний
+        model.objects.filter(pk=pk).update(**changes, updated_at=F('updated_at'))
+        # Прежние производные больше не нужны. В хранилище по содержимому то же имя
+        # означает лишнюю ссылку, которую тоже нужно снять
+        previous = dict(zip(FIELDS.values(), old))
+        for field, new_name in changes.items():
+            old_name = previous[field]
+            if old_name and (old_name != new_name or isinstance(storage, ContentAddressedStorage)):
+                storage.delete(old_name)
+        done += 1
+    return done, failed
+
+
+def _generate_in_background(order_ids, model, force):
+    try:
+        generate_for_orders(order_ids, model, force)
+    except Exception as e:
+        print(f"Ошибка при построении производных фото: {e}")
+    finally:
+        close_old_connections()
+
+
+def schedule(order_ids, model=Order, force=False):
+    """Строит производные в фоне, не задерживая запрос или обработчик"""
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = ThreadPoolExecutor(max_workers=1, thread_name_prefix='photo-derivatives')
+    return _scheduler.submit(_generate_in_background, list(order_ids), model, force)
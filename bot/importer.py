@@ -0,0 +1,173 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Order, normalize_phone
+
+
+# Массовая загрузка исторических заказов: потоковая проверка строк и загрузка пачками
+# через COPY (Postgres) или bulk_create (остальные СУБД).
+
+IMPORT_FIELDS = tuple(
+    field for field in Order._meta.concrete_fields if field.name not in ('id', 'intake_key')
+)
+FIELDS_BY_NAME = {field.name: field for field in Order._meta.concrete_fields}
+REQUIRED = ('user_id', 'from_address', 'to_address', 'phone', 'package_type')
+
+
+class RowError(Exception):
+    def __init__(self, line, message):
+        super().__init__(f"строка {line}: {message}")
+        self.line = line
+
+
+def read_records(stream, fmt):
+    """Итератор (номер строки, запись) из CSV (dict) или NDJSON (текст строки, разбирается в clean_record)"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if line:
+                yield line_no, line
+
+
+def clean_record(line, record):
+    """Проверяет и нормализует одну запись; возвращает dict значений полей модели"""
+    if isinstance(record, str):
+        # Строка NDJSON: ошибка разбора — ошибка этой строки, а не всей загрузки
+        try:
+            record = json.loads(record)
+        except ValueError as e:
+            raise RowError(line, f"неверный JSON: {e}")
+        if not isinstance(record, dict):
+            raise RowError(line, "ожидается объект JSON")
+    unknown = set(record) - set(FIELDS_BY_NAME)
+    if unknown:
+        raise RowError(line, f"неизвестные поля {', '.join(sorted(unknown))}")
+    for name in REQUIRED:
+        if record.get(name) in (None, ''):
+            raise RowError(line, f"не заполнено поле {name}")
+
+    values = {}
+    for name, raw in record.items():
+        field = FIELDS_BY_NAME[name]
+        if raw == '' and field.null:
+            raw = None
+        try:
+            value = field.clean(raw, None)
+        except ValidationError as e:
+            raise RowError(line, f"{name}: {'; '.join(e.messages)}")
+        if value is not None and field.get_internal_type() == 'DateTimeField' and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        values[name] = value
+
+    values['phone_normalized'] = normalize_phone(values['phone'])
+    values.setdefault('status', 'completed')
+    values.setdefault('created_at', timezone.now())
+    values.setdefault('updated_at', values['created_at'])
+    if values.get('client_score') is not None and not 1 <= values['client_score'] <= 5:
+        raise RowError(line, "client_score должен быть от 1 до 5")
+    return values
+
+
+def validated(records, errors, max_errors):
+    """Потоковая проверка: неверные строки попадают в errors, пока их не больше max_errors"""
+    with_ids = None
+    for line, record in records:
+        try:
+            values = clean_record(line, record)
+            # id либо заданы у всех строк (сохраняем старые номера), либо ни у одной
+            has_id = values.get('id') is not None
+            if with_ids is None:
+                with_ids = has_id
+            elif has_id != with_ids:
+                raise RowError(line, "id должен быть указан либо во всех строках, либо ни в одной")
+            if not has_id:
+                values.pop('id', None)
+            yield values
+        except (RowError, ValueError, TypeError) as e:
+            errors.append(e if isinstance(e, RowError) else RowError(line, str(e)))
+            if len(errors) > max_errors:
+                raise RowError(line, f"слишком много ошибок ({len(errors)}), загрузка остановлена")
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _columns(batch):
+    names = ['id'] if 'id' in batch[0] else []
+    return names + [field.name for field in IMPORT_FIELDS]
+
+
+def _copy_batch(batch):
+    columns = _columns(batch)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for values in batch:
+        row = []
+        for name in columns:
+            value = values.get(name)
+            # В формате COPY csv пустое поле без кавычек — NULL
+            row.append('' if value is None else (value.isoformat() if hasattr(value, 'isoformat') else value))
+        writer.writerow(row)
+    buffer.seek(0)
+
+    table = connection.ops.quote_name(Order._meta.db_table)
+    column_sql = ', '.join(connection.ops.quote_name(FIELDS_BY_NAME[name].column) for name in columns)
+    sql = f"COPY {table} ({column_sql}) FROM STDIN WITH (FORMAT csv)"
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy'):  # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+        else:  # psycopg2
+            raw.copy_expert(sql, buffer)
+
+
+def load_batch(batch):
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            _copy_batch(batch)
+        else:
+            Order.objects.bulk_create([Order(**values) for values in batch], batch_size=500)
+
+
+def drop_secondary_indexes():
+    with connection.schema_editor() as editor:
+        for index in Order._meta.indexes:
+            editor.remove_index(Order, index)
+
+
+def create_secondary_indexes():
+    with connection.schema_editor() as editor:
+        for index in Order._meta.indexes:
+            editor.add_index(Order, index)
+
+
+def finish_import(reindex=False):
+    """Сбрасывает последовательность id и обновляет статистику планировщика"""
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Order]):
+            cursor.execute(sql)
+        table = connection.ops.quote_name(Order._meta.db_table)
+        if connection.vendor == 'postgresql':
+            if reindex:
+                cursor.execute(f"REINDEX TABLE {table}")
+            cursor.execute(f"ANALYZE {table}")
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f"ANALYZE {table}")
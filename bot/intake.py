@@ -0,0 +1,240 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from django.db import InterfaceError, OperationalError
+
+
+# Уровни нагрузки очереди (сигналы обратного давления для обработчиков)
+PRESSURE_OK = 'ok'
+PRESSURE_SLOW = 'slow'
+PRESSURE_FULL = 'full'
+
+
+# Ошибки, при которых повтор имеет смысл (БД недоступна, блокировка) — в отличие от ошибок
+# в самих данных, из-за которых запись не сохранится никогда
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+
+class QueueFull(Exception):
+    """Очередь переполнена — новые записи не принимаются"""
+
+
+class IntakeQueue:
+    """
+    Долговременная локальная очередь на SQLite (WAL) между Telegram и основной БД.
+    Обработчики пишут сюда, воркер пачками переносит записи в Postgres.
+    """
+
+    def __init__(self, path, soft_limit=200, hard_limit=5000):
+        self.path = path
+        self.soft_limit = soft_limit
+        self.hard_limit = hard_limit
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS intake ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL)"
+        )
+        # Записи, которые так и не удалось сохранить: лежат здесь для разбора, не блокируя очередь
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS intake_dead ("
+            " id INTEGER PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL,"
+            " error TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " failed_at REAL NOT NULL)"
+        )
+        self._depth = self._conn.execute("SELECT COUNT(*) FROM intake").fetchone()[0]
+
+    def depth(self):
+        return self._depth
+
+    def pressure(self):
+        if self._depth >= self.hard_limit:
+            return PRESSURE_FULL
+        if self._depth >= self.soft_limit:
+            return PRESSURE_SLOW
+        return PRESSURE_OK
+
+    def oldest_age(self):
+        """Возраст самой старой записи в секундах (задержка сохранения)"""
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(created_at) FROM intake").fetchone()
+        return time.time() - row[0] if row and row[0] else 0.0
+
+    def put(self, kind, payload):
+        if self._depth >= self.hard_limit:
+            raise QueueFull(f"В очереди {self._depth} записей")
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO intake (kind, payload, created_at) VALUES (?, ?, ?)",
+                (kind, json.dumps(payload, ensure_ascii=False), time.time())
+            )
+            self._depth += 1
+        return cursor.lastrowid
+
+    def peek(self, limit):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, payload FROM intake ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(row_id, kind, json.loads(payload)) for row_id, kind, payload in rows]
+
+    def ack(self, ids):
+        if not ids:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany("DELETE FROM intake WHERE id = ?", [(i,) for i in ids])
+            self._conn.execute("COMMIT")
+            self._depth = max(0, self._depth - len(ids))
+
+    def fail(self, row_id, error, max_attempts):
+        """
+        Засчитывает неудачную попытку сохранить запись. После max_attempts попыток запись
+        переносится в intake_dead. Возвращает True, если запись перенесена.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("UPDATE intake SET attempts = attempts + 1 WHERE id = ?", (row_id,))
+            cursor = self._conn.execute(
+                "INSERT INTO intake_dead (id, kind, payload, attempts, error, created_at, failed_at)"
+                " SELECT id, kind, payload, attempts, ?, created_at, ? FROM intake"
+                " WHERE id = ? AND attempts >= ?",
+                (error, time.time(), row_id, max_attempts)
+            )
+            buried = cursor.rowcount == 1
+            if buried:
+                self._conn.execute("DELETE FROM intake WHERE id = ?", (row_id,))
+                self._depth = max(0, self._depth - 1)
+            self._conn.execute("COMMIT")
+        return buried
+
+    def dead_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM intake_dead").fetchone()[0]
+
+    async def aput(self, kind, payload):
+        return await asyncio.to_thread(self.put, kind, payload)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class IntakeWorker:
+    """
+    Фоновый воркер: забирает записи из IntakeQueue пачками и передает их обработчикам по типу.
+    Если БД недоступна, записи остаются в очереди, а воркер повторяет попытку с нарастающей паузой.
+    Если пачка не сохранилась из-за самих данных, записи сохраняются по одной: запись, которая
+    не сохраняется max_attempts раз, уходит в intake_dead и больше не задерживает остальные.
+    Обработчики должны быть идемпотентными: падение между записью в БД и ack повторит пачку.
+    """
+
+    def __init__(self, queue, handlers, batch_size=100, interval=0.5, max_backoff=30.0, max_attempts=5):
+        self.queue = queue
+        self.handlers = handlers  # {kind: async callable(list[payload]) -> None}
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Последняя попытка сохранить то, что успели принять
+        try:
+            await self.drain_once()
+        except Exception as e:
+            print(f"Не удалось сохранить очередь при остановке: {e}")
+
+    async def run(self):
+        while True:
+            try:
+                processed = await self.drain_once()
+                self.failures = 0
+            except Exception as e:
+                self.failures += 1
+                delay = min(self.max_backoff, self.interval * (2 ** self.failures))
+                print(f"Ошибка при сохранении очереди (попытка {self.failures}): {e}")
+                await asyncio.sleep(delay)
+                continue
+
+            if processed < self.batch_size:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def drain_once(self):
+        batch = await asyncio.to_thread(self.queue.peek, self.batch_size)
+        if not batch:
+            return 0
+
+        by_kind = defaultdict(list)
+        for row_id, kind, payload in batch:
+            by_kind[kind].append((row_id, payload))
+
+        for kind, items in by_kind.items():
+            ids = [row_id for row_id, _ in items]
+            handler = self.handlers.get(kind)
+            if handler is None:
+                print(f"Неизвестный тип записи в очереди: {kind}")
+                await asyncio.to_thread(self.queue.ack, ids)
+                continue
+            try:
+                await handler([payload for _, payload in items])
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as e:
+                print(f"Ошибка при сохранении пачки '{kind}' ({len(items)} записей), сохраняем по одной: {e}")
+                await self._drain_one_by_one(kind, handler, items)
+                continue
+            await asyncio.to_thread(self.queue.ack, ids)
+
+        return len(batch)
+
+    async def _drain_one_by_one(self, kind, handler, items):
+        for row_id, payload in items:
+            try:
+                await handler([payload])
+            except TRANSIENT_ERRORS:
+                raise
+            except Exception as e:
+                if await asyncio.to_thread(self.queue.fail, row_id, f"{type(e).__name__}: {e}", self.max_attempts):
+                    print(f"Запись очереди #{row_id} ('{kind}') не сохранена после {self.max_attempts} попыток "
+                          f"и перенесена в intake_dead: {e}")
+                continue
+            await asyncio.to_thread(self.queue.ack, [row_id])
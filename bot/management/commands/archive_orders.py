@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from zudrasonbot.bot.api_cache import bump_version
+from zudrasonbot.bot.archive import CLOSED_STATUSES, archive_orders
+
+
+class Command(BaseCommand):
+    help = 'Переносит закрытые заказы старше N дней в архивную таблицу (пачками, без долгих блокировок)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Сколько дней заказ не менялся (по умолчанию 7)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--status', default=','.join(CLOSED_STATUSES),
+                            help='Статусы через запятую (по умолчанию completed,cancelled)')
+        parser.add_argument('--pause', type=float, default=0.0, help='Пауза между пачками, сек')
+        parser.add_argument('--limit', type=int, help='Не больше N заказов за запуск')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        moved = archive_orders(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            statuses=tuple(s.strip() for s in options['status'].split(',') if s.strip()),
+            pause=options['pause'],
+            limit=options['limit'],
+        )
+        if moved:
+            bump_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"В архив перенесено заказов: {moved} за {time.monotonic() - started:.1f} с"
+        ))
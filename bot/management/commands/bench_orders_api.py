@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from zudrasonbot.bot.fastpath import get_plan, plan_columns, serialize_rows
+from zudrasonbot.bot.models import Order
+from zudrasonbot.bot.renderers import ORJSONRenderer, orjson
+from zudrasonbot.bot.serializers import OrderSerializer
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает OrderSerializer + JSONRenderer с быстрым путем values() + orjson'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=200, help='Размер страницы списка')
+        parser.add_argument('--repeat', type=int, default=20, help='Число повторов (берется лучшее время)')
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        request = Request(APIRequestFactory().get('/api/orders/'))
+        build_url = request.build_absolute_uri
+        queryset = Order.objects.order_by('-created_at', '-id')
+
+        def default_path():
+            data = OrderSerializer(queryset[:limit], many=True, context={'request': request}).data
+            return JSONRenderer().render(data)
+
+        plan = get_plan(None)
+        columns = plan_columns(plan)
+
+        def fast_path():
+            rows = queryset.values(*columns)[:limit]
+            return ORJSONRenderer().render(serialize_rows(plan, rows, build_url))
+
+        count = queryset[:limit].count()
+        if not count:
+            self.stdout.write(self.style.WARNING('В базе нет заказов для замера.'))
+            return
+
+        self.stdout.write(f"Заказов на странице: {count}, повторов: {options['repeat']}, "
+                          f"orjson: {'да' if orjson else 'нет'}")
+        default_time = min(self._timed(default_path) for _ in range(options['repeat']))
+        fast_time = min(self._timed(fast_path) for _ in range(options['repeat']))
+        self.stdout.write(f"ModelSerializer + JSONRenderer: {default_time * 1000:8.2f} мс")
+        self.stdout.write(f"values() + план + orjson:       {fast_time * 1000:8.2f} мс "
+                          f"(x{default_time / fast_time:.1f} быстрее)")
+
+    @staticmethod
+    def _timed(func):
+        started = time.perf_counter()
+        func()
+        return time.perf_counter() - started
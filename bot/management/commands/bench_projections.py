@@ -0,0 +1,55 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from zudrasonbot.bot.models import Order
+from zudrasonbot.bot.projections import CourierCard, StatusCheck, project
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает загрузку полных моделей Order и узких проекций (время и память)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000, help='Сколько заказов читать за проход')
+        parser.add_argument('--repeat', type=int, default=5, help='Число повторов (берется лучшее время)')
+
+    def handle(self, *args, **options):
+        ids = list(Order.objects.order_by('-id').values_list('id', flat=True)[:options['limit']])
+        if not ids:
+            self.stdout.write(self.style.WARNING('В базе нет заказов для замера.'))
+            return
+
+        def full_models():
+            return [(o.id, o.status, o.from_address, o.photo) for o in Order.objects.filter(id__in=ids)]
+
+        cases = [('Order (полная модель)', full_models)]
+        for cls in (CourierCard, StatusCheck):
+            cases.append((cls.__name__, lambda cls=cls: list(project(cls, Order.objects.filter(id__in=ids)))))
+
+        self.stdout.write(f"Заказов за проход: {len(ids)}, повторов: {options['repeat']}")
+        baseline = None
+        for name, func in cases:
+            best = min(self._timed(func) for _ in range(options['repeat']))
+            peak = self._peak_memory(func)
+            if baseline is None:
+                baseline = (best, peak)
+            self.stdout.write(
+                f"{name:<24} {best * 1000:8.2f} мс  {peak / 1024:9.1f} КБ  "
+                f"(x{baseline[0] / best:.1f} быстрее, x{baseline[1] / max(peak, 1):.1f} меньше памяти)"
+            )
+
+    @staticmethod
+    def _timed(func):
+        started = time.perf_counter()
+        func()
+        return time.perf_counter() - started
+
+    @staticmethod
+    def _peak_memory(func):
+        tracemalloc.start()
+        try:
+            func()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,104 @@
+import asyncio
+import os
+
+from aiogram import Bot
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from zudrasonbot.bot.broadcast import (
+    MAX_TEXT_LENGTH,
+    Broadcast,
+    Checkpoint,
+    MessageRejected,
+    count_recipients,
+    text_digest
+)
+
+
+class Command(BaseCommand):
+    help = 'Рассылка сообщения всем клиентам с учетом лимитов Telegram (продолжается с места остановки)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--text', help='Текст сообщения')
+        parser.add_argument('--file', help='Файл с текстом сообщения (UTF-8)')
+        parser.add_argument('--html', action='store_true', help='Разметка HTML в тексте')
+        parser.add_argument('--checkpoint', help='Файл прогресса (по умолчанию var/broadcast-<хэш текста>.json)')
+        parser.add_argument('--restart', action='store_true', help='Начать заново, игнорируя сохраненный прогресс')
+        parser.add_argument('--rate', type=float, default=settings.BROADCAST_RATE,
+                            help='Сообщений в секунду (по умолчанию BROADCAST_RATE)')
+        parser.add_argument('--concurrency', type=int, default=20, help='Одновременных запросов к Telegram')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать получателей')
+        parser.add_argument('--preview-chat', type=int, default=settings.OPERATOR_GROUP_ID,
+                            help='Куда отправить пробное сообщение перед рассылкой (по умолчанию группа операторов)')
+
+    def handle(self, *args, **options):
+        if bool(options['text']) == bool(options['file']):
+            raise CommandError('Укажите текст: --text или --file')
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as f:
+                text = f.read().strip()
+        else:
+            text = options['text']
+        if not text:
+            raise CommandError('Пустой текст сообщения')
+        if len(text) > MAX_TEXT_LENGTH:
+            raise CommandError(f'Текст длиннее {MAX_TEXT_LENGTH} символов ({len(text)})')
+
+        digest = text_digest(text)
+        path = options['checkpoint'] or os.path.join(settings.BASE_DIR, 'var', f'broadcast-{digest}.json')
+        checkpoint = Checkpoint(digest)
+        if os.path.exists(path) and not options['restart']:
+            checkpoint = Checkpoint.load(path)
+            if checkpoint.digest != digest:
+                raise CommandError(f'Чекпоинт {path} сохранен для другого текста (--restart, чтобы начать заново)')
+            if checkpoint.done:
+                self.stdout.write(self.style.WARNING(f'Рассылка уже завершена: {self._summary(checkpoint)}'))
+                return
+            self.stdout.write(f'Продолжение с user_id > {checkpoint.after}: {self._summary(checkpoint)}')
+
+        remaining = count_recipients(checkpoint.after)
+        self.stdout.write(f'Получателей осталось: {remaining}, примерно {remaining / options["rate"]:.0f} с')
+        if options['dry_run']:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        try:
+            checkpoint = asyncio.run(self._run(text, checkpoint, path, options))
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(f'Рассылка прервана, прогресс сохранен в {path}'))
+            return
+        except MessageRejected as e:
+            raise CommandError(f'Telegram отклонил сообщение: {e}. Исправьте текст и запустите заново')
+        except RuntimeError as e:
+            raise CommandError(f'{e}. Прогресс сохранен в {path}, повторите запуск позже')
+        self.stdout.write(self.style.SUCCESS(f'Рассылка завершена: {self._summary(checkpoint)}'))
+
+    async def _run(self, text, checkpoint, path, options):
+        bot = Bot(token=settings.TOKEN)
+        reported = [checkpoint.sent]
+
+        def progress(state):
+            if state.sent - reported[0] >= 500:
+                reported[0] = state.sent
+                self.stdout.write(self._summary(state))
+
+        broadcast = Broadcast(
+            bot, text, checkpoint, path,
+            rate=options['rate'],
+            concurrency=options['concurrency'],
+            parse_mode='HTML' if options['html'] else None,
+            progress=progress,
+        )
+        try:
+            await broadcast.preview(options['preview_chat'])
+            return await broadcast.run()
+        finally:
+            await bot.session.close()
+
+    @staticmethod
+    def _summary(state):
+        speed = state.sent / state.elapsed if state.elapsed else 0.0
+        return (
+            f'отправлено {state.sent}, заблокировали бота {state.blocked}, ошибок {state.failed}, '
+            f'повторов {state.retries}, {state.elapsed:.0f} с ({speed:.1f} сообщ./с)'
+        )
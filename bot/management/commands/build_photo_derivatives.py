@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from zudrasonbot.bot.images import generate_for_orders
+from zudrasonbot.bot.models import ArchivedOrder, Order
+
+
+class Command(BaseCommand):
+    help = 'Строит миниатюры и WebP-копии фото для уже загруженных заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Перестроить и те, у которых производные уже есть')
+        parser.add_argument('--archived', action='store_true', help='Также заказы из архива')
+        parser.add_argument('--batch-size', type=int, default=100, help='Сколько фото обрабатывать за пачку')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        done = failed = 0
+        for model in (Order, ArchivedOrder) if options['archived'] else (Order,):
+            queryset = model.objects.exclude(photo='').exclude(photo__isnull=True)
+            if not options['force']:
+                queryset = queryset.filter(Q(photo_thumb='') | Q(photo_thumb__isnull=True))
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+            for start in range(0, len(ids), options['batch_size']):
+                batch_done, batch_failed = generate_for_orders(
+                    ids[start:start + options['batch_size']], model, force=options['force']
+                )
+                done += batch_done
+                failed += batch_failed
+                self.stdout.write(f"{model.__name__}: обработано {done}, ошибок {failed} из {len(ids)}")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: {done} фото за {elapsed:.1f} с ({done / max(elapsed, 0.001):.1f} фото/с), ошибок: {failed}"
+        ))
@@ -0,0 +1,63 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from zudrasonbot.bot.export import FORMATS, stream_export
+from zudrasonbot.bot.filters import parse_moment
+from zudrasonbot.bot.models import ArchivedOrder, Order
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка заказов в CSV/NDJSON (память не зависит от объема)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--status', help='Статусы через запятую, например delivered,completed')
+        parser.add_argument('--from', dest='date_from', help='Начало периода (YYYY-MM-DD или ISO 8601)')
+        parser.add_argument('--to', dest='date_to', help='Конец периода включительно')
+        parser.add_argument('--gzip', action='store_true', help='Сжать выгрузку gzip')
+        parser.add_argument('--output', '-o', help='Файл для записи (по умолчанию stdout)')
+        archive = parser.add_mutually_exclusive_group()
+        archive.add_argument('--include-archived', action='store_true',
+                             help='Вместе с архивом закрытых заказов (для полных отчетов за период)')
+        archive.add_argument('--archived-only', action='store_true', help='Только архив')
+
+    def _filtered(self, queryset, options):
+        if options['status']:
+            queryset = queryset.filter(status__in=[s.strip() for s in options['status'].split(',')])
+        try:
+            if options['date_from']:
+                queryset = queryset.filter(created_at__gte=parse_moment(options['date_from']))
+            if options['date_to']:
+                queryset = queryset.filter(created_at__lt=parse_moment(options['date_to'], end_of_day=True))
+        except ValueError as e:
+            raise CommandError(str(e))
+        return queryset
+
+    def handle(self, *args, **options):
+        if options['archived_only']:
+            models = (ArchivedOrder,)
+        elif options['include_archived']:
+            models = (Order, ArchivedOrder)
+        else:
+            models = (Order,)
+            if self._filtered(ArchivedOrder.objects.all(), options).exists():
+                self.stderr.write(self.style.WARNING(
+                    'Часть заказов за период уже в архиве и в выгрузку не попадет — добавьте --include-archived'
+                ))
+        queryset = [self._filtered(model.objects.all(), options) for model in models]
+
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        written = 0
+        try:
+            for chunk in stream_export(queryset, options['format'], options['gzip']):
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                out.close()
+            else:
+                out.flush()
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Выгружено {written} байт в {options['output']}"))
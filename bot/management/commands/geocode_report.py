@@ -0,0 +1,43 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from zudrasonbot.bot.addresses import normalize_address
+from zudrasonbot.bot.geo import get_gazetteer
+from zudrasonbot.bot.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Показывает, какая доля адресов заказов находится в справочнике, и частые ненайденные адреса'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Заказы за последние N дней (по умолчанию 30)')
+        parser.add_argument('--top', type=int, default=20, help='Сколько ненайденных адресов показать')
+
+    def handle(self, *args, **options):
+        gazetteer = get_gazetteer()
+        if not len(gazetteer):
+            self.stderr.write("Справочник адресов пуст: проверьте GAZETTEER_PATH")
+            return
+
+        since = timezone.now() - timedelta(days=options['days'])
+        rows = Order.objects.filter(created_at__gte=since).values_list('from_address', 'to_address')
+        total = found = 0
+        missing = Counter()
+        for addresses in rows.iterator(chunk_size=5000):
+            for address in addresses:
+                total += 1
+                if gazetteer.geocode(address) is not None:
+                    found += 1
+                else:
+                    missing[normalize_address(address) or address] += 1
+
+        share = found / total * 100 if total else 0
+        self.stdout.write(f"Записей в справочнике: {len(gazetteer)}")
+        self.stdout.write(f"Адресов найдено: {found} из {total} ({share:.1f}%)")
+        if missing:
+            self.stdout.write("Чаще всего не найдены:")
+            for address, count in missing.most_common(options['top']):
+                self.stdout.write(f"  {count:>6}  {address}")
@@ -0,0 +1,88 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from zudrasonbot.bot.api_cache import bump_version
+from zudrasonbot.bot.rollups import rebuild_days
+from zudrasonbot.bot.importer import (
+    RowError,
+    batched,
+    create_secondary_indexes,
+    drop_secondary_indexes,
+    finish_import,
+    load_batch,
+    read_records,
+    validated,
+)
+
+
+class Command(BaseCommand):
+    help = 'Массовая загрузка исторических заказов из CSV/NDJSON (COPY в Postgres, bulk_create в SQLite)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл CSV или NDJSON')
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='По умолчанию — по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--max-errors', type=int, default=0,
+                            help='Сколько неверных строк можно пропустить (по умолчанию ни одной)')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить файл')
+        parser.add_argument('--rebuild-indexes', action='store_true',
+                            help='Удалить вторичные индексы перед загрузкой и создать заново после')
+        parser.add_argument('--reindex', action='store_true', help='REINDEX таблицы после загрузки (Postgres)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if not os.path.exists(path):
+            raise CommandError(f"Файл не найден: {path}")
+
+        errors = []
+        loaded = 0
+        started = time.monotonic()
+        indexes_dropped = False
+        # Дни загруженных заказов: у исторических updated_at старше отметки сводок,
+        # поэтому сводки за эти дни пересчитываются сразу после загрузки
+        days = set()
+
+        with open(path, newline='', encoding='utf-8') as stream:
+            rows = validated(read_records(stream, fmt), errors, options['max_errors'])
+            try:
+                if options['dry_run']:
+                    loaded = sum(1 for _ in rows)
+                else:
+                    if options['rebuild_indexes']:
+                        drop_secondary_indexes()
+                        indexes_dropped = True
+                    for batch in batched(rows, options['batch_size']):
+                        load_batch(batch)
+                        loaded += len(batch)
+                        days.update(timezone.localdate(values['created_at']) for values in batch)
+                        self.stdout.write(f"Загружено {loaded} строк...")
+            except RowError as e:
+                self._report(errors)
+                raise CommandError(f"{e}. Уже загружено строк: {loaded}")
+            finally:
+                if indexes_dropped:
+                    self.stdout.write('Создание индексов...')
+                    create_secondary_indexes()
+
+        if not options['dry_run'] and loaded:
+            finish_import(reindex=options['reindex'])
+            rebuild_days(days)
+            bump_version()
+
+        self._report(errors)
+        elapsed = time.monotonic() - started
+        verb = 'Проверено' if options['dry_run'] else 'Загружено'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {loaded} строк за {elapsed:.1f} с ({loaded / max(elapsed, 0.001):.0f} строк/с), "
+            f"пропущено с ошибками: {len(errors)}"
+        ))
+
+    def _report(self, errors):
+        for error in errors[:20]:
+            self.stderr.write(str(error))
+        if len(errors) > 20:
+            self.stderr.write(f"... и еще {len(errors) - 20} ошибок")
@@ -0,0 +1,65 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from zudrasonbot.bot.models import ArchivedOrder, Order
+from zudrasonbot.bot.storage import ContentAddressedStorage, is_content_name
+
+
+FILE_FIELDS = ('photo', 'photo_thumb', 'photo_web')
+
+
+class Command(BaseCommand):
+    help = 'Переносит фото заказов из плоского каталога в хранилище по содержимому (ab/cd/<sha256>)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--keep-originals', action='store_true', help='Не удалять старые файлы')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать файлы для переноса')
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("Хранилище по содержимому не включено (MEDIA_STORAGE=cas)")
+
+        started = time.monotonic()
+        moved = missing = 0
+        for model in (Order, ArchivedOrder):
+            for field in FILE_FIELDS:
+                rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).values_list('pk', field)
+                legacy = [(pk, name) for pk, name in rows.iterator(chunk_size=2000) if not is_content_name(name)]
+                if options['dry_run']:
+                    self.stdout.write(f"{model.__name__}.{field}: к переносу {len(legacy)}")
+                    continue
+                for start in range(0, len(legacy), options['batch_size']):
+                    batch_moved, batch_missing = self._move(model, field, legacy[start:start + options['batch_size']],
+                                                            options['keep_originals'])
+                    moved += batch_moved
+                    missing += batch_missing
+                    self.stdout.write(f"{model.__name__}.{field}: перенесено {moved}, нет файла {missing}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: перенесено {moved} файлов за {time.monotonic() - started:.1f} с, не найдено: {missing}"
+        ))
+
+    def _move(self, model, field, batch, keep_originals):
+        storage = default_storage
+        moved, missing, originals = 0, 0, []
+        for pk, name in batch:
+            if not storage.exists(name):
+                missing += 1
+                continue
+            with storage.open(name, 'rb') as f:
+                new_name = storage.save(name, f)
+            # updated_at не трогаем: содержимое заказа не менялось
+            model.objects.filter(pk=pk).update(**{field: new_name, 'updated_at': F('updated_at')})
+            originals.append(name)
+            moved += 1
+
+        # Старые файлы удаляются только после того, как новые записаны на диск
+        storage.flush()
+        if not keep_originals:
+            for name in originals:
+                storage.delete(name)
+        return moved, missing
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from zudrasonbot.bot.filters import parse_moment
+from zudrasonbot.bot.sla import STAGES, sla_report, stage_stats
+
+
+class Command(BaseCommand):
+    help = 'Длительность этапов заказа по журналу событий (среднее, медиана, 90-й перцентиль)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stage', choices=STAGES, help='Только один этап')
+        parser.add_argument('--from', dest='date_from', help='Этап завершен не раньше (YYYY-MM-DD или ISO 8601)')
+        parser.add_argument('--to', dest='date_to', help='Этап завершен не позже (включительно)')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_moment(options['date_from']) if options['date_from'] else None
+            until = parse_moment(options['date_to'], end_of_day=True) if options['date_to'] else None
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        rows = [stage_stats(options['stage'], since, until)] if options['stage'] else sla_report(since, until)
+        self.stdout.write(f"{'Этап':<18} {'Заказов':>8} {'Среднее':>16} {'Медиана':>16} {'P90':>16}")
+        for row in rows:
+            cells = [str(row[key]).split('.')[0] if row[key] is not None else '-' for key in ('mean', 'median', 'p90')]
+            self.stdout.write(f"{row['stage']:<18} {row['count']:>8} {cells[0]:>16} {cells[1]:>16} {cells[2]:>16}")
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from zudrasonbot.bot.rollups import update_rollups
+
+
+class Command(BaseCommand):
+    help = 'Обновляет дневные сводки аналитики по заказам, измененным с прошлого запуска'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Пересчитать сводки за все время')
+        parser.add_argument('--lag', type=int, default=60,
+                            help='Не трогать заказы, измененные в последние N секунд (по умолчанию 60)')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Повторять каждые N секунд (0 — один проход)')
+
+    def handle(self, *args, **options):
+        rebuild = options['rebuild']
+        while True:
+            started = time.monotonic()
+            days = update_rollups(lag=options['lag'], rebuild=rebuild)
+            self.stdout.write(f"Пересчитано дней: {days} за {time.monotonic() - started:.2f} с")
+            rebuild = False
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:14
+
+from django.db import migrations, models
+
+
+def normalize_phones(apps, schema_editor):
+    Order = apps.get_model('bot', 'Order')
+    batch = []
+    for order in Order.objects.only('id', 'phone').iterator(chunk_size=2000):
+        order.phone_normalized = ''.join(ch for ch in order.phone or '' if ch.isdigit())[:20]
+        batch.append(order)
+        if len(batch) >= 2000:
+            Order.objects.bulk_update(batch, ['phone_normalized'])
+            batch = []
+    if batch:
+        Order.objects.bulk_update(batch, ['phone_normalized'])
+
+
+def search_indexes():
+    from django.contrib.postgres.indexes import GinIndex, OpClass
+    from django.contrib.postgres.search import SearchVector
+    from django.db.models.functions import Upper
+
+    # Выражения совпадают с тем, что Django генерирует для icontains (UPPER(col::text) LIKE ...)
+    # и для SearchVector(..., config='simple'), поэтому планировщик использует эти индексы.
+    return [
+        GinIndex(OpClass(Upper('from_address'), name='gin_trgm_ops'), name='order_from_trgm_idx'),
+        GinIndex(OpClass(Upper('to_address'), name='gin_trgm_ops'), name='order_to_trgm_idx'),
+        GinIndex(OpClass('phone_normalized', name='gin_trgm_ops'), name='order_phone_trgm_idx'),
+        GinIndex(SearchVector('client_feedback', config='simple'), name='order_feedback_fts_idx'),
+    ]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Order = apps.get_model('bot', 'Order')
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for index in search_indexes():
+        schema_editor.add_index(Order, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Order = apps.get_model('bot', 'Order')
+    for index in search_indexes():
+        schema_editor.remove_index(Order, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0005_order_api_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='phone_normalized',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(normalize_phones, migrations.RunPython.noop),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
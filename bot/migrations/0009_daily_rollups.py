@@ -0,0 +1,56 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0008_orderevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCourierRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('courier_id', models.BigIntegerField()),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('delivered', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyStatusRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('score_sum', models.PositiveIntegerField(default=0)),
+                ('score_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['updated_at'], name='order_updated_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailycourierrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'courier_id'), name='daily_courier_rollup_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailystatusrollup',
+            constraint=models.UniqueConstraint(fields=('day', 'status'), name='daily_status_rollup_unique'),
+        ),
+    ]
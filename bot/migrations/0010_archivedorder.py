@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0009_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('user_id', models.BigIntegerField()),
+                ('from_address', models.TextField()),
+                ('to_address', models.TextField()),
+                ('phone', models.CharField(max_length=20)),
+                ('phone_normalized', models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20)),
+                ('package_type', models.CharField(max_length=50)),
+                ('photo', models.ImageField(blank=True, null=True, upload_to='orders/')),
+                ('status', models.CharField(choices=[('pending', 'Ожидает подтверждения'), ('confirmed', 'Подтвержден'), ('paid', 'Оплачен'), ('assigned', 'Назначен курьеру'), ('in_progress', 'В процессе доставки'), ('delivered', 'Доставлен'), ('completed', 'Завершен'), ('cancelled', 'Отменен')], default='pending', max_length=20)),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('courier_id', models.BigIntegerField(blank=True, null=True)),
+                ('courier_link', models.CharField(blank=True, max_length=100, null=True)),
+                ('courier_message', models.TextField(blank=True, null=True)),
+                ('delivery_message', models.TextField(blank=True, null=True)),
+                ('client_feedback', models.TextField(blank=True, null=True)),
+                ('client_link', models.CharField(blank=True, max_length=100, null=True, verbose_name='Ссылка на клиента')),
+                ('client_score', models.PositiveSmallIntegerField(blank=True, help_text='Оценка от 1 до 5', null=True, verbose_name='Оценка клиента')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at', 'id'], name='archived_created_id_idx'), models.Index(fields=['user_id', 'created_at', 'id'], name='archived_user_created_idx')],
+            },
+        ),
+    ]
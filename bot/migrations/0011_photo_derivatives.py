@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0010_archivedorder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorder',
+            name='photo_thumb',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='orders/derived/'),
+        ),
+        migrations.AddField(
+            model_name='archivedorder',
+            name='photo_web',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='orders/derived/'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='photo_thumb',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='orders/derived/'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='photo_web',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='orders/derived/'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0012_mediablob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReceiptHash',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.BigIntegerField()),
+                ('user_id', models.BigIntegerField()),
+                ('hash', models.BigIntegerField(blank=True, null=True)),
+                ('file_unique_id', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order_id'], name='receipt_order_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-19 00:34
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0013_receipthash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceClaim',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.BigIntegerField(unique=True)),
+                ('operator_id', models.BigIntegerField()),
+                ('claimed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['operator_id'], name='price_claim_operator_idx')],
+            },
+        ),
+    ]
@@ -1,8 +1,73 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
+from .signals import orders_updated
 
-class Order(models.Model):
+
+# Псевдостатус в журнале событий: оператор назначил цену (статус заказа при этом не меняется)
+EVENT_PRICED = 'priced'
+
+
+def transition_events(changes):
+    """Какие события журнала порождает изменение полей заказа"""
+    events = []
+    if changes.get('status'):
+        events.append(changes['status'])
+    if changes.get('price') is not None:
+        events.append(EVENT_PRICED)
+    return events
+
+
+def normalize_phone(phone):
+    """Только цифры номера — для быстрого поиска по телефону в админке"""
+    return ''.join(ch for ch in phone or '' if ch.isdigit())[:20]
+
+
+class OrderQuerySet(models.QuerySet):
+    def _filtered_pks(self):
+        """
+        id затронутых заказов. Для filter(id=...) и filter(pk__in=[...]) — без запроса к БД,
+        иначе строки блокируются (select_for_update): вызывать внутри транзакции
+        """
+        where = self.query.where
+        if where.connector == 'AND' and not where.negated and len(where.children) == 1:
+            lookup = where.children[0]
+            target = getattr(getattr(lookup, 'lhs', None), 'target', None)
+            if target is self.model._meta.pk:
+                if lookup.lookup_name == 'exact':
+                    return [lookup.rhs]
+                if lookup.lookup_name == 'in' and isinstance(lookup.rhs, (list, tuple, set)):
+                    return list(lookup.rhs)
+        return list(self.select_for_update().values_list('pk', flat=True))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.phone_normalized = normalize_phone(obj.phone)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def update(self, **kwargs):
+        if isinstance(kwargs.get('phone'), str):
+            kwargs['phone_normalized'] = normalize_phone(kwargs['phone'])
+        # auto_now при update() не срабатывает — без этого updated_at не отражал бы изменения
+        kwargs.setdefault('updated_at', timezone.now())
+        events = transition_events(kwargs)
+        with transaction.atomic():
+            # Запоминаем затронутые id, чтобы кэши могли сбросить именно эти заказы. Выборка и
+            # UPDATE в одной транзакции, строки заблокированы — журнал пишется ровно по ним
+            pks = self._filtered_pks() if events or orders_updated.has_listeners(self.model) else None
+            rows = super().update(**kwargs)
+            if rows and events:
+                OrderEvent.objects.bulk_create(
+                    [OrderEvent(order_id=pk, status=event, ts=kwargs['updated_at']) for pk in pks for event in events]
+                )
+        if pks:
+            orders_updated.send(sender=self.model, pks=pks, fields=tuple(kwargs))
+        return rows
+
+
+class OrderBase(models.Model):
+    """Поля заказа — общие для рабочей таблицы и архива"""
     STATUS_CHOICES = [
         ('pending', 'Ожидает подтверждения'),
         ('confirmed', 'Подтвержден'),
@@ -17,8 +82,12 @@ class Order(models.Model):
     from_address = models.TextField()
     to_address = models.TextField()
     phone = models.CharField(max_length=20)
+    phone_normalized = models.CharField(max_length=20, blank=True, default='', editable=False, db_index=True)
     package_type = models.CharField(max_length=50)
     photo = models.ImageField(upload_to='orders/', blank=True, null=True)
+    # Производные фото (миниатюра и сжатая копия WebP) строятся в фоне, см. images.py
+    photo_thumb = models.ImageField(upload_to='orders/derived/', blank=True, null=True, editable=False)
+    photo_web = models.ImageField(upload_to='orders/derived/', blank=True, null=True, editable=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     courier_id = models.BigIntegerField(null=True, blank=True)
@@ -38,9 +107,199 @@ class Order(models.Model):
         verbose_name="Оценка клиента",
         help_text="Оценка от 1 до 5"
     )
+    # Ключ записи очереди приема (intake): повторная запись той же заявки не создает второй заказ
+    intake_key = models.CharField(max_length=32, unique=True, blank=True, null=True, editable=False)
     created_at = models.DateTimeField(default=timezone.now)  # Добавлено
     updated_at = models.DateTimeField(auto_now=True)  # Добавлено
 
+    class Meta:
+        abstract = True
+
     def __str__(self):
         return f"Заказ #{self.id} ({self.get_status_display()})"
 
+
+class Order(OrderBase):
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Курсорная пагинация API и фильтры по статусу/клиенту
+            models.Index(fields=['created_at', 'id'], name='order_created_id_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='order_status_created_idx'),
+            models.Index(fields=['user_id', 'created_at', 'id'], name='order_user_created_idx'),
+            # Инкрементальное обновление сводок: заказы, измененные после отметки
+            models.Index(fields=['updated_at'], name='order_updated_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения на момент загрузки — чтобы save() писал в журнал только реальные переходы
+        instance._loaded = {name: instance.__dict__.get(name) for name in ('status', 'price')}
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.phone_normalized = normalize_phone(self.phone)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'phone' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'phone_normalized'}
+
+        loaded = getattr(self, '_loaded', {})
+        changes = {
+            name: self.__dict__.get(name) for name in ('status', 'price')
+            if (update_fields is None or name in update_fields)
+            and (self._state.adding or self.__dict__.get(name) != loaded.get(name))
+        }
+        events = transition_events(changes)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if events:
+                OrderEvent.objects.bulk_create(
+                    [OrderEvent(order_id=self.pk, status=event, ts=self.updated_at) for event in events]
+                )
+        self._loaded = {name: self.__dict__.get(name) for name in ('status', 'price')}
+
+
+class ArchivedOrder(OrderBase):
+    """Закрытые заказы, перенесенные из Order командой archive_orders (id сохраняются)"""
+    id = models.BigIntegerField(primary_key=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='archived_created_id_idx'),
+            models.Index(fields=['user_id', 'created_at', 'id'], name='archived_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Архивный заказ #{self.id} ({self.get_status_display()})"
+
+
+
+class Notification(models.Model):
+    """Исходящее сообщение Telegram: админка ставит в очередь, бот отправляет с ограничением скорости"""
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает отправки'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Ошибка'),
+    ]
+    chat_id = models.BigIntegerField()
+    text = models.TextField()
+    reply_markup = models.JSONField(blank=True, null=True)
+    order_id = models.BigIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at', 'id'], name='notification_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Уведомление #{self.id} → {self.chat_id} ({self.get_status_display()})"
+
+
+class OrderEvent(models.Model):
+    """
+    Журнал переходов заказа (только добавление): статус и время.
+    Аналитика сроков работает по этой узкой таблице, не читая заказы.
+    """
+    order_id = models.BigIntegerField()
+    status = models.CharField(max_length=20)
+    ts = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_id', 'ts'], name='order_event_order_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"Заказ #{self.order_id}: {self.status} ({self.ts:%Y-%m-%d %H:%M})"
+
+
+class DailyStatusRollup(models.Model):
+    """Сводка заказов за день (по дате создания) и статусу. Обновляется командой update_rollups"""
+    day = models.DateField()
+    status = models.CharField(max_length=20)
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    score_sum = models.PositiveIntegerField(default=0)
+    score_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='daily_status_rollup_unique'),
+        ]
+
+
+class DailyCourierRollup(models.Model):
+    """Сводка по курьеру за день: взятые и доставленные заказы, сумма"""
+    day = models.DateField()
+    courier_id = models.BigIntegerField()
+    orders = models.PositiveIntegerField(default=0)
+    delivered = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'courier_id'], name='daily_courier_rollup_unique'),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """До какого updated_at заказы уже учтены в сводках"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+
+
+class RollupDirtyDay(models.Model):
+    """
+    День (по дате создания) удаленного заказа: по updated_at удаление не видно, поэтому
+    сводку этого дня update_rollups пересчитает по этой отметке и удалит ее
+    """
+    day = models.DateField()
+
+
+class MediaBlob(models.Model):
+    """Файл в хранилище по содержимому и число ссылок на него (см. storage.py)"""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    refs = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs})"
+
+
+class ReceiptHash(models.Model):
+    """Перцептивный хеш чека об оплате для поиска повторно присланных чеков"""
+    order_id = models.BigIntegerField()
+    user_id = models.BigIntegerField()
+    hash = models.BigIntegerField(null=True, blank=True)  # dHash, 64 бита со знаком
+    file_unique_id = models.CharField(max_length=64, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order_id'], name='receipt_order_idx'),
+        ]
+
+
+class PriceClaim(models.Model):
+    """Заказ, который оценивает оператор: другие операторы его не получают, пока захват не истек"""
+    order_id = models.BigIntegerField(unique=True)
+    operator_id = models.BigIntegerField()
+    claimed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['operator_id'], name='price_claim_operator_idx'),
+        ]
+
+    def __str__(self):
+        return f"Заказ #{self.order_id} → оператор {self.operator_id}"
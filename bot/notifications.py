@@ -0,0 +1,236 @@
+import asyncio
+import time
+from datetime import timedelta
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Notification, Order
+from .ratelimit import TokenBucket
+
+
+# Уведомления, которые бот отправляет при смене статуса заказа. Тексты и кнопки общие для
+# обработчиков бота и для массовых действий админки: админка кладет их в таблицу Notification,
+# а NotificationSender в процессе бота отправляет с учетом лимитов Telegram.
+
+PAYMENT_ACCEPTED_TEXT = (
+    "✅ Оплата принята! Ваш заказ отправлен курьерам.\n"
+    "Ожидайте, когда курьер примет заказ."
+)
+
+
+def courier_offer_text(order):
+    return (
+        f"🚚 Новый заказ для доставки #{order.id}\n\n"
+        f"📍 Откуда: {order.from_address}\n"
+        f"📍 Куда: {order.to_address}\n"
+        f"📦 Тип: {order.package_type}\n"
+        f"💰 Сумма: {order.price} сомони\n"
+        f"📞 Телефон: {order.phone}"
+    )
+
+
+def courier_offer_markup(order_id):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Принять заказ", callback_data=f"courier_accept:{order_id}")]
+    ])
+
+
+def confirm_markup(order_id):
+    """Кнопка подтверждения получения: после нее заказ завершается и клиент ставит оценку"""
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Подтвердить получение", callback_data=f"client_confirm:{order_id}")
+    ]])
+
+
+def rating_markup(order_id):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"⭐️ {score}", callback_data=f"rate:{score}:{order_id}")]
+        for score in range(1, 6)
+    ])
+
+
+def _dump(markup):
+    return markup.model_dump(exclude_none=True) if markup is not None else None
+
+
+def load_markup(data):
+    if not data:
+        return None
+    if data.get('remove_keyboard'):
+        return ReplyKeyboardRemove()
+    return InlineKeyboardMarkup.model_validate(data)
+
+
+def status_notifications(order, status):
+    """Сообщения, которые бот отправил бы при переводе заказа в status"""
+    if status == 'paid':
+        # Курьера подбирает бот (dispatch.CourierDispatch): оплаченные заказы без курьера
+        # он находит при сверке с БД
+        return [
+            Notification(
+                chat_id=order.user_id, order_id=order.id,
+                text=PAYMENT_ACCEPTED_TEXT, reply_markup=_dump(ReplyKeyboardRemove())
+            ),
+        ]
+    if status == 'delivered':
+        result = [
+            Notification(
+                chat_id=order.user_id, order_id=order.id,
+                text=f"🚚 Ваш заказ #{order.id} доставлен.\n\n"
+                     "Пожалуйста, подтвердите получение:",
+                reply_markup=_dump(confirm_markup(order.id))
+            ),
+        ]
+        if order.courier_id:
+            result.append(Notification(
+                chat_id=order.courier_id, order_id=order.id,
+                text=f"✅ Заказ #{order.id} отмечен как доставленный.\nСпасибо за работу!"
+            ))
+        return result
+    return []
+
+
+def set_status_and_notify(queryset, status):
+    """
+    Переводит заказы в status и ставит уведомления в очередь (для действий админки).
+    Заказы, уже находящиеся в этом статусе, пропускаются, чтобы не рассылать повторно.
+    Возвращает (число заказов, число уведомлений).
+    """
+    with transaction.atomic():
+        orders = list(
+            queryset.exclude(status=status)
+            .only('id', 'user_id', 'from_address', 'to_address', 'package_type', 'price', 'phone', 'courier_id')
+        )
+        if not orders:
+            return 0, 0
+        Order.objects.filter(pk__in=[order.id for order in orders]).update(status=status)
+        notifications = [n for order in orders for n in status_notifications(order, status)]
+        Notification.objects.bulk_create(notifications, batch_size=500)
+    return len(orders), len(notifications)
+
+
+class NotificationSender:
+    """
+    Фоновая отправка очереди Notification из процесса бота.
+    Общий поток ограничен rate сообщений в секунду, в один чат — не чаще chat_interval,
+    в группу — не чаще group_interval (ограничения Telegram). Сообщения в разные чаты
+    отправляются параллельно, на RetryAfter вся отправка приостанавливается.
+    """
+
+    def __init__(self, bot, rate=25, chat_interval=1.0, group_interval=3.0,
+                 batch_size=100, interval=1.0, max_attempts=5):
+        self.bot = bot
+        self.bucket = TokenBucket(rate)
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self._next_slot = {}  # chat_id -> время (monotonic), раньше которого в чат не пишем
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        while True:
+            try:
+                sent = await self.drain_once()
+            except Exception as e:
+                print(f"Ошибка при отправке уведомлений: {e}")
+                sent = 0
+            if sent < self.batch_size:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _due(self, throttled):
+        return list(
+            Notification.objects
+            .filter(status='pending', available_at__lte=timezone.now())
+            .exclude(chat_id__in=throttled)
+            .order_by('available_at', 'id')[:self.batch_size]
+        )
+
+    def _finish(self, sent, retries, failures):
+        now = timezone.now()
+        with transaction.atomic():
+            if sent:
+                Notification.objects.filter(id__in=sent).update(
+                    status='sent', sent_at=now, attempts=F('attempts') + 1
+                )
+            for notification_id, delay, error, counted in retries:
+                Notification.objects.filter(id=notification_id).update(
+                    available_at=now + timedelta(seconds=delay), last_error=error,
+                    attempts=F('attempts') + (1 if counted else 0)
+                )
+            for notification_id, error in failures:
+                Notification.objects.filter(id=notification_id).update(
+                    status='failed', last_error=error, attempts=F('attempts') + 1
+                )
+
+    async def drain_once(self):
+        now = time.monotonic()
+        throttled = [chat_id for chat_id, slot in self._next_slot.items() if slot > now]
+        self._next_slot = {chat_id: self._next_slot[chat_id] for chat_id in throttled}
+        batch = await sync_to_async(self._due)(throttled)
+
+        # В каждый чат — не больше одного сообщения за проход, остальные ждут своего интервала
+        selected, chats = [], set()
+        for notification in batch:
+            if notification.chat_id not in chats:
+                chats.add(notification.chat_id)
+                selected.append(notification)
+        if not selected:
+            return 0
+
+        results = await asyncio.gather(*(self._send(n) for n in selected), return_exceptions=True)
+
+        sent, retries, failures = [], [], []
+        for notification, error in zip(selected, results):
+            if error is None:
+                sent.append(notification.id)
+            elif isinstance(error, TelegramRetryAfter):
+                self.bucket.pause(error.retry_after)
+                retries.append((notification.id, error.retry_after, str(error), False))
+            elif isinstance(error, (TelegramForbiddenError, TelegramBadRequest)):
+                # Пользователь заблокировал бота или чат не существует — повтор не поможет
+                failures.append((notification.id, str(error)))
+            elif notification.attempts + 1 >= self.max_attempts:
+                failures.append((notification.id, str(error)))
+            else:
+                retries.append((notification.id, 2 ** notification.attempts * self.interval, str(error), True))
+        await sync_to_async(self._finish)(sent, retries, failures)
+        return len(batch)
+
+    async def _send(self, notification):
+        await self.bucket.acquire()
+        interval = self.group_interval if notification.chat_id < 0 else self.chat_interval
+        self._next_slot[notification.chat_id] = time.monotonic() + interval
+        await self.bot.send_message(
+            notification.chat_id,
+            notification.text,
+            reply_markup=load_markup(notification.reply_markup)
+        )
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация по (created_at, id): каждая страница — один индексный диапазон,
+    без OFFSET и COUNT(*), поэтому стоимость запроса не растет вместе с таблицей.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
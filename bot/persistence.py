@@ -0,0 +1,83 @@
+import os
+from collections import defaultdict
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+
+from zudrasonbot.bot.models import Order, OrderEvent
+
+
+# Синхронные пакетные операции с БД.
+# Вызываются из фоновых воркеров через sync_to_async, а не из обработчиков напрямую.
+
+def create_orders(records):
+    """
+    Создает заказы одной пачкой и возвращает их id в порядке records.
+    Записи, уже сохраненные раньше (тот же intake_key), не создаются повторно — возвращается
+    id существующего заказа.
+    """
+    keys = [record['intake_key'] for record in records if record.get('intake_key')]
+    existing = dict(Order.objects.filter(intake_key__in=keys).values_list('intake_key', 'id')) if keys else {}
+
+    pending = []
+    for record in records:
+        if record.get('intake_key') in existing:
+            continue
+        order = Order(
+            user_id=record['user_id'],
+            client_link=f"https://t.me/{record['username']}" if record.get('username') else None,
+            from_address=record['from_address'],
+            to_address=record['to_address'],
+            phone=record['phone'],
+            package_type=record['package_type'],
+            status='pending',
+            intake_key=record.get('intake_key')
+        )
+        pending.append((order, record.get('photo_path')))
+
+    with transaction.atomic():
+        # Фото сохраняются в той же транзакции: ссылки на файлы (MediaBlob) откатятся
+        # вместе с заказами, если пачка не сохранится и будет повторена
+        for order, photo_path in pending:
+            if photo_path and os.path.exists(photo_path):
+                with open(photo_path, 'rb') as f:
+                    order.photo.save(os.path.basename(photo_path), ContentFile(f.read()), save=False)
+        # Хранилище по содержимому пишет файлы в фоне — дожидаемся записи до сохранения заказов
+        storage = Order._meta.get_field('photo').storage
+        if hasattr(storage, 'flush'):
+            storage.flush()
+        created = Order.objects.bulk_create([order for order, _ in pending])
+        OrderEvent.objects.bulk_create(
+            [OrderEvent(order_id=order.id, status=order.status, ts=order.created_at) for order in created]
+        )
+    ids = iter(order.id for order in created)
+    return [existing[record['intake_key']] if record.get('intake_key') in existing else next(ids) for record in records]
+
+
+def apply_order_updates(updates):
+    """
+    Применяет накопленные изменения полей заказов.
+    updates: {order_id: {field: value}}. Заказы группируются по набору полей,
+    чтобы bulk_update не затирал поля, которые не менялись.
+    """
+    if not updates:
+        return 0
+
+    now = timezone.now()
+    groups = defaultdict(list)
+    for order_id, fields in updates.items():
+        if fields:
+            groups[tuple(sorted(fields))].append((order_id, fields))
+
+    updated = 0
+    with transaction.atomic():
+        for field_names, items in groups.items():
+            objs = []
+            for order_id, fields in items:
+                obj = Order(id=order_id, updated_at=now)
+                for name, value in fields.items():
+                    setattr(obj, name, value)
+                objs.append(obj)
+            updated += Order.objects.bulk_update(objs, list(field_names) + ['updated_at'])
+    return updated
@@ -0,0 +1,154 @@
+import re
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, Value, When
+from django.utils import timezone
+
+from .models import Order, PriceClaim
+
+
+# Очередь оценки заказов для операторов. Оператор берет следующие N заказов без цены
+# (/queue N) — они закрепляются за ним на CLAIM_TTL секунд и не выдаются другим.
+# Цены присылаются одним сообщением «12:25 13:30» и записываются одной транзакцией.
+
+CLAIM_TTL = 600
+
+# Сообщение похоже на пачку цен, если начинается с «номер:цена»
+BATCH_RE = re.compile(r'^\s*#?\d+\s*[:=]\s*\d')
+PRICE_RE = re.compile(r'\d+(?:[.,]\d{1,2})?')
+PAIR_RE = re.compile(rf'#?(\d+)[:=]({PRICE_RE.pattern})')
+
+PRICE_FIELD = Order._meta.get_field('price')
+MAX_PRICE = Decimal(10) ** (PRICE_FIELD.max_digits - PRICE_FIELD.decimal_places)
+
+
+def parse_price(text):
+    """Цена из текста оператора или None: только цифры (до 2 знаков после запятой), 0 < цена < MAX_PRICE"""
+    text = text.strip()
+    if not PRICE_RE.fullmatch(text):
+        # Отсекает и «nan», «inf», «1e20», которые принял бы Decimal
+        return None
+    price = Decimal(text.replace(',', '.'))
+    return price if 0 < price < MAX_PRICE else None
+
+
+def parse_prices(text):
+    """
+    «12:25 13:30,5 #14=40» -> ({12: Decimal('25'), ...}, [неразобранные части]).
+    Пары разделяются пробелами, переводами строк или «;».
+    """
+    prices, errors = {}, []
+    for token in re.split(r'[\s;]+', re.sub(r'\s*([:=])\s*', r'\1', text.strip())):
+        if not token:
+            continue
+        match = PAIR_RE.fullmatch(token)
+        if not match:
+            errors.append(token)
+            continue
+        price = parse_price(match.group(2))
+        if price is None:
+            errors.append(token)
+            continue
+        prices[int(match.group(1))] = price
+    return prices, errors
+
+
+def _expired(ttl):
+    return timezone.now() - timedelta(seconds=ttl)
+
+
+def claim_orders(operator_id, limit, ttl=CLAIM_TTL):
+    """
+    Закрепляет за оператором до limit заказов без цены (вместе с уже закрепленными за ним)
+    и возвращает их в порядке поступления.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        PriceClaim.objects.filter(claimed_at__lt=_expired(ttl)).delete()
+        own = PriceClaim.objects.filter(operator_id=operator_id)
+        # Заказ, который отменили или оценили в обход очереди, место в очереди не занимает
+        open_ids = Order.objects.filter(
+            id__in=list(own.values_list('order_id', flat=True)), status='pending', price__isnull=True
+        ).values_list('id', flat=True)
+        own.exclude(order_id__in=list(open_ids)).delete()
+        held = own.update(claimed_at=now)
+        if held < limit:
+            queryset = (
+                Order.objects.filter(status='pending', price__isnull=True)
+                .exclude(id__in=PriceClaim.objects.values('order_id'))
+                .order_by('created_at', 'id')
+            )
+            if connection.features.has_select_for_update_skip_locked:
+                # Параллельный /queue другого оператора пропускает эти строки, а не ждет
+                queryset = queryset.select_for_update(skip_locked=True)
+            ids = list(queryset.values_list('id', flat=True)[:limit - held])
+            PriceClaim.objects.bulk_create(
+                [PriceClaim(order_id=order_id, operator_id=operator_id, claimed_at=now) for order_id in ids],
+                ignore_conflicts=True
+            )
+        order_ids = list(own.values_list('order_id', flat=True))
+    return list(
+        Order.objects.filter(id__in=order_ids)
+        .order_by('created_at', 'id')
+        .values('id', 'from_address', 'to_address', 'package_type', 'price')
+    )
+
+
+def claim_order(operator_id, order_id, ttl=CLAIM_TTL):
+    """Закрепляет один заказ за оператором. Возвращает id оператора, за которым заказ закреплен"""
+    with transaction.atomic():
+        PriceClaim.objects.filter(order_id=order_id, claimed_at__lt=_expired(ttl)).delete()
+        claim, created = PriceClaim.objects.get_or_create(
+            order_id=order_id, defaults={'operator_id': operator_id}
+        )
+        if not created and claim.operator_id == operator_id:
+            PriceClaim.objects.filter(pk=claim.pk).update(claimed_at=timezone.now())
+    return claim.operator_id
+
+
+def release_claims(operator_id):
+    """Снимает все захваты оператора, возвращает их число"""
+    deleted, _ = PriceClaim.objects.filter(operator_id=operator_id).delete()
+    return deleted
+
+
+def apply_prices(operator_id, prices, ttl=CLAIM_TTL):
+    """
+    Записывает цены {order_id: Decimal} одним UPDATE в одной транзакции.
+    Цена принимается для заказа в статусе pending, не закрепленного за другим оператором.
+    Возвращает (примененные [(order_id, user_id, price)], отклоненные [(order_id, причина)]).
+    """
+    applied, rejected = [], []
+    statuses = dict(Order.STATUS_CHOICES)
+    with transaction.atomic():
+        orders = {
+            order_id: (user_id, status)
+            for order_id, user_id, status in Order.objects.select_for_update()
+            .filter(id__in=list(prices)).values_list('id', 'user_id', 'status')
+        }
+        claims = dict(
+            PriceClaim.objects.filter(order_id__in=list(prices), claimed_at__gte=_expired(ttl))
+            .values_list('order_id', 'operator_id')
+        )
+        for order_id, price in prices.items():
+            if order_id not in orders:
+                rejected.append((order_id, "заказ не найден"))
+                continue
+            user_id, status = orders[order_id]
+            if status != 'pending':
+                rejected.append((order_id, f"заказ уже в статусе «{statuses.get(status, status)}»"))
+            elif claims.get(order_id, operator_id) != operator_id:
+                rejected.append((order_id, "заказ оценивает другой оператор"))
+            else:
+                applied.append((order_id, user_id, price))
+
+        if applied:
+            ids = [order_id for order_id, _, _ in applied]
+            Order.objects.filter(id__in=ids).update(price=Case(
+                *[When(id=order_id, then=Value(price)) for order_id, _, price in applied],
+                output_field=DecimalField(max_digits=PRICE_FIELD.max_digits, decimal_places=PRICE_FIELD.decimal_places)
+            ))
+            PriceClaim.objects.filter(order_id__in=ids).delete()
+    return applied, rejected
@@ -0,0 +1,58 @@
+from dataclasses import dataclass, fields
+from decimal import Decimal
+from typing import Optional
+
+from .models import Order
+
+
+# Узкие проекции заказа для обработчиков бота.
+# Выбираются через values_list() только нужные столбцы, без создания экземпляров модели,
+# FieldFile для фото и длинных текстовых полей (отзыв, сообщения курьера).
+# Заказ по id обработчики читают через cache.OrderSnapshot; здесь — выборки для списков
+# (карточки курьеров) и последний заказ клиента.
+
+def _columns(cls):
+    return tuple(f.name for f in fields(cls))
+
+
+@dataclass(frozen=True, slots=True)
+class CourierCard:
+    """Карточка заказа для курьера / группы курьеров"""
+    id: int
+    from_address: str
+    to_address: str
+    package_type: str
+    price: Optional[Decimal]
+    phone: str
+    photo: Optional[str]
+    courier_id: Optional[int]
+
+
+@dataclass(frozen=True, slots=True)
+class StatusCheck:
+    """Проверка статуса заказа"""
+    id: int
+    status: str
+
+
+COLUMNS = {cls: _columns(cls) for cls in (CourierCard, StatusCheck)}
+
+
+def project(cls, queryset):
+    """Итератор проекций cls по queryset"""
+    return (cls(*row) for row in queryset.values_list(*COLUMNS[cls]))
+
+
+def get_projection(cls, order_id: int):
+    row = Order.objects.filter(id=order_id).values_list(*COLUMNS[cls]).first()
+    return cls(*row) if row else None
+
+
+def get_courier_card(order_id: int) -> Optional[CourierCard]:
+    return get_projection(CourierCard, order_id)
+
+
+def latest_for_user(cls, user_id: int):
+    """Последний заказ пользователя в виде проекции cls"""
+    row = Order.objects.filter(user_id=user_id).order_by('-id').values_list(*COLUMNS[cls]).first()
+    return cls(*row) if row else None
@@ -0,0 +1,141 @@
+import io
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import combinations
+
+from PIL import Image
+
+from .models import ReceiptHash
+
+
+# Поиск повторно присланных чеков. Для каждого чека считается dHash (64 бита): похожие
+# картинки (пересжатый или обрезанный по краям скриншот) дают хеши с малым расстоянием
+# Хэмминга. Хеши хранятся в памяти бота в индексе multi-index hashing, поиск соседей
+# по истории чеков — доли миллисекунды.
+
+def dhash(data, size=8):
+    """Разностный хеш изображения: 64-битное целое"""
+    with Image.open(io.BytesIO(data)) as image:
+        pixels = list(image.convert('L').resize((size + 1, size), Image.Resampling.LANCZOS).getdata())
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+def to_signed(value):
+    """64-битный хеш -> значение для BigIntegerField"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+@dataclass(frozen=True, slots=True)
+class ReceiptRef:
+    order_id: int
+    user_id: int
+    created_at: datetime
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing: 64 бита делятся на chunks блоков, по каждому блоку — своя таблица.
+    Если хеши отличаются не больше чем на d бит, то хотя бы в одном блоке отличие не больше
+    d // chunks бит, поэтому кандидаты ищутся перебором малых отличий в каждом блоке.
+    """
+
+    def __init__(self, max_distance=6, chunks=4):
+        self.max_distance = max_distance
+        self.chunks = chunks
+        self.bits = 64 // chunks
+        self.mask = (1 << self.bits) - 1
+        radius = max_distance // chunks
+        self.flips = [0] + [
+            sum(1 << bit for bit in combo)
+            for r in range(1, radius + 1)
+            for combo in combinations(range(self.bits), r)
+        ]
+        self.tables = [{} for _ in range(chunks)]
+        self.values = {}
+        self.size = 0
+
+    def _parts(self, key):
+        return [(key >> (i * self.bits)) & self.mask for i in range(self.chunks)]
+
+    def add(self, key, value):
+        self.size += 1
+        if key not in self.values:
+            self.values[key] = []
+            for table, part in zip(self.tables, self._parts(key)):
+                table.setdefault(part, []).append(key)
+        self.values[key].append(value)
+
+    def search(self, key):
+        """Список (расстояние, значение) для хешей не дальше max_distance"""
+        candidates = set()
+        for table, part in zip(self.tables, self._parts(key)):
+            for flip in self.flips:
+                bucket = table.get(part ^ flip)
+                if bucket:
+                    candidates.update(bucket)
+        found = []
+        for candidate in candidates:
+            distance = (candidate ^ key).bit_count()
+            if distance <= self.max_distance:
+                found.extend((distance, value) for value in self.values[candidate])
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+class ReceiptIndex:
+    """Индекс чеков бота: похожие по dHash и точные совпадения по file_unique_id Telegram"""
+
+    def __init__(self, max_distance=6):
+        self.max_distance = max_distance
+        self.hashes = MultiIndexHash(max_distance)
+        self.by_file = {}
+
+    def load(self):
+        """Загружает историю чеков из БД (вызывается при старте бота)"""
+        rows = ReceiptHash.objects.values_list('hash', 'file_unique_id', 'order_id', 'user_id', 'created_at')
+        for value, file_unique_id, order_id, user_id, created_at in rows.iterator(chunk_size=5000):
+            self._add(value, file_unique_id, ReceiptRef(order_id, user_id, created_at))
+        return self.hashes.size
+
+    def _add(self, value, file_unique_id, ref):
+        if value is not None:
+            self.hashes.add(to_unsigned(value), ref)
+        if file_unique_id:
+            self.by_file.setdefault(file_unique_id, []).append(ref)
+
+    def find(self, value, file_unique_id, order_id):
+        """
+        Похожие чеки других заказов: список (расстояние, ReceiptRef),
+        расстояние None — тот же файл Telegram.
+        """
+        matches = {}
+        for ref in self.by_file.get(file_unique_id, ()):
+            matches[ref.order_id] = (None, ref)
+        if value is not None:
+            for distance, ref in self.hashes.search(value):
+                matches.setdefault(ref.order_id, (distance, ref))
+        matches.pop(order_id, None)
+        return sorted(matches.values(), key=lambda item: -1 if item[0] is None else item[0])
+
+    def add(self, receipt):
+        ref = ReceiptRef(receipt.order_id, receipt.user_id, receipt.created_at)
+        self._add(receipt.hash, receipt.file_unique_id, ref)
+
+
+def save_receipt(value, file_unique_id, order_id, user_id):
+    """Сохраняет хеш чека в БД; в индекс его добавляет вызывающий (ReceiptIndex.add)"""
+    return ReceiptHash.objects.create(
+        order_id=order_id,
+        user_id=user_id,
+        hash=to_signed(value) if value is not None else None,
+        file_unique_id=file_unique_id or ''
+    )
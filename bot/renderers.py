@@ -0,0 +1,20 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен — без него работает стандартный JSONRenderer
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSON-рендерер на orjson; для отступов (?indent / browsable API) и без orjson — стандартный"""
+
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=self._encoder.default)
@@ -0,0 +1,176 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from .models import ArchivedOrder, DailyCourierRollup, DailyStatusRollup, Order, RollupDirtyDay, RollupWatermark
+
+
+# Дневные сводки для панели аналитики. Пересчитываются только дни (по дате создания),
+# в которых есть заказы с updated_at после отметки; сводка дня заменяется целиком,
+# поэтому смена статуса корректно переносит заказ из одной строки в другую.
+# Удаленный заказ по updated_at не найти — его день отмечается в RollupDirtyDay (post_delete).
+
+WATERMARK = 'daily_rollups'
+EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+# Статусы, в которых заказ оплачен — по ним считается выручка
+REVENUE_STATUSES = ('paid', 'waiting_courier', 'assigned', 'in_progress', 'delivered', 'completed')
+DONE_STATUSES = ('delivered', 'completed')
+
+
+def _day_ranges(days):
+    """Соседние дни объединяются в отрезки, чтобы пересчет шел диапазонными запросами по индексу"""
+    ranges = []
+    for day in sorted(days):
+        if ranges and day == ranges[-1][1] + timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return ranges
+
+
+def _bounds(first, last):
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(first, time.min), tz),
+        timezone.make_aware(datetime.combine(last + timedelta(days=1), time.min), tz),
+    )
+
+
+def _merge(totals, rows, key, values):
+    for row in rows:
+        item = totals[tuple(row[name] for name in key)]
+        for name in values:
+            item[name] = item.get(name, 0) + (row[name] or 0)
+
+
+def rebuild_days(days):
+    """Пересчитывает сводки за указанные дни (по рабочей таблице и архиву)"""
+    for first, last in _day_ranges(days):
+        start, end = _bounds(first, last)
+        by_status, by_courier = defaultdict(dict), defaultdict(dict)
+        for model in (Order, ArchivedOrder):
+            orders = (
+                model.objects.filter(created_at__gte=start, created_at__lt=end)
+                .annotate(day=TruncDate('created_at'))
+                .order_by()
+            )
+            _merge(by_status, orders.values('day', 'status').annotate(
+                orders=Count('id'),
+                revenue=Sum('price'),
+                score_sum=Sum('client_score'),
+                score_count=Count('client_score'),
+            ), ('day', 'status'), ('orders', 'revenue', 'score_sum', 'score_count'))
+            _merge(by_courier, orders.filter(courier_id__isnull=False).values('day', 'courier_id').annotate(
+                orders=Count('id'),
+                delivered=Count('id', filter=Q(status__in=DONE_STATUSES)),
+                revenue=Sum('price', filter=Q(status__in=REVENUE_STATUSES)),
+            ), ('day', 'courier_id'), ('orders', 'delivered', 'revenue'))
+
+        status_rows = [DailyStatusRollup(day=day, status=status, **item) for (day, status), item in by_status.items()]
+        courier_rows = [
+            DailyCourierRollup(day=day, courier_id=courier_id, **item) for (day, courier_id), item in by_courier.items()
+        ]
+        with transaction.atomic():
+            DailyStatusRollup.objects.filter(day__range=(first, last)).delete()
+            DailyCourierRollup.objects.filter(day__range=(first, last)).delete()
+            DailyStatusRollup.objects.bulk_create(status_rows, batch_size=1000)
+            DailyCourierRollup.objects.bulk_create(courier_rows, batch_size=1000)
+
+
+def update_rollups(lag=60, rebuild=False):
+    """
+    Учитывает заказы, измененные после отметки. lag (сек) — отступ от текущего времени:
+    транзакции, еще не закоммиченные к моменту запуска, попадут в следующий проход.
+    Возвращает число пересчитанных дней.
+    """
+    cutoff = timezone.now() - timedelta(seconds=lag)
+    mark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK, defaults={'value': EPOCH})
+    since = EPOCH if rebuild else mark.value
+
+    days = set(
+        Order.objects.filter(updated_at__gt=since, updated_at__lte=cutoff)
+        .annotate(day=TruncDate('created_at'))
+        .order_by()
+        .values_list('day', flat=True)
+        .distinct()
+    )
+    # Отметки удалений снимаются по id: отметка, добавленная во время пересчета, останется
+    dirty = dict(RollupDirtyDay.objects.values_list('id', 'day'))
+    days.update(dirty.values())
+    if rebuild:
+        days.update(ArchivedOrder.objects.annotate(day=TruncDate('created_at')).order_by()
+                    .values_list('day', flat=True).distinct())
+    if rebuild:
+        with transaction.atomic():
+            DailyStatusRollup.objects.all().delete()
+            DailyCourierRollup.objects.all().delete()
+    rebuild_days(days)
+    RollupDirtyDay.objects.filter(id__in=list(dirty)).delete()
+
+    mark.value = cutoff
+    mark.save(update_fields=['value'])
+    return len(days)
+
+
+def _on_order_deleted(sender, instance, **kwargs):
+    RollupDirtyDay.objects.create(day=timezone.localdate(instance.created_at))
+
+
+def connect_signals():
+    post_delete.connect(_on_order_deleted, sender=Order, dispatch_uid='rollups_order_delete')
+    post_delete.connect(_on_order_deleted, sender=ArchivedOrder, dispatch_uid='rollups_archived_delete')
+
+
+def get_watermark():
+    return RollupWatermark.objects.filter(name=WATERMARK).values_list('value', flat=True).first()
+
+
+def dashboard_data(days=30, top_couriers=20):
+    """Данные панели: по дням (статусы, выручка, средняя оценка) и лучшие курьеры за период"""
+    since = timezone.localdate() - timedelta(days=days - 1)
+
+    by_day = defaultdict(lambda: {'statuses': {}, 'orders': 0, 'revenue': 0, 'score_sum': 0, 'score_count': 0})
+    for row in DailyStatusRollup.objects.filter(day__gte=since):
+        item = by_day[row.day]
+        item['statuses'][row.status] = row.orders
+        item['orders'] += row.orders
+        if row.status in REVENUE_STATUSES:
+            item['revenue'] += row.revenue
+        item['score_sum'] += row.score_sum
+        item['score_count'] += row.score_count
+
+    # Колонки — статусы из STATUS_CHOICES и любые другие, встретившиеся в сводках
+    labels = dict(Order.STATUS_CHOICES)
+    seen = {status for item in by_day.values() for status in item['statuses']}
+    columns = list(labels) + sorted(seen - set(labels))
+
+    rows = []
+    for day in sorted(by_day, reverse=True):
+        item = by_day[day]
+        rows.append({
+            'day': day,
+            'orders': item['orders'],
+            'cells': [item['statuses'].get(status, 0) for status in columns],
+            'revenue': item['revenue'],
+            'avg_score': item['score_sum'] / item['score_count'] if item['score_count'] else None,
+        })
+
+    couriers = list(
+        DailyCourierRollup.objects.filter(day__gte=since)
+        .values('courier_id')
+        .annotate(orders=Sum('orders'), delivered=Sum('delivered'), revenue=Sum('revenue'))
+        .order_by('-orders')[:top_couriers]
+    )
+    return {
+        'since': since,
+        'columns': [labels.get(status, status) for status in columns],
+        'days': rows,
+        'couriers': couriers,
+        'watermark': get_watermark(),
+    }
@@ -0,0 +1,40 @@
+import re
+
+from django.db import connections
+from django.db.models import Q
+
+from .models import normalize_phone
+
+
+# Поиск заказов для админки на индексах из миграции 0006:
+# триграммные GIN по UPPER(адрес) и phone_normalized, полнотекстовый GIN по отзыву.
+
+PHONE_LIKE = re.compile(r'^[\d\s+()\-]+$')
+
+
+def is_supported(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def search_orders(queryset, term):
+    from django.contrib.postgres.search import SearchQuery, SearchVector
+
+    term = term.strip()
+    # «+», «-» или «()» без цифр — не номер: иначе startswith('') совпал бы со всеми заказами
+    digits = normalize_phone(term) if PHONE_LIKE.match(term) else ''
+    if digits:
+        condition = Q(phone_normalized__startswith=digits)
+        if len(digits) >= 3:
+            # Триграммам нужно хотя бы 3 символа
+            condition |= Q(phone_normalized__contains=digits)
+        if len(digits) <= 18:
+            condition |= Q(id=int(digits)) | Q(user_id=int(digits))
+        return queryset.filter(condition)
+
+    words = term.split()
+    address = Q()
+    for word in words:
+        address &= Q(from_address__icontains=word) | Q(to_address__icontains=word)
+    # Выражение совпадает с индексом order_feedback_fts_idx
+    queryset = queryset.alias(feedback_vector=SearchVector('client_feedback', config='simple'))
+    return queryset.filter(address | Q(feedback_vector=SearchQuery(term, config='simple')))
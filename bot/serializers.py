@@ -0,0 +1,36 @@
+from rest_framework import serializers
+
+from .models import Order
+
+
+class DynamicFieldsMixin:
+    """Позволяет выбрать поля ответа параметром ?fields=id,status,price"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = parse_fields_param(request, self.fields) if request is not None else None
+        if requested is not None:
+            for name in set(self.fields) - set(requested):
+                self.fields.pop(name)
+
+
+def parse_fields_param(request, available):
+    """Список запрошенных полей из ?fields=... или None, если параметр не указан"""
+    raw = request.query_params.get('fields')
+    if not raw:
+        return None
+    requested = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = set(requested) - set(available)
+    if unknown:
+        raise serializers.ValidationError({'fields': f"Неизвестные поля: {', '.join(sorted(unknown))}"})
+    return requested
+
+
+class OrderSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+
+    class Meta:
+        model = Order
+        fields = '__all__'
+        read_only_fields = ('created_at', 'updated_at')
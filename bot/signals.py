@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+
+# Отправляется после QuerySet.update() по заказам (post_save в этом случае не срабатывает).
+# Аргументы: pks — id заказов, попавших под фильтр (для filter(id=...) берутся из самого
+# фильтра, поэтому могут содержать несуществующие id), fields — имена обновленных полей.
+orders_updated = Signal()
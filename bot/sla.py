@@ -0,0 +1,72 @@
+import statistics
+from datetime import timedelta
+
+from django.db.models import Min, Q
+
+from .models import EVENT_PRICED, OrderEvent
+
+
+# Этапы заказа по журналу OrderEvent: (события начала, события конца).
+# Берется первое событие каждой группы, поэтому повторная запись того же статуса не влияет.
+# 'waiting_courier' ставит оплата наличными — заказ так же ждет курьера, как после 'paid'.
+STAGES = {
+    'time_to_price': (('pending',), (EVENT_PRICED,)),
+    'time_to_confirm': ((EVENT_PRICED,), ('confirmed',)),
+    'time_to_payment': (('confirmed',), ('paid', 'waiting_courier')),
+    'time_to_courier': (('paid', 'waiting_courier'), ('assigned',)),
+    'pickup': (('assigned',), ('in_progress',)),
+    'delivery': (('in_progress',), ('delivered',)),
+    'total': (('pending',), ('delivered', 'completed')),
+}
+
+
+def timeline(order_id):
+    """Список (статус, время) по заказу в порядке событий"""
+    return list(OrderEvent.objects.filter(order_id=order_id).order_by('ts', 'id').values_list('status', 'ts'))
+
+
+def stage_durations(stage, since=None, until=None):
+    """
+    Итератор (order_id, timedelta) для этапа stage.
+    since/until ограничивают время завершения этапа.
+    """
+    starts, ends = STAGES[stage]
+    finished = OrderEvent.objects.filter(status__in=ends)
+    if since is not None:
+        finished = finished.filter(ts__gte=since)
+    if until is not None:
+        finished = finished.filter(ts__lt=until)
+
+    rows = (
+        OrderEvent.objects
+        .filter(status__in=starts + ends, order_id__in=finished.values('order_id'))
+        .values('order_id')
+        .annotate(
+            started=Min('ts', filter=Q(status__in=starts)),
+            finished=Min('ts', filter=Q(status__in=ends)),
+        )
+        .filter(started__isnull=False)
+        .values_list('order_id', 'started', 'finished')
+    )
+    for order_id, started, finished_at in rows.iterator(chunk_size=2000):
+        if finished_at >= started:
+            yield order_id, finished_at - started
+
+
+def stage_stats(stage, since=None, until=None):
+    """Число заказов, среднее, медиана и 90-й перцентиль длительности этапа"""
+    seconds = sorted(duration.total_seconds() for _, duration in stage_durations(stage, since, until))
+    if not seconds:
+        return {'stage': stage, 'count': 0, 'mean': None, 'median': None, 'p90': None}
+    p90 = seconds[min(len(seconds) - 1, int(len(seconds) * 0.9))]
+    return {
+        'stage': stage,
+        'count': len(seconds),
+        'mean': timedelta(seconds=statistics.fmean(seconds)),
+        'median': timedelta(seconds=statistics.median(seconds)),
+        'p90': timedelta(seconds=p90),
+    }
+
+
+def sla_report(since=None, until=None):
+    return [stage_stats(stage, since, until) for stage in STAGES]
@@ -0,0 +1,175 @@
+import hashlib
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.utils.deconstruct import deconstructible
+
+
+# Хранилище медиа по содержимому: файл сохраняется как <каталог>/ab/cd/<sha256>.<ext>,
+# одинаковые фото хранятся один раз. Ссылки считаются в MediaBlob: файл удаляется,
+# когда удалена последняя ссылка. Старые имена (orders/order_1_2.jpg) продолжают читаться,
+# перенести их помогает команда migrate_media.
+
+CHUNK_SIZE = 64 * 1024
+
+
+def content_name(name, digest):
+    directory = os.path.dirname(name)
+    ext = os.path.splitext(name)[1].lower()
+    return os.path.join(directory, digest[:2], digest[2:4], f"{digest}{ext}")
+
+
+def is_content_name(name):
+    parts = name.split('/')
+    stem = os.path.splitext(parts[-1])[0]
+    return len(parts) >= 3 and len(stem) == 64 and parts[-3] == stem[:2] and parts[-2] == stem[2:4]
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage с именами по sha256 содержимого и подсчетом ссылок.
+    При async_writes=True запись на диск идет в фоновых потоках: имя известно сразу после
+    хеширования, а чтение того же файла в этом процессе дожидается окончания записи.
+    Кому нужна гарантия записи (например, перед удалением исходника), вызывает flush().
+    """
+
+    def __init__(self, *args, async_writes=True, write_workers=4, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.async_writes = async_writes
+        self.write_workers = write_workers
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    # Запись
+
+    def get_available_name(self, name, max_length=None):
+        # Имя все равно заменяется на хеш содержимого
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        data = bytearray()
+        content.seek(0)
+        for chunk in content.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+            data.extend(chunk)
+        name = content_name(name, digest.hexdigest())
+
+        # Первая ссылка — пишем всегда: файл на диске может как раз удаляться вместе
+        # с прежней последней ссылкой (см. delete)
+        if self._add_reference(name, len(data)) or not self.exists(name):
+            if self.async_writes:
+                with self._lock:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.write_workers, thread_name_prefix='media-writes'
+                        )
+                    if name not in self._pending:
+                        self._pending[name] = self._executor.submit(self._write, name, bytes(data))
+            else:
+                self._write(name, bytes(data))
+        return name
+
+    def _write(self, name, data):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Через временный файл и rename: параллельная запись того же содержимого безопасна
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(name, None)
+
+    def _wait(self, name):
+        future = self._pending.get(name)
+        if future is not None:
+            future.result()
+
+    def flush(self):
+        """Дожидается всех фоновых записей"""
+        with self._lock:
+            futures = list(self._pending.values())
+        for future in futures:
+            future.result()
+
+    # Чтение — с ожиданием незавершенной записи
+
+    def _open(self, name, mode='rb'):
+        self._wait(name)
+        return super()._open(name, mode)
+
+    def exists(self, name):
+        if name in self._pending:
+            return True
+        return super().exists(name)
+
+    def size(self, name):
+        self._wait(name)
+        return super().size(name)
+
+    # Ссылки
+
+    def _add_reference(self, name, size):
+        """Добавляет ссылку; True — ссылка первая (запись MediaBlob создана)"""
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            updated = MediaBlob.objects.filter(name=name).update(refs=F('refs') + 1)
+            if updated:
+                return False
+            _, created = MediaBlob.objects.get_or_create(name=name, defaults={'size': size, 'refs': 1})
+            if not created:
+                MediaBlob.objects.filter(name=name).update(refs=F('refs') + 1)
+            return created
+
+    def delete(self, name):
+        """Снимает одну ссылку; файл удаляется вместе с последней"""
+        from .models import MediaBlob
+
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.refs > 1:
+                MediaBlob.objects.filter(pk=blob.pk).update(refs=F('refs') - 1)
+                return
+            if blob is not None:
+                blob.delete()
+            # Файл удаляется, пока строка заблокирована: параллельное сохранение того же
+            # содержимого ждет коммита, создает запись заново и пишет файл сам
+            self._wait(name)
+            super().delete(name)
+
+
+def _release_files(sender, instance, **kwargs):
+    # Удаление заказа снимает ссылки на его фото и производные
+    for field in sender._meta.concrete_fields:
+        storage = getattr(field, 'storage', None)
+        name = getattr(instance, field.attname, None) if storage is not None else None
+        if name and isinstance(storage, ContentAddressedStorage):
+            transaction.on_commit(lambda storage=storage, name=str(name): storage.delete(name))
+
+
+def connect_signals():
+    from .models import ArchivedOrder, Order
+
+    post_delete.connect(_release_files, sender=Order, dispatch_uid='media_release_order')
+    post_delete.connect(_release_files, sender=ArchivedOrder, dispatch_uid='media_release_archived')
@@ -1,3 +1,404 @@
+import asyncio
+import io
+import math
+import os
+import random
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError
 from django.test import TestCase
+from django.utils import timezone
+from PIL import Image
+
+from .admin_pagination import CURSOR_VAR, decode_cursor, encode_cursor
+from .importer import RowError, clean_record, read_records, validated
+from .intake import IntakeQueue, IntakeWorker
+from .models import EVENT_PRICED, Order, OrderEvent, PriceClaim, transition_events
+from .persistence import create_orders
+from .pricing import apply_prices, claim_order, claim_orders, parse_price, parse_prices
+from .receipts import MultiIndexHash, ReceiptIndex, dhash, save_receipt, to_signed, to_unsigned
+from .signals import orders_updated
+
+
+def order_fields(**extra):
+    fields = dict(user_id=1, from_address='Рудаки 1', to_address='Айни 2',
+                  phone='+992 900 00 00 00', package_type='Документы')
+    fields.update(extra)
+    return fields
+
+
+def order_record(**extra):
+    """Запись очереди приема, как ее собирает бот"""
+    return order_fields(username='client', **extra)
+
+
+class IntakeQueueTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.queue = IntakeQueue(os.path.join(directory.name, 'intake.sqlite3'))
+        self.addCleanup(self.queue.close)
+
+    def test_fail_moves_record_to_dead_letters_after_max_attempts(self):
+        row_id = self.queue.put('order', {'n': 1})
+        self.assertFalse(self.queue.fail(row_id, 'ValueError: x', max_attempts=2))
+        self.assertEqual(self.queue.depth(), 1)
+        self.assertTrue(self.queue.fail(row_id, 'ValueError: x', max_attempts=2))
+        self.assertEqual(self.queue.depth(), 0)
+        self.assertEqual(self.queue.dead_count(), 1)
+        self.assertEqual(self.queue.peek(10), [])
+
+    def test_poison_record_does_not_block_the_batch(self):
+        saved = []
+
+        async def handler(payloads):
+            if any(payload.get('bad') for payload in payloads):
+                raise ValueError('плохая запись')
+            saved.extend(payload['n'] for payload in payloads)
+
+        for n in range(3):
+            self.queue.put('order', {'n': n, 'bad': n == 1})
+        worker = IntakeWorker(self.queue, {'order': handler}, max_attempts=2)
+
+        asyncio.run(worker.drain_once())
+        self.assertEqual(saved, [0, 2])
+        self.assertEqual(self.queue.depth(), 1)
+
+        asyncio.run(worker.drain_once())
+        self.assertEqual(saved, [0, 2])
+        self.assertEqual(self.queue.depth(), 0)
+        self.assertEqual(self.queue.dead_count(), 1)
+
+    def test_transient_error_keeps_the_batch_in_queue(self):
+        async def handler(payloads):
+            raise OperationalError('БД недоступна')
+
+        self.queue.put('order', {'n': 1})
+        worker = IntakeWorker(self.queue, {'order': handler}, max_attempts=1)
+        with self.assertRaises(OperationalError):
+            asyncio.run(worker.drain_once())
+        self.assertEqual(self.queue.depth(), 1)
+        self.assertEqual(self.queue.dead_count(), 0)
+
+
+class CreateOrdersTests(TestCase):
+    def test_replay_with_same_intake_key_returns_existing_order(self):
+        first = create_orders([order_record(intake_key='a' * 32)])
+        second = create_orders([order_record(intake_key='b' * 32), order_record(intake_key='a' * 32)])
+        self.assertEqual(second[1], first[0])
+        self.assertNotEqual(second[0], first[0])
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_records_without_key_are_always_created(self):
+        create_orders([order_record(), order_record()])
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class OrderUpdateTests(TestCase):
+    def setUp(self):
+        self.orders = [Order.objects.create(**order_fields(status='paid')) for _ in range(3)]
+        OrderEvent.objects.all().delete()
+        self.sent = []
+        orders_updated.connect(self.on_updated, sender=Order, dispatch_uid='tests_orders_updated')
+        self.addCleanup(orders_updated.disconnect, sender=Order, dispatch_uid='tests_orders_updated')
+
+    def on_updated(self, sender, pks, fields, **kwargs):
+        self.sent.append((sorted(pks), fields))
+
+    def events(self):
+        return sorted(OrderEvent.objects.values_list('order_id', 'status'))
+
+    def test_transition_events(self):
+        self.assertEqual(transition_events({'status': 'paid', 'price': 10}), ['paid', EVENT_PRICED])
+        self.assertEqual(transition_events({'price': None, 'courier_id': 5}), [])
+
+    def test_update_by_id_writes_event_and_signal(self):
+        order = self.orders[0]
+        self.assertEqual(Order.objects.filter(id=order.id).update(status='assigned'), 1)
+        self.assertEqual(self.events(), [(order.id, 'assigned')])
+        self.assertEqual(self.sent[0][0], [order.id])
+        self.assertIn('updated_at', self.sent[0][1])
+
+    def test_update_by_filter_journals_only_matched_rows(self):
+        Order.objects.filter(id=self.orders[0].id).update(status='cancelled')
+        OrderEvent.objects.all().delete()
+        self.sent.clear()
+        self.assertEqual(Order.objects.filter(status='paid').update(status='assigned', price=20), 2)
+        matched = sorted(order.id for order in self.orders[1:])
+        self.assertEqual(self.events(), sorted(
+            (order_id, status) for order_id in matched for status in ('assigned', EVENT_PRICED)
+        ))
+        self.assertEqual(self.sent[0][0], matched)
+
+    def test_update_without_transition_fields_writes_no_events(self):
+        Order.objects.filter(user_id=1).update(courier_message='у подъезда', phone='+992 (900) 11-22-33')
+        self.assertEqual(self.events(), [])
+        self.assertEqual(set(Order.objects.values_list('phone_normalized', flat=True)), {'992900112233'})
+
+    def test_update_of_missing_order_writes_no_events(self):
+        self.assertEqual(Order.objects.filter(id=0).update(status='assigned'), 0)
+        self.assertEqual(self.events(), [])
+
+    def test_save_journals_only_real_transitions(self):
+        order = Order.objects.get(id=self.orders[0].id)
+        order.save()
+        self.assertEqual(self.events(), [])
+        order.status = 'assigned'
+        order.save()
+        order.save(update_fields=['courier_message'])
+        self.assertEqual(self.events(), [(order.id, 'assigned')])
+
+    def test_create_journals_initial_status(self):
+        order = Order.objects.create(**order_fields())
+        self.assertEqual(list(OrderEvent.objects.filter(order_id=order.id).values_list('status', flat=True)),
+                         ['pending'])
+
+
+class PriceParsingTests(TestCase):
+    def test_parse_price(self):
+        self.assertEqual(parse_price(' 25 '), Decimal('25'))
+        self.assertEqual(parse_price('12,5'), Decimal('12.5'))
+        for text in ('0', '-5', 'nan', 'inf', '1e20', '12.345', '100000000', '', 'двадцать'):
+            self.assertIsNone(parse_price(text), text)
+
+    def test_parse_prices(self):
+        prices, errors = parse_prices('12:25 13 : 30,5;#14=40\n15:abc 16:nan 17:0')
+        self.assertEqual(prices, {12: Decimal('25'), 13: Decimal('30.5'), 14: Decimal('40')})
+        self.assertEqual(errors, ['15:abc', '16:nan', '17:0'])
+
+    def test_parse_prices_keeps_last_price_for_repeated_order(self):
+        self.assertEqual(parse_prices('12:25 12:30')[0], {12: Decimal('30')})
+
+
+class PricingQueueTests(TestCase):
+    def setUp(self):
+        self.orders = [Order.objects.create(**order_fields()) for _ in range(3)]
+        self.ids = [order.id for order in self.orders]
+
+    def claimed(self, operator_id, limit):
+        return [order['id'] for order in claim_orders(operator_id, limit)]
+
+    def test_operators_get_disjoint_orders(self):
+        self.assertEqual(self.claimed(1, 2), self.ids[:2])
+        self.assertEqual(self.claimed(2, 2), self.ids[2:])
+        # Повторный /queue возвращает те же заказы
+        self.assertEqual(self.claimed(1, 2), self.ids[:2])
+
+    def test_closed_orders_leave_the_queue(self):
+        self.claimed(1, 2)
+        Order.objects.filter(id=self.ids[0]).update(status='cancelled')
+        self.assertEqual(self.claimed(1, 2), self.ids[1:])
+        self.assertFalse(PriceClaim.objects.filter(order_id=self.ids[0]).exists())
+
+    def test_claim_order_reports_current_holder(self):
+        self.assertEqual(claim_order(1, self.ids[0]), 1)
+        self.assertEqual(claim_order(2, self.ids[0]), 1)
+
+    def test_apply_prices(self):
+        self.claimed(2, 1)
+        Order.objects.filter(id=self.ids[2]).update(status='cancelled')
+        applied, rejected = apply_prices(1, {
+            self.ids[0]: Decimal('25'), self.ids[1]: Decimal('30'), self.ids[2]: Decimal('40'), 0: Decimal('1')
+        })
+        self.assertEqual(applied, [(self.ids[1], 1, Decimal('30'))])
+        self.assertEqual(sorted(order_id for order_id, _ in rejected), sorted([0, self.ids[0], self.ids[2]]))
+        self.assertEqual(Order.objects.get(id=self.ids[1]).price, Decimal('30'))
+        self.assertIsNone(Order.objects.get(id=self.ids[0]).price)
+
+
+class ImporterTests(TestCase):
+    def rows(self, text, fmt='ndjson', max_errors=10):
+        errors = []
+        rows = list(validated(read_records(io.StringIO(text), fmt), errors, max_errors))
+        return rows, [(error.line, str(error)) for error in errors]
+
+    def test_clean_record_defaults(self):
+        values = clean_record(1, {**order_fields(), 'price': '25.50', 'created_at': '2024-01-02 10:00'})
+        self.assertEqual(values['price'], Decimal('25.50'))
+        self.assertEqual(values['status'], 'completed')
+        self.assertEqual(values['phone_normalized'], '992900000000')
+        self.assertEqual(values['updated_at'], values['created_at'])
+        self.assertIsNotNone(values['created_at'].tzinfo)
+
+    def test_clean_record_rejects_bad_rows(self):
+        for record in ({'user_id': 1}, {**order_fields(), 'color': 'red'},
+                       {**order_fields(), 'client_score': 7}, {**order_fields(), 'user_id': 'abc'}):
+            with self.assertRaises(RowError):
+                clean_record(1, record)
+
+    def test_malformed_ndjson_lines_are_row_errors(self):
+        good = '{"user_id": 1, "from_address": "a", "to_address": "b", "phone": "1", "package_type": "x"}'
+        rows, errors = self.rows(f'{good}\n{{bad\n\n[1, 2]\n"text"\n{good}\n')
+        self.assertEqual(len(rows), 2)
+        self.assertEqual([line for line, _ in errors], [2, 4, 5])
+
+    def test_max_errors_stops_the_import(self):
+        with self.assertRaises(RowError):
+            self.rows('{bad\n{bad\n', max_errors=1)
+
+    def test_ids_in_all_rows_or_none(self):
+        text = 'id,user_id,from_address,to_address,phone,package_type\n5,1,a,b,1,x\n,1,a,b,1,x\n'
+        rows, errors = self.rows(text, fmt='csv')
+        self.assertEqual([row['id'] for row in rows], [5])
+        self.assertEqual([line for line, _ in errors], [3])
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', encoding='utf-8', delete=False) as f:
+            f.write('{"user_id": 7, "from_address": "a", "to_address": "b", "phone": "1", "package_type": "x"}\n'
+                    '{bad\n')
+        self.addCleanup(os.remove, f.name)
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('import_orders', f.name, stdout=out, stderr=out)
+        self.assertFalse(Order.objects.filter(user_id=7).exists())
+        call_command('import_orders', f.name, '--max-errors', '1', stdout=out, stderr=out)
+        self.assertEqual(Order.objects.filter(user_id=7, status='completed').count(), 1)
+
+
+def receipt_png(size=(120, 80), mirrored=False, fmt='PNG'):
+    """Гладкая картинка, не зависящая от размера: пересжатая копия дает близкий dHash"""
+    width, height = size
+    image = Image.new('L', size)
+    image.putdata([
+        int(127 + 120 * math.sin(5 * (1 - x / width if mirrored else x / width)) * math.cos(3 * y / height))
+        for y in range(height) for x in range(width)
+    ])
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+class MultiIndexHashTests(TestCase):
+    def test_finds_neighbours_within_max_distance(self):
+        index = MultiIndexHash(max_distance=6)
+        key = 0x0123456789ABCDEF
+        index.add(key, 'same')
+        index.add(key ^ 0b111, 'close')           # 3 бита
+        index.add(key ^ (0b1111111 << 20), 'far')  # 7 бит
+        # 6 бит, по одному в каждом блоке и еще два: хотя бы один блок совпадает почти точно
+        index.add(key ^ (1 | 1 << 16 | 1 << 32 | 1 << 48 | 1 << 49 | 1 << 50), 'spread')
+        self.assertEqual(index.search(key), [(0, 'same'), (3, 'close'), (6, 'spread')])
+
+    def test_matches_brute_force(self):
+        rng = random.Random(1)
+        index = MultiIndexHash(max_distance=8)
+        keys = [rng.getrandbits(64) for _ in range(300)]
+        base = keys[0]
+        keys += [base ^ sum(1 << bit for bit in rng.sample(range(64), n)) for n in range(12)]
+        for i, key in enumerate(keys):
+            index.add(key, i)
+        expected = sorted(((key ^ base).bit_count(), i) for i, key in enumerate(keys) if (key ^ base).bit_count() <= 8)
+        self.assertEqual(sorted(index.search(base)), expected)
+
+    def test_signed_roundtrip(self):
+        for value in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+            self.assertEqual(to_unsigned(to_signed(value)), value)
+            self.assertTrue(-(1 << 63) <= to_signed(value) < 1 << 63)
+
+
+class ReceiptIndexTests(TestCase):
+    def test_dhash_is_stable_under_rescaling(self):
+        original = dhash(receipt_png())
+        resized = dhash(receipt_png(size=(360, 240), fmt='JPEG'))
+        other = dhash(receipt_png(mirrored=True))
+        self.assertLessEqual((original ^ resized).bit_count(), 6)
+        self.assertGreater((original ^ other).bit_count(), 6)
+
+    def test_find_reports_other_orders_only(self):
+        value = dhash(receipt_png())
+        save_receipt(value, 'file-1', order_id=1, user_id=10)
+        save_receipt(value ^ 0b11, '', order_id=2, user_id=20)
+        save_receipt(None, 'file-3', order_id=3, user_id=30)
+        index = ReceiptIndex(max_distance=6)
+        self.assertEqual(index.load(), 2)
+
+        found = index.find(value, 'file-3', order_id=1)
+        self.assertEqual([(distance, ref.order_id) for distance, ref in found], [(None, 3), (2, 2)])
+        self.assertEqual(index.find(None, 'file-9', order_id=4), [])
+
+
+class OrderApiTests(TestCase):
+    def setUp(self):
+        # Счетчик версий сбрасывается после коммита, а TestCase не коммитит
+        cache.clear()
+        now = timezone.now()
+        # Несколько заказов с одинаковым created_at: порядок между ними задает id
+        self.orders = [
+            Order.objects.create(**order_fields(created_at=now - timedelta(minutes=i // 2),
+                                                status='paid' if i % 3 == 0 else 'pending'))
+            for i in range(7)
+        ]
+        self.staff = User.objects.create_user('operator', password='x', is_staff=True)
+
+    def get(self, url, **params):
+        return self.client.get(url, params, HTTP_ACCEPT='application/json')
+
+    def test_requires_staff(self):
+        self.assertEqual(self.get('/api/orders/').status_code, 403)
+
+    def test_cursor_pages_cover_all_orders_once(self):
+        self.client.force_login(self.staff)
+        seen, url, params = [], '/api/orders/', {'page_size': 3}
+        while url:
+            data = self.get(url, **params).json()
+            seen.extend(item['id'] for item in data['results'])
+            url, params = data['next'], {}
+        expected = [order.id for order in sorted(self.orders, key=lambda o: (o.created_at, o.id), reverse=True)]
+        self.assertEqual(seen, expected)
+
+    def test_filters(self):
+        self.client.force_login(self.staff)
+        data = self.get('/api/orders/', status='paid').json()
+        self.assertEqual({item['id'] for item in data['results']},
+                         {order.id for order in self.orders if order.status == 'paid'})
+        self.assertEqual(self.get('/api/orders/', status='lost').status_code, 400)
+        self.assertEqual(self.get('/api/orders/', created_after='вчера').status_code, 400)
+
+
+class AdminKeysetTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.orders = [
+            Order.objects.create(**order_fields(created_at=now - timedelta(minutes=i // 3))) for i in range(45)
+        ]
+        self.expected = [order.id for order in sorted(self.orders, key=lambda o: (o.created_at, o.id), reverse=True)]
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+
+    def changelist(self, query=''):
+        response = self.client.get(f'/admin/bot/order/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_cursor_roundtrip(self):
+        order = self.orders[0]
+        self.assertEqual(decode_cursor(encode_cursor('after', order)), ('after', order.created_at, order.pk))
+        for value in ('', 'мусор', encode_cursor('after', order)[:-4], 'c2lkZXw='):
+            self.assertIsNone(decode_cursor(value))
+
+    def test_pages_forward_and_back(self):
+        pages, cl = [], self.changelist()
+        self.assertIsNone(cl.prev_cursor_url)
+        while True:
+            pages.append([order.id for order in cl.result_list])
+            if cl.next_cursor_url is None:
+                break
+            cl = self.changelist(cl.next_cursor_url)
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual(sum(pages, []), self.expected)
+
+        back = self.changelist(cl.prev_cursor_url)
+        self.assertEqual([order.id for order in back.result_list], pages[1])
+        self.assertIsNotNone(back.next_cursor_url)
+
+    def test_sorting_by_column_uses_regular_pages(self):
+        cl = self.changelist('?o=1')
+        self.assertFalse(cl.keyset_mode)
 
-# Create your tests here.
+    def test_bad_cursor_shows_first_page(self):
+        cl = self.changelist(f'?{CURSOR_VAR}=мусор')
+        self.assertEqual([order.id for order in cl.result_list], self.expected[:20])
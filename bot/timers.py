@@ -0,0 +1,137 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+
+# Таймеры в процессе бота: куча по времени срабатывания. Отмена — O(1): таймер помечается
+# отмененным и убирается из словаря, а из кучи выбрасывается, когда доходит до вершины.
+# Когда отмененных становится больше половины, куча пересобирается.
+
+class Timer:
+    __slots__ = ('when', 'key', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, key, callback, args):
+        self.when = when
+        self.key = key
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+class TimerQueue:
+    """
+    Таймеры по ключу (ключ — кортеж, первый элемент — id заказа). Повторная постановка
+    с тем же ключом заменяет таймер. callback — корутина, вызывается отдельной задачей.
+    Время — unix time (time.time()), чтобы сроки можно было считать от меток времени в БД.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._timers = {}
+        self._by_order = {}
+        self._counter = itertools.count()
+        self._cancelled = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._running = set()
+
+    def __len__(self):
+        return len(self._timers)
+
+    def __contains__(self, key):
+        return key in self._timers
+
+    def schedule(self, key, when, callback, *args):
+        self.cancel(key)
+        timer = Timer(when, key, callback, args)
+        self._timers[key] = timer
+        self._by_order.setdefault(key[0], set()).add(key)
+        heapq.heappush(self._heap, (when, next(self._counter), timer))
+        # Новый таймер раньше всех остальных — цикл должен проснуться раньше
+        if self._heap[0][2] is timer:
+            self._wakeup.set()
+        return timer
+
+    def cancel(self, key):
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        timer.cancelled = True
+        self._cancelled += 1
+        keys = self._by_order.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_order[key[0]]
+        return True
+
+    def cancel_order(self, order_id):
+        """Отменяет все таймеры заказа"""
+        for key in list(self._by_order.get(order_id, ())):
+            self.cancel(key)
+
+    def _compact(self):
+        if self._cancelled > 64 and self._cancelled > len(self._heap) // 2:
+            self._heap = [item for item in self._heap if not item[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+    def pop_due(self, now=None):
+        """Снимает с кучи наступившие таймеры"""
+        now = time.time() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, timer = heapq.heappop(self._heap)
+            if timer.cancelled:
+                self._cancelled -= 1
+                continue
+            del self._timers[timer.key]
+            keys = self._by_order.get(timer.key[0])
+            if keys is not None:
+                keys.discard(timer.key)
+                if not keys:
+                    del self._by_order[timer.key[0]]
+            due.append(timer)
+        self._compact()
+        return due
+
+    def next_deadline(self):
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+        return self._heap[0][0] if self._heap else None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        while True:
+            for timer in self.pop_due():
+                task = asyncio.create_task(self._fire(timer))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            deadline = self.next_deadline()
+            self._wakeup.clear()
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, timer):
+        try:
+            await timer.callback(*timer.args)
+        except Exception as e:
+            print(f"Ошибка в таймере {timer.key}: {e}")
@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import OrderViewSet
+from .views import OrderViewSet, OrderExportView
 
 router = DefaultRouter()
 router.register(r'orders', OrderViewSet)
 
 urlpatterns = [
+    # До роутера, иначе 'export' будет принят за id заказа
+    path('api/orders/export/', OrderExportView.as_view(), name='orders-export'),
     path('api/', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,11 +1,146 @@
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework import viewsets
-from .models import Order
-from .serializers import OrderSerializer
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+from .models import ArchivedOrder, Order
+from .serializers import OrderSerializer, parse_fields_param
+from .filters import OrderFilterBackend
+from .pagination import OrderCursorPagination
+from .renderers import ORJSONRenderer
+from .fastpath import get_plan, plan_columns, serialize_row, serialize_rows
+from .api_cache import ConditionalCacheMixin
+from .export import CONTENT_TYPES, FORMATS, export_filename, stream_export
 
-class OrderViewSet(viewsets.ModelViewSet):
+
+def get_order_renderer_classes():
+    # ORDERS_API_JSON_RENDERER = 'orjson' | 'default'
+    if getattr(settings, 'ORDERS_API_JSON_RENDERER', 'default') == 'orjson':
+        return [ORJSONRenderer, BrowsableAPIRenderer]
+    return api_settings.DEFAULT_RENDERER_CLASSES
+
+
+def archive_mode(request):
+    """?archived=1 — только архив закрытых заказов, ?archived=all — заказы вместе с архивом"""
+    value = request.query_params.get('archived')
+    if value in ('1', 'true', 'only'):
+        return 'only'
+    if value == 'all':
+        return 'all'
+    return None
+
+
+def wants_archive(request):
+    return archive_mode(request) == 'only'
+
+
+class OrderFastReadMixin:
+    """Быстрый путь чтения: values() + план сериализации вместо ModelSerializer"""
+
+    def _fast_read_enabled(self):
+        return getattr(settings, 'ORDERS_API_FAST_READ', True)
+
+    def _fast_plan(self):
+        requested = parse_fields_param(self.request, self.get_serializer_class()().fields)
+        return get_plan(frozenset(requested) if requested is not None else None)
+
+    def list(self, request, *args, **kwargs):
+        if not self._fast_read_enabled():
+            return super().list(request, *args, **kwargs)
+
+        plan = self._fast_plan()
+        # id и created_at нужны курсорной пагинации
+        model = ArchivedOrder if wants_archive(request) else Order
+        rows = self.filter_queryset(model.objects.all()).values('id', 'created_at', *plan_columns(plan))
+        page = self.paginate_queryset(rows)
+        data = serialize_rows(plan, page if page is not None else rows, request.build_absolute_uri)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self._fast_read_enabled():
+            return super().retrieve(request, *args, **kwargs)
+
+        plan = self._fast_plan()
+        try:
+            pk = int(kwargs['pk'])
+        except ValueError:
+            raise Http404
+        # Закрытый заказ мог уже уйти в архив
+        columns = plan_columns(plan)
+        row = Order.objects.filter(pk=pk).values(*columns).first()
+        if row is None:
+            row = ArchivedOrder.objects.filter(pk=pk).values(*columns).first()
+        if row is None:
+            raise Http404
+        return Response(serialize_row(plan, row, request.build_absolute_uri))
+
+
+class OrderViewSet(ConditionalCacheMixin, OrderFastReadMixin, viewsets.ModelViewSet):
+    # В заказах телефоны и адреса клиентов — только для персонала
+    permission_classes = [IsAdminUser]
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    filter_backends = [OrderFilterBackend]
+    pagination_class = OrderCursorPagination
+    renderer_classes = get_order_renderer_classes()
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method == 'GET' and self.action == 'list' and wants_archive(self.request):
+            queryset = ArchivedOrder.objects.all()
+        # При ?fields=... читаем из БД только нужные столбцы (плюс ключи пагинации)
+        requested = parse_fields_param(self.request, self.get_serializer_class()().fields)
+        if requested is not None and self.request.method == 'GET':
+            model_fields = {f.name for f in Order._meta.concrete_fields}
+            columns = {name for name in requested if name in model_fields}
+            if 'status_display' in requested:
+                columns.add('status')
+            queryset = queryset.only('id', 'created_at', *columns)
+        return queryset
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.request.method != 'GET':
+                raise
+        # Архивные заказы доступны только для чтения
+        try:
+            return ArchivedOrder.objects.get(pk=int(self.kwargs['pk']))
+        except (ValueError, ArchivedOrder.DoesNotExist):
+            raise Http404
+
+
+class OrderExportView(APIView):
+    """
+    Потоковая выгрузка заказов: /api/orders/export/?type=csv|ndjson&gzip=1
+    Поддерживает те же фильтры, что и список (status, user_id, courier_id, created_after, created_before)
+    и ?archived=1 (только архив) или ?archived=all (рабочая таблица и архив вместе, по created_at).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        fmt = request.query_params.get('type', 'csv')
+        if fmt not in FORMATS:
+            raise ValidationError({'type': f"Ожидается один из форматов: {', '.join(FORMATS)}"})
+        gzip = request.query_params.get('gzip') in ('1', 'true')
+
+        models = {'only': (ArchivedOrder,), 'all': (Order, ArchivedOrder)}.get(archive_mode(request), (Order,))
+        querysets = [OrderFilterBackend().filter_queryset(request, model.objects.all(), self) for model in models]
+        response = StreamingHttpResponse(
+            stream_export(querysets, fmt, gzip),
+            content_type='application/gzip' if gzip else CONTENT_TYPES[fmt]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{export_filename(fmt, gzip)}"'
+        return response
+
 
 from django.contrib.admin.views.decorators import staff_member_required
 
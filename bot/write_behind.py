@@ -0,0 +1,93 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+
+from zudrasonbot.bot.persistence import apply_order_updates
+
+
+class WriteBehindBuffer:
+    """
+    Буфер отложенной записи второстепенных полей заказа.
+    Несколько изменений одного заказа сливаются в одно и сохраняются через bulk_update
+    по таймеру или при накоплении max_orders заказов.
+    """
+
+    FIELDS = frozenset({'client_score', 'client_feedback', 'courier_message', 'delivery_message'})
+
+    def __init__(self, max_orders=100, interval=2.0, spill=None):
+        self.max_orders = max_orders
+        self.interval = interval
+        # spill(batch) — куда отдать пачку, если БД недоступна (например, в очередь приема)
+        self.spill = spill
+        self.flushed = 0
+        self._pending = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def set(self, order_id: int, **fields) -> None:
+        unknown = set(fields) - self.FIELDS
+        if unknown:
+            raise ValueError(f"Поля {', '.join(sorted(unknown))} нельзя записывать отложенно")
+        self._pending.setdefault(order_id, {}).update(fields)
+        if len(self._pending) >= self.max_orders:
+            self._wakeup.set()
+
+    def get(self, order_id: int, field: str, default=None):
+        """Еще не сохраненное значение поля (чтение собственных записей)"""
+        return self._pending.get(order_id, {}).get(field, default)
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        try:
+            count = await sync_to_async(apply_order_updates)(batch)
+        except Exception as e:
+            print(f"Не удалось сохранить отложенные изменения ({len(batch)} заказов): {e}")
+            try:
+                if self.spill is None:
+                    raise
+                await self.spill(batch)
+            except Exception:
+                self._restore(batch)
+                raise
+            return 0
+        self.flushed += count
+        return count
+
+    def _restore(self, batch):
+        # Более новые значения, пришедшие во время сохранения, не перезаписываем
+        for order_id, fields in batch.items():
+            merged = dict(fields)
+            merged.update(self._pending.get(order_id, {}))
+            self._pending[order_id] = merged
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Ошибка при сбросе буфера отложенной записи: {e}")
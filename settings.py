@@ -43,6 +43,111 @@ ALLOWED_HOSTS = [
 MEDIA_ROOT = os.path.join(BASE_DIR, 'orders')
 MEDIA_URL = '/media/'
 
+# Медиафайлы: 'cas' — хранилище по содержимому (ab/cd/<sha256>) с дедупликацией, 'filesystem' — обычное
+MEDIA_STORAGE = os.getenv('MEDIA_STORAGE', 'cas')
+STORAGES = {
+    'default': {
+        'BACKEND': (
+            'zudrasonbot.bot.storage.ContentAddressedStorage' if MEDIA_STORAGE == 'cas'
+            else 'django.core.files.storage.FileSystemStorage'
+        ),
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Локальная очередь приема (SQLite WAL) между Telegram и основной БД
+INTAKE_QUEUE_PATH = os.getenv('INTAKE_QUEUE_PATH', os.path.join(BASE_DIR, 'var', 'intake.sqlite3'))
+INTAKE_SPOOL_DIR = os.getenv('INTAKE_SPOOL_DIR', os.path.join(BASE_DIR, 'var', 'intake_photos'))
+INTAKE_SOFT_LIMIT = int(os.getenv('INTAKE_SOFT_LIMIT', 200))   # после этого клиента предупреждаем о задержке
+INTAKE_HARD_LIMIT = int(os.getenv('INTAKE_HARD_LIMIT', 5000))  # после этого новые заказы не принимаются
+INTAKE_BATCH_SIZE = int(os.getenv('INTAKE_BATCH_SIZE', 100))
+INTAKE_MAX_ATTEMPTS = int(os.getenv('INTAKE_MAX_ATTEMPTS', 5))  # после этого запись уходит в intake_dead
+
+# Отложенная запись второстепенных полей заказа (оценка, отзыв, сообщения курьера)
+WRITE_BEHIND_MAX_ORDERS = int(os.getenv('WRITE_BEHIND_MAX_ORDERS', 100))
+WRITE_BEHIND_INTERVAL = float(os.getenv('WRITE_BEHIND_INTERVAL', 2.0))
+
+# Кэш снимков заказов в процессе бота. Изменения из админки (другой процесс) сбрасывают
+# его только по TTL, поэтому TTL короткий
+ORDER_CACHE_SIZE = int(os.getenv('ORDER_CACHE_SIZE', 1024))
+ORDER_CACHE_TTL = float(os.getenv('ORDER_CACHE_TTL', 60))
+
+# API заказов: быстрый путь чтения через values() и JSON-рендерер ('orjson' или 'default')
+ORDERS_API_FAST_READ = os.getenv('ORDERS_API_FAST_READ', 'True') == 'True'
+ORDERS_API_JSON_RENDERER = os.getenv('ORDERS_API_JSON_RENDERER', 'orjson')
+
+# Группы Telegram: операторы и курьеры
+OPERATOR_GROUP_ID = int(os.getenv('OPERATOR_GROUP_ID', -1002665268326))
+COURIER_GROUP_ID = int(os.getenv('COURIER_GROUP_ID', -1002648695686))
+
+# Отправка уведомлений из очереди: сообщений в секунду всего, интервал в один чат и в группу (сек)
+NOTIFY_RATE = float(os.getenv('NOTIFY_RATE', 25))
+NOTIFY_CHAT_INTERVAL = float(os.getenv('NOTIFY_CHAT_INTERVAL', 1.0))
+NOTIFY_GROUP_INTERVAL = float(os.getenv('NOTIFY_GROUP_INTERVAL', 3.0))
+NOTIFY_BATCH_SIZE = int(os.getenv('NOTIFY_BATCH_SIZE', 100))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', 5))
+
+# Защита от флуда: сообщений в секунду на пользователя и запас подряд, во сколько раз
+# дороже фото/документ, окно (сек), в котором одинаковые сообщения считаются одним,
+# и как часто (сек) предупреждать пользователя
+FLOOD_RATE = float(os.getenv('FLOOD_RATE', 1.0))
+FLOOD_BURST = float(os.getenv('FLOOD_BURST', 5))
+FLOOD_MEDIA_COST = float(os.getenv('FLOOD_MEDIA_COST', 2))
+FLOOD_DEDUPE_WINDOW = float(os.getenv('FLOOD_DEDUPE_WINDOW', 3))
+FLOOD_NOTICE_INTERVAL = float(os.getenv('FLOOD_NOTICE_INTERVAL', 30))
+
+# Массовая рассылка клиентам (manage.py broadcast): сообщений в секунду. Ниже общего
+# лимита Telegram (~30/с), чтобы у работающего бота оставался запас
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 20))
+
+# Очередь оценки заказов: сколько заказов выдает /queue по умолчанию и максимум,
+# на сколько секунд заказ закрепляется за оператором
+PRICING_QUEUE_DEFAULT = int(os.getenv('PRICING_QUEUE_DEFAULT', 5))
+PRICING_QUEUE_MAX = int(os.getenv('PRICING_QUEUE_MAX', 20))
+PRICING_CLAIM_TTL = int(os.getenv('PRICING_CLAIM_TTL', 600))
+
+# Справочник улиц и ориентиров города для геокодирования (CSV: name,lat,lon,aliases),
+# размер ячейки пространственного индекса (км) и период его перестроения (сек)
+GAZETTEER_PATH = os.getenv('GAZETTEER_PATH', os.path.join(BASE_DIR, 'var', 'gazetteer.csv'))
+GEO_CELL_KM = float(os.getenv('GEO_CELL_KM', 0.5))
+GEO_INDEX_INTERVAL = float(os.getenv('GEO_INDEX_INTERVAL', 30))
+
+# Распределение заказов: сколько курьеров в волне предложений, максимум активных заказов
+# у курьера, время на ответ (сек), число волн до публикации в группе, сколько считать
+# местоположение курьера актуальным (сек) и период сверки с БД (сек)
+DISPATCH_SHORTLIST = int(os.getenv('DISPATCH_SHORTLIST', 3))
+DISPATCH_MAX_ACTIVE = int(os.getenv('DISPATCH_MAX_ACTIVE', 2))
+DISPATCH_OFFER_TIMEOUT = float(os.getenv('DISPATCH_OFFER_TIMEOUT', 60))
+DISPATCH_WAVES = int(os.getenv('DISPATCH_WAVES', 2))
+DISPATCH_LOCATION_TTL = float(os.getenv('DISPATCH_LOCATION_TTL', 1800))
+DISPATCH_SYNC_INTERVAL = float(os.getenv('DISPATCH_SYNC_INTERVAL', 60))
+
+# Напоминания по зависшим заказам (сек после последнего изменения заказа): без цены —
+# операторам, оплачен без курьера — повторное предложение курьерам, доставлен без
+# подтверждения — клиенту; сколько раз повторять
+SLA_PRICE_AFTER = float(os.getenv('SLA_PRICE_AFTER', 300))
+SLA_COURIER_AFTER = float(os.getenv('SLA_COURIER_AFTER', 600))
+SLA_CONFIRM_AFTER = float(os.getenv('SLA_CONFIRM_AFTER', 3600))
+SLA_REMINDER_REPEATS = int(os.getenv('SLA_REMINDER_REPEATS', 3))
+
+# Подсказка цены по истории: за сколько дней брать заказы, минимум похожих заказов,
+# шаг округления (сомони) и период обновления таблицы (сек)
+PRICE_SUGGEST_DAYS = int(os.getenv('PRICE_SUGGEST_DAYS', 180))
+PRICE_SUGGEST_MIN_ORDERS = int(os.getenv('PRICE_SUGGEST_MIN_ORDERS', 3))
+PRICE_SUGGEST_STEP = os.getenv('PRICE_SUGGEST_STEP', '1')
+PRICE_SUGGEST_INTERVAL = float(os.getenv('PRICE_SUGGEST_INTERVAL', 60))
+
+# Чеки: расстояние Хэмминга между dHash, при котором чек считается возможным повтором
+RECEIPT_HASH_DISTANCE = int(os.getenv('RECEIPT_HASH_DISTANCE', 6))
+
+# Процессов для построения миниатюр и WebP-копий фото
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Админка: с какого числа строк показывать оценку планировщика вместо точного COUNT(*)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000))
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -56,6 +161,11 @@ INSTALLED_APPS = [
     'zudrasonbot.bot',
 ]
 
+# API закрыт по умолчанию: представления без явных permission_classes доступны только персоналу
+REST_FRAMEWORK = {
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAdminUser'],
+}
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -110,6 +220,23 @@ DATABASES = {
     }
 }
 
+# Кэш: счетчик изменений заказов и ответы API. Бот и веб работают в разных процессах,
+# поэтому в продакшене нужен общий Redis (REDIS_URL); LocMemCache — только для разработки
+# (при DEBUG=False без REDIS_URL проверка bot.E001 не даст запустить проект).
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 